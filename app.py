@@ -1,15 +1,33 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+import asyncio
+import json
 import os
+import time
+from typing import List, Optional
+from contextlib import nullcontext
+from pydantic import BaseModel
 
 # User-defined modules
-from scrap.scrap import scrape_press_release
-from translate.translate import translate
+from pipeline import text_to_video, start_job, cancel_job, running_jobs
+from batch import submit_batch, batch_progress, cancel_batch
+from scheduler import admit, stats, Overloaded
+import jobs
+import metrics
+import response_cache
+import tracing
+from database import job_queue
+from database.db import ensure_indexes, flush_writes
+from utils import tgt_langs
+from http_client import close_client
+from image.capture_iframe import close_browser
+from video.serve import file_response, versioned_url
 from logger import log_info, log_warning, log_error, log_success, log_generator
 
+# Seconds between checks that the client of a running job is still connected
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "1"))
+
 # FastAPI app setup
 app = FastAPI(
     title="PIB Press Releases Scraper",
@@ -26,11 +44,67 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Path to your output folder
-output_folder_path = os.path.join(os.getcwd(), "output")
 
-# Expose output folder to be accessed through the URL "/output"
-app.mount("/output", StaticFiles(directory=output_folder_path), name="output")
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Refuse new work while a resource queue is full"""
+    log_warning(str(exc))
+    return JSONResponse(status_code=429, content={"detail": str(exc)}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.on_event("startup")
+async def startup():
+    """Create missing database indexes"""
+    ensure_indexes()
+    if jobs.queue_mode():
+        job_queue.ensure_job_indexes()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Write buffered database updates, release pooled HTTP connections and the tweet capture browser"""
+    await flush_writes()
+    await close_client()
+    await close_browser()
+
+def traced_job(url: str, trace: bool, profile: bool):
+    """Trace of a job if requested, otherwise a context yielding None"""
+    if trace or profile:
+        return tracing.trace("text_to_video", profile=profile, url=url)
+    return nullcontext()
+
+async def cancel_on_disconnect(request: Request, task: asyncio.Task):
+    """Result of a job task, cancelling the job if the client disconnects first"""
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not task.done() and await request.is_disconnected():
+                log_warning("Client disconnected, cancelling its job")
+                task.cancel()
+                # Let the job clean up before the handler returns
+                await asyncio.wait({task})
+    except asyncio.CancelledError:
+        # The handler itself is cancelled (server shutdown): nobody awaits the job anymore
+        task.cancel()
+        raise
+    if task.cancelled():
+        raise HTTPException(status_code=409, detail="Job cancelled")
+    return task.result()
+
+async def with_video_urls(result):
+    """Copies of per-language results with content-pinned video URLs"""
+    return [
+        {**item, "video_url": await versioned_url(item["video"]) if item.get("video") else None}
+        for item in result
+    ]
+
+async def queue_release(url: str, refresh: bool):
+    """Queue mode: the completed result if there is one, else the job queued for the workers"""
+    if not refresh:
+        output = await asyncio.to_thread(jobs.completed_result, url)
+        if output is not None:
+            return output, None
+    await asyncio.to_thread(job_queue.admit)
+    job = await asyncio.to_thread(jobs.enqueue_release, url, refresh)
+    return None, job
 
 @app.get("/", tags=["Root"])
 def root():
@@ -40,14 +114,24 @@ def root():
 
 @app.get("/text-to-video", tags=["Text to Video"])
 async def text_to_video_endpoint(
-    url: str = Query(..., description="The URL of the press release to convert into a multi-lingual video")
+    request: Request,
+    url: str = Query(..., description="The URL of the press release to convert into a multi-lingual video"),
+    job_id: Optional[str] = Query(None, description="ID to abort the job with at POST /jobs/{job_id}/cancel"),
+    refresh: bool = Query(False, description="Re-fetch the release and regenerate what changed since it was scraped"),
+    trace: bool = Query(False, description="Record a trace of the job, exported at /traces/{trace_id}"),
+    profile: bool = Query(False, description="Attach sampling profiles to the CPU-bound spans of the trace")
 ):
     """
     Convert a PIB press release into a multilingual video by:
     1. Scraping the press release content
     2. Translating it into multiple languages
     3. Streaming logs in real-time
+
+    The job is cancelled if the client disconnects before it completes.
     """
+    if not jobs.queue_mode() and (refresh or response_cache.get(url) is None):
+        # Cached results cost nothing, so they are served even while overloaded
+        admit()
     try:
         if not url:
             log_warning("Empty URL provided")
@@ -59,47 +143,234 @@ async def text_to_video_endpoint(
 
         log_info(f"Processing request for URL: {url}")
 
-        # Scrape the press release
-        press_release = await scrape_press_release(url)
+        job_trace = None
+        if job_id in running_jobs:
+            raise HTTPException(status_code=409, detail=f"Job {job_id} is already running")
+        if jobs.queue_mode():
+            output, job = await queue_release(url, refresh)
+            if job is not None:
+                # Workers run the pipeline, poll the job for its progress
+                return JSONResponse(status_code=202, content={
+                    "message": "Queued", "job_id": job["_id"], "status": job["status"], "status_url": f"/jobs/{job['_id']}",
+                })
+        else:
+            async def run():
+                # The trace starts inside the job's task, so the task's context carries it
+                with traced_job(url, trace, profile) as job_trace:
+                    return job_trace, await text_to_video(url, refresh=refresh)
+
+            job_id, task = start_job(run(), job_id)
+            job_trace, output = await cancel_on_disconnect(request, task)
+        # Content-pinned URLs, cacheable forever by browsers and CDNs. Items are
+        # copied since completed results are shared with the response cache.
+        result = await with_video_urls(output["result"])
+
+        log_success(f"Text to Video Processing completed for: {result}")
+
+        response = {"message": "Success","id":output["_id"],"result":result}  # Placeholder for now
+        if job_trace is not None:
+            response.update(trace_id=job_trace.id, trace_url=f"/traces/{job_trace.id}")
+        return response
+
+    except (HTTPException, Overloaded):
+        raise
+    except Exception as e:
+        log_error(f"Text to Video Processing failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        _id = press_release["_id"]
-        title = press_release["translations"]["english"]["title"]
-        summary = press_release["translations"]["english"]["summary"]
-        content = press_release["translations"]["english"]["content"]
-        ministry = press_release["translations"]["english"]["ministry"]
-        video = press_release["translations"]["english"]["video"]
-        images = press_release["images"]
 
-        log_success(f"Scraped press release titled: {title}")
+@app.get("/text-to-video/stream", tags=["Text to Video"])
+async def text_to_video_stream(
+    url: str = Query(..., description="The URL of the press release to convert into a multi-lingual video"),
+    refresh: bool = Query(False, description="Re-fetch the release and regenerate what changed since it was scraped"),
+    trace: bool = Query(False, description="Record a trace of the job, exported at /traces/{trace_id}"),
+    profile: bool = Query(False, description="Attach sampling profiles to the CPU-bound spans of the trace")
+):
+    """
+    Same as /text-to-video, but streams Server-Sent Events as the work progresses:
+    a `job` event with the ID to abort it with, a `stage` event per English stage,
+    a `language` event (with `video_url`) as English and each translation land,
+    then `done` with the full result, `error` or `cancelled`. Closing the stream
+    cancels the job.
+    """
+    if not url.startswith("https://pib.gov.in"):
+        log_warning(f"Invalid URL domain: {url}")
+        raise HTTPException(status_code=400, detail="Invalid URL domain")
 
-        # Translate the content
-        log_info(f"Starting translation for Press Release titled: {title}")
+    if jobs.queue_mode():
+        return await stream_queued_release(url, refresh)
 
-        result = await translate(
-            _id=_id,
-            images=images,
-            title=title,
-            summary=summary,
-            content=content,
-            ministry=ministry
-        )
+    if refresh or response_cache.get(url) is None:
+        admit()
+    events = asyncio.Queue()
+    start = time.perf_counter()
+    job_traces = []
 
-        result.append(
-            {
-                "lang": 'english',
-                "video": video,
-            }
-        )
-        log_success(f"Translation completed for: {title}");
+    async def run():
+        # The trace starts inside the task, so the task's context carries it
+        with traced_job(url, trace, profile) as job_trace:
+            job_traces.append(job_trace)
+            return await text_to_video(url, refresh=refresh, on_event=events.put_nowait)
 
+    job_id, task = start_job(run())
+    task.add_done_callback(lambda _: events.put_nowait(None))
+    events.put_nowait({"event": "job", "id": job_id, "status": "running"})
 
-        log_success(f"Text to Video Processing completed for: {result}")
+    async def event_stream():
+        try:
+            while (event := await events.get()) is not None:
+                if event.get("video"):
+                    event["video_url"] = await versioned_url(event["video"])
+                event["elapsed"] = round(time.perf_counter() - start, 2)
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            if not task.done():
+                # The client closed the stream
+                log_warning(f"Client disconnected, cancelling job {job_id}")
+                task.cancel()
 
-        return {"message": "Success","id":_id,"result":result}  # Placeholder for now
+        if task.cancelled():
+            done = {"event": "cancelled", "id": job_id}
+        else:
+            try:
+                output = task.result()
+                done = {"event": "done", "id": output["_id"], "result": output["result"]}
+                if job_traces and job_traces[0] is not None:
+                    done.update(trace_id=job_traces[0].id, trace_url=f"/traces/{job_traces[0].id}")
+            except Exception as e:
+                log_error(f"Text to Video Processing failed: {str(e)}")
+                done = {"event": "error", "detail": str(e)}
+        done["elapsed"] = round(time.perf_counter() - start, 2)
+        yield f"event: {done['event']}\ndata: {json.dumps(done, default=str)}\n\n"
 
-    except Exception as e:
-        log_error(f"Text to Video Processing failed: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+async def stream_queued_release(url: str, refresh: bool):
+    """Queue mode of /text-to-video/stream: `job` and `language` events as the workers progress"""
+    output, job = await queue_release(url, refresh)
+    start = time.perf_counter()
+
+    async def event_stream():
+        if job is not None:
+            async for event in jobs.follow_job(job["_id"]):
+                if event.get("video"):
+                    event["video_url"] = await versioned_url(event["video"])
+                event["elapsed"] = round(time.perf_counter() - start, 2)
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+        if output is not None:
+            done = {"event": "done", "id": output["_id"], "result": await with_video_urls(output["result"])}
+        else:
+            progress = await asyncio.to_thread(jobs.job_progress, job["_id"])
+            if progress["status"] == "failed":
+                done = {"event": "error", "job_id": job["_id"], "detail": progress["error"]}
+            else:
+                result = [{"lang": lang, **language} for lang, language in progress["languages"].items()]
+                done = {"event": "done", "id": progress["release_id"], "job_id": job["_id"], "result": await with_video_urls(result)}
+        done["elapsed"] = round(time.perf_counter() - start, 2)
+        yield f"event: {done['event']}\ndata: {json.dumps(done, default=str)}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/jobs/{job_id}/cancel", tags=["Text to Video"])
+async def cancel_job_endpoint(job_id: str):
+    """Abort a job: its stages stop, partial files are removed and its statuses become 'cancelled'"""
+    if jobs.queue_mode():
+        cancelled = await asyncio.to_thread(job_queue.cancel, job_id) > 0
+    else:
+        cancelled = cancel_job(job_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="No running job with this ID")
+    return {"id": job_id, "status": "cancelled"}
+
+
+@app.get("/jobs/{job_id}", tags=["Text to Video"])
+async def get_job(job_id: str):
+    """Status of a queued release and of each of its languages (queue mode)"""
+    progress = await asyncio.to_thread(jobs.job_progress, job_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    for language in progress["languages"].values():
+        language["video_url"] = await versioned_url(language["video"]) if language.get("video") else None
+    return progress
+
+
+class BatchRequest(BaseModel):
+    urls: List[str]
+    languages: Optional[List[str]] = None
+    refresh: bool = False
+
+
+@app.post("/batch", tags=["Batch"])
+async def create_batch(request: BatchRequest):
+    """
+    Queue many press releases (optionally only some languages) on the shared
+    scheduler and return a batch ID to poll for aggregate progress.
+    """
+    if not request.urls:
+        raise HTTPException(status_code=400, detail="URLs are required")
+
+    invalid_urls = [url for url in request.urls if not url.startswith("https://pib.gov.in")]
+    if invalid_urls:
+        log_warning(f"Invalid URL domain: {invalid_urls}")
+        raise HTTPException(status_code=400, detail=f"Invalid URL domain: {invalid_urls}")
+
+    languages = request.languages or list(tgt_langs)
+    unknown = [lang for lang in languages if lang not in tgt_langs]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown languages: {unknown}")
+
+    if jobs.queue_mode():
+        job_queue.admit(jobs=len(set(request.urls)))
+    else:
+        admit(releases=len(set(request.urls)))
+    return submit_batch(request.urls, languages, refresh=request.refresh)
+
+
+@app.get("/batch/{batch_id}", tags=["Batch"])
+async def get_batch(batch_id: str):
+    """Aggregate and per-release progress of a batch"""
+    progress = batch_progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return progress
+
+
+@app.post("/batch/{batch_id}/cancel", tags=["Batch"])
+async def cancel_batch_endpoint(batch_id: str):
+    """Abort the releases of a batch that are still running"""
+    if not cancel_batch(batch_id):
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch_progress(batch_id)
+
+
+@app.get("/scheduler/stats", tags=["Scheduler"])
+async def scheduler_stats():
+    """Concurrency, queue depth and wait times per resource class"""
+    return stats()
+
+
+@app.get("/metrics", tags=["Metrics"], response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Stage durations, cache hits, retries, failures and queue depth in the Prometheus format"""
+    return PlainTextResponse(metrics.exposition(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/traces/{trace_id}", tags=["Metrics"])
+async def get_trace(trace_id: str):
+    """Trace of a job in the Chrome trace-event format, for chrome://tracing or ui.perfetto.dev"""
+    job_trace = tracing.get_trace(trace_id)
+    if job_trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return tracing.chrome_trace(job_trace)
+
+
+@app.api_route("/output/{file_path:path}", methods=["GET", "HEAD"], tags=["Output"])
+async def output_file(request: Request, file_path: str):
+    """Serve rendered videos, subtitles and HLS playlists with Range and ETag support"""
+    return await file_response(request, file_path)
 
 
 @app.get("/stream-logs", tags=["Logs"])
@@ -107,5 +378,7 @@ async def stream_logs():
     return StreamingResponse(log_generator(), media_type="text/plain")
 
 if __name__ == "__main__":
+    import uvicorn
+
     log_info("🚀 Starting FastAPI application")
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,331 @@
+"""
+Content-addressed store of generated artifacts (images, narration, subtitles, renders).
+
+Every file is stored once under its SHA-256, in `ARTIFACT_STORE_DIR`, and
+release folders get hardlinks to it (a copy where the filesystem refuses
+links). The same image used by many releases, or a narration identical across
+re-scrapes, takes disk space once.
+
+Producers look artifacts up by an input key, a hash of everything the output
+depends on (see `input_key`), before doing any work. A SQLite manifest shared
+by every process of the host records blobs, input keys, release links and last
+use. A blob no release folder links to is unreferenced, and is evicted least
+recently used first, in a background thread, whenever the store grows past
+`ARTIFACT_QUOTA_GB`, or by:
+
+    python -m artifacts gc [--all] [--dry-run]
+    python -m artifacts stats
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# User defined modules
+from logger import log_info, log_warning, log_success
+
+# Inside output/ so release folders and blobs share a filesystem and can be hardlinked
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", os.path.join("output", ".store"))
+# Disk quota of the store in GB, 0 for no limit
+ARTIFACT_QUOTA_GB = float(os.getenv("ARTIFACT_QUOTA_GB", "0"))
+# Artifacts used more recently than this are never evicted (e.g. images of a running render)
+ARTIFACT_GC_GRACE = int(os.getenv("ARTIFACT_GC_GRACE", "3600"))
+
+_lock = threading.Lock()
+_state = {"connection": None, "copy_warned": False, "gc_thread": None}
+# path -> (size, mtime_ns, sha256), of the most recently hashed release files and assets
+_digests = OrderedDict()
+DIGEST_CACHE_SIZE = 1024
+
+
+def _db():
+    if _state["connection"] is None:
+        os.makedirs(os.path.join(ARTIFACT_STORE_DIR, "tmp"), exist_ok=True)
+        connection = sqlite3.connect(os.path.join(ARTIFACT_STORE_DIR, "manifest.sqlite"),
+                                     check_same_thread=False, isolation_level=None, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(
+            "CREATE TABLE IF NOT EXISTS blobs "
+            "(hash TEXT PRIMARY KEY, path TEXT, size INTEGER, created_at REAL, last_used REAL);"
+            "CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);"
+            "CREATE TABLE IF NOT EXISTS keys (key TEXT PRIMARY KEY, hash TEXT);"
+            "CREATE INDEX IF NOT EXISTS keys_hash ON keys (hash);"
+            "CREATE TABLE IF NOT EXISTS links (path TEXT PRIMARY KEY, hash TEXT, linked_at REAL);"
+        )
+        _state["connection"] = connection
+    return _state["connection"]
+
+
+def input_key(*parts) -> str:
+    """
+    Hash of everything an artifact is generated from.
+
+    Args:
+        *parts: JSON-serializable inputs, e.g. ("tts", backend, voice, text).
+
+    Returns:
+        str: Hex SHA-256.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def file_digest(path: str, memoize: bool = True) -> str:
+    """
+    SHA-256 of a file.
+
+    Args:
+        path (str): File to hash.
+        memoize (bool): Remember the digest until the file changes; off for
+            files hashed once, such as the scratch files passed to `store`.
+    """
+    stat = os.stat(path)
+    with _lock:
+        cached = _digests.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            _digests.move_to_end(path)
+            return cached[2]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    if memoize:
+        with _lock:
+            _digests[path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+            _digests.move_to_end(path)
+            while len(_digests) > DIGEST_CACHE_SIZE:
+                _digests.popitem(last=False)
+    return digest.hexdigest()
+
+
+def keyed_path(path: str, key: str) -> str:
+    """Release file named after its input key: 'output/<title>/hindi.mp4' -> 'output/<title>/hindi-<key>.mp4'."""
+    base, extension = os.path.splitext(path)
+    # A path that is already keyed (e.g. a stored release's video) gets its key replaced
+    base = re.sub(r"-[0-9a-f]{12}$", "", base)
+    return f"{base}-{key[:12]}{extension}"
+
+
+def temp_path(extension: str) -> str:
+    """Scratch file inside the store, to be passed to `store` once written."""
+    _db()
+    return os.path.join(ARTIFACT_STORE_DIR, "tmp", f"{uuid.uuid4().hex}{extension}")
+
+
+def lookup(key: str):
+    """
+    Stored artifact generated from an input key.
+
+    Returns:
+        str: Path of the blob, or None if it was never stored or was evicted.
+    """
+    with _lock:
+        db = _db()
+        row = db.execute(
+            "SELECT blobs.hash, blobs.path FROM keys JOIN blobs ON blobs.hash = keys.hash WHERE keys.key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        if not os.path.exists(row[1]):
+            _forget(db, row[0])
+            return None
+        db.execute("UPDATE blobs SET last_used = ? WHERE hash = ?", (time.time(), row[0]))
+        return row[1]
+
+
+def store(path: str, key: str = None) -> str:
+    """
+    Move a generated file into the store.
+
+    Args:
+        path (str): File to store; it is moved, or deleted if the same content
+            is already stored.
+        key (str): Input key the file was generated from, for `lookup`.
+
+    Returns:
+        str: Path of the blob.
+    """
+    digest = file_digest(path, memoize=False)
+    extension = os.path.splitext(path)[1]
+    blob_path = os.path.join(ARTIFACT_STORE_DIR, digest[:2], f"{digest}{extension}")
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    if os.path.exists(blob_path):
+        os.remove(path)
+    else:
+        os.replace(path, blob_path)
+
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT INTO blobs (hash, path, size, created_at, last_used) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (hash) DO UPDATE SET last_used = excluded.last_used",
+            (digest, blob_path, os.path.getsize(blob_path), now, now),
+        )
+        if key is not None:
+            db.execute("INSERT OR REPLACE INTO keys (key, hash) VALUES (?, ?)", (key, digest))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    if ARTIFACT_QUOTA_GB and total > ARTIFACT_QUOTA_GB * 1024 ** 3:
+        _gc_in_background()
+    return blob_path
+
+
+def _gc_in_background():
+    """Evict down to the quota in a daemon thread, one collection at a time."""
+    with _lock:
+        thread = _state["gc_thread"]
+        if thread is not None and thread.is_alive():
+            return
+        thread = _state["gc_thread"] = threading.Thread(target=gc, name="artifact-gc", daemon=True)
+    thread.start()
+
+
+def link(blob_path: str, path: str) -> str:
+    """
+    Make a release file point at a stored blob.
+
+    A hardlink shares the blob's disk space; where the filesystem refuses
+    hardlinks the blob is copied. An existing file at `path` is replaced
+    atomically.
+
+    Args:
+        blob_path (str): Path returned by `store` or `lookup`.
+        path (str): Release file, e.g. 'output/<title>/hindi-<key>.mp3'.
+
+    Returns:
+        str: `path`.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if not (os.path.exists(path) and os.path.samefile(path, blob_path)):
+        partial_path = f"{path}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            os.link(blob_path, partial_path)
+        except OSError as e:
+            if not _state["copy_warned"]:
+                log_warning(f"Hardlinks unavailable ({e}), copying artifacts instead")
+                _state["copy_warned"] = True
+            shutil.copyfile(blob_path, partial_path)
+        os.replace(partial_path, path)
+
+    digest = os.path.splitext(os.path.basename(blob_path))[0]
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute("INSERT OR REPLACE INTO links (path, hash, linked_at) VALUES (?, ?, ?)", (path, digest, now))
+        db.execute("UPDATE blobs SET last_used = ? WHERE hash = ?", (now, digest))
+    return path
+
+
+def _forget(db, digest):
+    db.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+    db.execute("DELETE FROM keys WHERE hash = ?", (digest,))
+
+
+def gc(quota_bytes: int = None, grace: int = ARTIFACT_GC_GRACE, dry_run: bool = False):
+    """
+    Evict unreferenced artifacts, least recently used first.
+
+    Args:
+        quota_bytes (int): Evict until the store fits in this many bytes;
+            `ARTIFACT_QUOTA_GB` by default. 0 evicts every unreferenced artifact.
+        grace (int): Skip artifacts used in the last `grace` seconds.
+        dry_run (bool): Only report what would be evicted.
+
+    Returns:
+        dict: Blob count and bytes before collection, evicted count and bytes,
+        and whether the store is still over its quota.
+    """
+    if quota_bytes is None:
+        quota_bytes = int(ARTIFACT_QUOTA_GB * 1024 ** 3)
+    now = time.time()
+
+    with _lock:
+        db = _db()
+        # Links whose release file was deleted or replaced no longer reference their blob
+        for path, digest in db.execute("SELECT path, hash FROM links").fetchall():
+            row = db.execute("SELECT path FROM blobs WHERE hash = ?", (digest,)).fetchone()
+            if row is None or not os.path.exists(path) or not os.path.exists(row[0]) or not os.path.samefile(path, row[0]):
+                if not dry_run:
+                    db.execute("DELETE FROM links WHERE path = ?", (path,))
+
+        blobs = db.execute("SELECT hash, path, size, last_used FROM blobs ORDER BY last_used").fetchall()
+        total = sum(size for _, _, size, _ in blobs)
+        report = {"blobs": len(blobs), "bytes": total, "evicted": 0, "freed": 0}
+
+        for digest, blob_path, size, last_used in blobs:
+            if quota_bytes and total <= quota_bytes:
+                break
+            if not os.path.exists(blob_path):
+                if not dry_run:
+                    _forget(db, digest)
+                total -= size
+                continue
+            if last_used > now - grace or os.stat(blob_path).st_nlink > 1:
+                continue
+            if not dry_run:
+                os.remove(blob_path)
+                _forget(db, digest)
+            total -= size
+            report["evicted"] += 1
+            report["freed"] += size
+
+        # Scratch files of renders that crashed
+        tmp_dir = os.path.join(ARTIFACT_STORE_DIR, "tmp")
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            if os.path.getmtime(path) < now - max(grace, 86400) and not dry_run:
+                os.remove(path)
+
+    report["over_quota"] = bool(quota_bytes) and total > quota_bytes
+    if report["over_quota"]:
+        log_warning(f"Artifact store holds {total / 1024 ** 3:.2f} GB of referenced artifacts, over its quota")
+    if report["evicted"]:
+        log_success(f"{'Would evict' if dry_run else 'Evicted'} {report['evicted']} artifacts ({report['freed'] / 1024 ** 2:.1f} MB)")
+    return report
+
+
+def stats():
+    """Blob count and size of the store, split by referenced and unreferenced."""
+    with _lock:
+        db = _db()
+        blobs = db.execute("SELECT path, size FROM blobs").fetchall()
+        links = db.execute("SELECT COUNT(*) FROM links").fetchone()[0]
+    referenced = [size for path, size in blobs if os.path.exists(path) and os.stat(path).st_nlink > 1]
+    return {
+        "blobs": len(blobs),
+        "bytes": sum(size for _, size in blobs),
+        "referenced_blobs": len(referenced),
+        "referenced_bytes": sum(referenced),
+        "links": links,
+        "quota_bytes": int(ARTIFACT_QUOTA_GB * 1024 ** 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the content-addressed artifact store")
+    commands = parser.add_subparsers(dest="command", required=True)
+    collect = commands.add_parser("gc", help="Evict unreferenced artifacts, least recently used first")
+    collect.add_argument("--all", action="store_true", help="Evict every unreferenced artifact, not only down to the quota")
+    collect.add_argument("--grace", type=int, default=ARTIFACT_GC_GRACE, help="Keep artifacts used in the last N seconds")
+    collect.add_argument("--dry-run", action="store_true")
+    commands.add_parser("stats", help="Show the size of the store")
+    args = parser.parse_args()
+
+    if args.command == "gc":
+        report = gc(0 if args.all else None, grace=args.grace, dry_run=args.dry_run)
+        log_info(json.dumps(report))
+    else:
+        log_info(json.dumps(stats()))
+
+
+if __name__ == "__main__":
+    main()
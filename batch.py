@@ -0,0 +1,153 @@
+import asyncio
+import time
+import uuid
+
+# User defined modules
+from pipeline import text_to_video
+from scheduler import new_priority
+import jobs
+from logger import log_info, log_error, log_success, bind_log_context
+
+# Finished batches kept for progress queries
+MAX_FINISHED_BATCHES = 100
+
+batches = {}
+
+
+def submit_batch(urls, languages, refresh: bool = False):
+    """
+    Queue many press releases at once on the global scheduler.
+
+    Releases are prioritized in submission order: the first URL of a batch
+    gets its slots before the second, and every release of an earlier batch
+    before those of a later one.
+
+    Args:
+        urls (list): Press release URLs, duplicates are ignored.
+        languages (list): Target languages for every release.
+        refresh (bool): Re-fetch already scraped releases.
+
+    Returns:
+        dict: Batch progress (see `batch_progress`).
+    """
+    urls = list(dict.fromkeys(urls))
+    if jobs.queue_mode():
+        # Workers run the releases, progress is read back from the job queue
+        batch_id = uuid.uuid4().hex[:12]
+        jobs.submit_queued_batch(batch_id, urls, languages, refresh)
+        log_info(f"Batch {batch_id} queued {len(urls)} releases in {len(languages)} languages")
+        return jobs.queued_batch_progress(batch_id)
+
+    submitted_at = time.monotonic()
+    batch = {
+        "id": uuid.uuid4().hex[:12],
+        "created_at": time.time(),
+        "languages": languages,
+        "refresh": refresh,
+        # English plus every target language, per release
+        "total": len(urls) * (1 + len(languages)),
+        "completed": 0,
+        "failed": 0,
+        "cancelled": 0,
+        "releases": {url: {"status": "queued", "stage": None, "languages": {}} for url in urls},
+        "tasks": [],
+    }
+    batches[batch["id"]] = batch
+
+    for url in urls:
+        task = asyncio.create_task(run_release(batch, url, new_priority(submitted_at)))
+        batch["tasks"].append(task)
+
+    log_info(f"Batch {batch['id']} queued {len(urls)} releases in {len(languages)} languages")
+    _prune_batches()
+    return batch_progress(batch["id"])
+
+
+async def run_release(batch, url, job_priority):
+    bind_log_context(job_id=batch["id"], url=url)
+    release = batch["releases"][url]
+
+    def on_event(event):
+        release["status"] = "running"
+        if event["event"] == "stage":
+            release["stage"] = event["stage"]
+        elif event["event"] == "language":
+            release["languages"][event["lang"]] = {
+                "status": event["status"],
+                "video": event.get("video"),
+                "seconds": event.get("seconds"),
+            }
+            batch[event["status"] if event["status"] in ("completed", "cancelled") else "failed"] += 1
+
+    try:
+        output = await text_to_video(url, refresh=batch["refresh"], on_event=on_event,
+                                     languages=batch["languages"], job_priority=job_priority)
+        release.update(status="completed", id=output["_id"])
+    except asyncio.CancelledError:
+        batch["cancelled"] += 1 + len(batch["languages"]) - len(release["languages"])
+        release.update(status="cancelled")
+        _finish_if_done(batch)
+        raise
+    except Exception as e:
+        log_error(f"Batch {batch['id']} failed for {url}: {e}")
+        # Nothing more will be reported for this release
+        batch["failed"] += 1 + len(batch["languages"]) - len(release["languages"])
+        release.update(status="failed", error=str(e))
+
+    _finish_if_done(batch)
+
+
+def _finish_if_done(batch):
+    if all(r["status"] in ("completed", "failed", "cancelled") for r in batch["releases"].values()):
+        batch["finished_at"] = time.time()
+        log_success(f"Batch {batch['id']} finished: {batch['completed']}/{batch['total']} completed")
+
+
+def cancel_batch(batch_id: str) -> bool:
+    """
+    Cancel the releases of a batch that are still running.
+
+    Returns:
+        bool: False if the batch is unknown.
+    """
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jobs.cancel_queued_batch(batch_id) if jobs.queue_mode() else False
+    log_info(f"Cancelling batch {batch_id}")
+    for task in batch["tasks"]:
+        task.cancel()
+    return True
+
+
+def batch_progress(batch_id: str):
+    """
+    Aggregate progress of a batch.
+
+    Returns:
+        dict: Counts of completed, failed and pending videos, the overall
+        percentage and the status of every release, or None if unknown.
+    """
+    batch = batches.get(batch_id)
+    if batch is None:
+        return jobs.queued_batch_progress(batch_id) if jobs.queue_mode() else None
+
+    done = batch["completed"] + batch["failed"] + batch["cancelled"]
+    return {
+        "id": batch["id"],
+        "status": "finished" if "finished_at" in batch else "running",
+        "languages": batch["languages"],
+        "total": batch["total"],
+        "completed": batch["completed"],
+        "failed": batch["failed"],
+        "cancelled": batch["cancelled"],
+        "pending": batch["total"] - done,
+        "progress": round(100 * done / batch["total"], 1) if batch["total"] else 100.0,
+        "elapsed": round(batch.get("finished_at", time.time()) - batch["created_at"], 1),
+        "releases": batch["releases"],
+    }
+
+
+def _prune_batches():
+    finished = [batch_id for batch_id, batch in batches.items() if "finished_at" in batch]
+    for batch_id in finished[:max(len(finished) - MAX_FINISHED_BATCHES, 0)]:
+        del batches[batch_id]
@@ -0,0 +1,96 @@
+"""
+Check that the API and worker processes start fast.
+
+Imports each entry point in a fresh interpreter with `python -X importtime`
+and exits non-zero if one takes longer than the budget, or if it imports a
+heavy dependency (torch, moviepy, openai, playwright, ...) that should only
+be loaded on first use. The slowest imports are listed to find the culprit.
+
+Usage:
+    python benchmark_startup.py
+    python benchmark_startup.py --budget-ms 500 --top 20
+    python benchmark_startup.py app worker scrap.backfill
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Import time of an entry point, in milliseconds
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "800"))
+ENTRY_POINTS = ("app", "worker")
+# Loaded by the stages that need them, never at startup
+DEFERRED_MODULES = (
+    "torch", "transformers", "IndicTransToolkit", "moviepy", "pysrt", "PIL", "numpy",
+    "imageio_ffmpeg", "openai", "playwright", "edge_tts", "piper", "googleapiclient",
+)
+
+LINE_PATTERN = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module: str):
+    """
+    Import a module in a new interpreter.
+
+    Returns:
+        dict: Wall-clock seconds of the process, cumulative import
+        milliseconds of the module and (self ms, cumulative ms, name) of every
+        module it imported.
+    """
+    started = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+
+    imports = []
+    cumulative_ms = None
+    for line in process.stderr.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        imports.append((int(self_us) / 1000, int(cumulative_us) / 1000, name))
+        if name == module and not indent:
+            cumulative_ms = int(cumulative_us) / 1000
+    return {"wall": wall, "import_ms": cumulative_ms, "imports": imports}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=list(ENTRY_POINTS), help="Modules to import (default: app worker)")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports listed per module")
+    args = parser.parse_args()
+
+    failures = []
+    for module in args.modules:
+        try:
+            result = measure(module)
+        except RuntimeError as e:
+            failures.append(f"{module}: import failed: {e}")
+            continue
+
+        print(f"{module}: {result['import_ms']:.0f} ms import, {result['wall'] * 1000:.0f} ms process start (budget {args.budget_ms:.0f} ms)")
+        for self_ms, cumulative_ms, name in sorted(result["imports"], key=lambda item: item[0], reverse=True)[:args.top]:
+            print(f"  {self_ms:8.1f} ms self {cumulative_ms:8.1f} ms total  {name}")
+
+        if result["import_ms"] > args.budget_ms:
+            failures.append(f"{module}: {result['import_ms']:.0f} ms import is over the {args.budget_ms:.0f} ms budget")
+        loaded = sorted({name.split(".")[0] for _, _, name in result["imports"]} & set(DEFERRED_MODULES))
+        if loaded:
+            failures.append(f"{module}: imports {', '.join(loaded)} at startup")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark press release lookups with and without indexes and projections.
+
+Fills a scratch database (`pib_benchmark` by default, never `pib`) with
+synthetic releases shaped like real ones, then times the queries of
+database/db.py before and after `ensure_indexes`, and reports the BSON bytes
+each lookup returns.
+
+Usage:
+    python -m database.benchmark_db --docs 100000 --lookups 500
+"""
+import argparse
+import os
+import random
+import statistics
+import time
+
+import bson
+import pymongo
+from dotenv import load_dotenv
+
+# User defined modules
+from database.db import RELEASE_PROJECTION
+from utils import tgt_langs
+
+load_dotenv()
+
+WORDS = ("ministry scheme minister india government launched development farmers education "
+         "digital infrastructure national health rural women youth states crore programme").split()
+
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def synthetic_release(rng, index, content_words):
+    translation = lambda: {
+        "title": paragraph(rng, 12),
+        "summary": paragraph(rng, content_words // 4),
+        "content": paragraph(rng, content_words),
+        "ministry": "Ministry of Rural Development",
+        "audio": f"output/release_{index}/lang.mp3",
+        "subtitle": f"output/release_{index}/lang.srt",
+        "video": f"output/release_{index}/lang.mp4",
+        "status": "completed",
+    }
+    return {
+        "url": f"https://pib.gov.in/PressReleasePage.aspx?PRID={2000000 + index}",
+        "images": [f"https://static.pib.gov.in/image_{index}_{i}.jpg" for i in range(6)],
+        "stages": ["extract", "summary", "tts", "images", "render"],
+        "translations": {"english": translation(), **{lang: translation() for lang in tgt_langs}},
+    }
+
+
+def populate(collection, docs, content_words, batch_size=1000):
+    rng = random.Random(0)
+    collection.drop()
+    for start in range(0, docs, batch_size):
+        collection.insert_many([
+            synthetic_release(rng, i, content_words) for i in range(start, min(start + batch_size, docs))
+        ])
+
+
+def measure(label, lookups, query):
+    timings, sizes = [], []
+    for args in lookups:
+        started = time.perf_counter()
+        document = query(*args)
+        timings.append((time.perf_counter() - started) * 1000)
+        sizes.append(len(bson.encode(document)) if document else 0)
+    print(f"{label:<44} {statistics.median(timings):>9.2f} {max(timings):>9.2f} {statistics.mean(sizes):>12,.0f}")
+
+
+def run(collection, lookups):
+    urls = [(doc["url"],) for doc in lookups]
+    ids = [(doc["_id"], random.choice(list(tgt_langs))) for doc in lookups]
+    titles = [(doc["translations"]["english"]["title"],) for doc in lookups]
+
+    measure("url: full document", urls, lambda url: collection.find_one({"url": url}))
+    measure("url: RELEASE_PROJECTION", urls, lambda url: collection.find_one({"url": url}, RELEASE_PROJECTION))
+    measure("translation: full document", ids, lambda _id, lang: collection.find_one(
+        {"_id": _id, f"translations.{lang}": {"$exists": True}}))
+    measure("translation: one language", ids, lambda _id, lang: collection.find_one(
+        {"_id": _id, f"translations.{lang}.status": "completed"}, {f"translations.{lang}": 1, "_id": 0}))
+    measure("english title", titles, lambda title: collection.find_one(
+        {"translations.english.title": title}, {"url": 1, "translations.english.title": 1}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--scan-lookups", type=int, default=20, help="Lookups without indexes (full scans)")
+    parser.add_argument("--content-words", type=int, default=150, help="Words of content per language")
+    parser.add_argument("--database", default="pib_benchmark")
+    parser.add_argument("--keep", action="store_true", help="Reuse an already populated collection")
+    args = parser.parse_args()
+
+    if args.database == "pib":
+        parser.error("refusing to benchmark on the production database")
+
+    collection = pymongo.MongoClient(os.getenv("MONGO_URI"))[args.database]["press_releases"]
+    if not args.keep or collection.estimated_document_count() < args.docs:
+        print(f"Inserting {args.docs:,} synthetic releases...")
+        populate(collection, args.docs, args.content_words)
+
+    sample = list(collection.aggregate([{"$sample": {"size": args.lookups}}, {"$project": {
+        "url": 1, "translations.english.title": 1}}]))
+
+    print(f"\n{'query':<44} {'p50 (ms)':>9} {'max (ms)':>9} {'bytes/lookup':>12}")
+    collection.drop_indexes()
+    print("-- without indexes")
+    run(collection, sample[:args.scan_lookups])
+
+    # Same indexes as database.db.ensure_indexes
+    collection.create_index("url", unique=True)
+    collection.create_index("translations.english.title")
+    collection.create_index([("translations.english.status", 1), ("checked_at", 1)])
+    print("-- with indexes")
+    run(collection, sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,46 +1,187 @@
 import pymongo
 import os
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 from bson import ObjectId
 from logger import log_info, log_warning, log_error, log_success
+from utils import tgt_langs
+from database.write_behind import WriteBehind
+import response_cache
 
 load_dotenv()
 
+# Translated content and summaries are only needed when a single language is
+# returned; everything else (stages, media paths, statuses) is small.
+RELEASE_PROJECTION = {
+    f"translations.{lang}.{field}": 0 for lang in tgt_langs for field in ("content", "summary")
+}
+
+_client = {"client": None}
+
 def connect_to_db():
     """
     Connect to MongoDB database.
 
+    The client (and its connection pool) is created once per process and
+    shared by every call.
+
     Returns:
         pymongo.collection.Collection: MongoDB collection object.
     """
     try:
-        client = pymongo.MongoClient(os.getenv("MONGO_URI"))
-        db = client['pib']
-        log_success("Connected to database.")
-        return db['press_releases']
-    except pymongo.errors.ConnectionError as e:
+        if _client["client"] is None:
+            _client["client"] = pymongo.MongoClient(os.getenv("MONGO_URI"))
+            log_success("Connected to database.")
+        return _client["client"]['pib']['press_releases']
+    except pymongo.errors.ConnectionFailure as e:
         log_error(f"Database connection failed: {e}")
         return None
 
-def is_url_scraped(url):
+# Translation status and result updates, coalesced per release (see database/write_behind.py)
+release_writes = WriteBehind(lambda: connect_to_db())
+
+async def flush_writes():
+    """Write every buffered update, e.g. before shutting down."""
+    await release_writes.flush(force=True)
+
+def ensure_indexes():
+    """
+    Create the indexes the queries in this module rely on. Idempotent, run at startup.
+
+    - press_releases.url: unique, every lookup by URL and the upsert key
+    - press_releases.translations.english.title: `release_exist_with_title`
+    - press_releases.(translations.english.status, checked_at): freshness sweeps
+    - leases.expires_at: removes leases an hour after they expired
+    """
+    collection = connect_to_db()
+    try:
+        collection.create_index('url', unique=True, name='url_unique')
+    except pymongo.errors.DuplicateKeyError:
+        duplicates = list(collection.aggregate([
+            {'$group': {'_id': '$url', 'count': {'$sum': 1}}},
+            {'$match': {'count': {'$gt': 1}}},
+            {'$limit': 10},
+        ]))
+        log_error(f"Cannot create unique index on url, duplicated URLs: {[d['_id'] for d in duplicates]}")
+        raise
+    collection.create_index('translations.english.title', name='english_title')
+    collection.create_index(
+        [('translations.english.status', pymongo.ASCENDING), ('checked_at', pymongo.ASCENDING)],
+        name='english_status_checked_at'
+    )
+    collection.database['leases'].create_index('expires_at', expireAfterSeconds=3600, name='lease_expiry')
+    log_success("Database indexes ensured.")
+
+def is_url_scraped(url, projection=RELEASE_PROJECTION):
     """
     Check if URL is already scraped and stored.
 
     Args:
         url (str): URL to check.
+        projection (dict): Fields to return, by default everything except the
+            translated content and summaries.
 
     Returns:
         dict: Document if URL exists, None otherwise.
     """
     try:
         collection = connect_to_db()
-        result = collection.find_one({'url': url})
+        result = collection.find_one({'url': url}, projection)
         log_info(f"URL {'already' if result else 'not'} scraped: {url}")
         return result
     except Exception as e:
         log_error(f"Error checking URL: {e}")
         raise
 
+def find_scraped_urls(urls):
+    """
+    Find which of the given URLs are already fully scraped, in a single query.
+
+    Args:
+        urls (list): URLs to check.
+
+    Returns:
+        set: URLs whose English video is completed.
+    """
+    try:
+        collection = connect_to_db()
+        cursor = collection.find(
+            {'url': {'$in': list(urls)}, 'translations.english.status': 'completed'},
+            {'url': 1, '_id': 0}
+        )
+        found = {doc['url'] for doc in cursor}
+        log_info(f"{len(found)}/{len(urls)} URLs already scraped.")
+        return found
+    except Exception as e:
+        log_error(f"Error checking URLs: {e}")
+        raise
+
+def get_release_validators(url):
+    """
+    Fetch only the HTTP validators and hashes of a stored press release.
+
+    Args:
+        url (str): Press release URL.
+
+    Returns:
+        dict: `url`, `etag`, `last_modified` and `hashes`, or None if not stored.
+    """
+    collection = connect_to_db()
+    return collection.find_one({'url': url}, {'url': 1, 'etag': 1, 'last_modified': 1, 'hashes': 1})
+
+def iter_release_validators(checked_before=None, limit=0):
+    """
+    List completed press releases for a freshness sweep, least recently checked first.
+
+    Args:
+        checked_before (datetime): Only releases not checked since this time.
+        limit (int): Maximum number of releases, 0 for all.
+
+    Returns:
+        list: Dicts with `url`, `etag` and `last_modified`.
+    """
+    collection = connect_to_db()
+    query = {'translations.english.status': 'completed'}
+    if checked_before:
+        query['$or'] = [{'checked_at': {'$lt': checked_before}}, {'checked_at': {'$exists': False}}]
+    cursor = collection.find(query, {'url': 1, 'etag': 1, 'last_modified': 1, '_id': 0})
+    return list(cursor.sort('checked_at', pymongo.ASCENDING).limit(limit))
+
+def save_stage_checkpoint(url, stage, fields):
+    """
+    Persist the output of a pipeline stage and mark the stage as done.
+
+    Args:
+        url (str): Press release URL.
+        stage (str): Stage name, appended to `stages`.
+        fields (dict): Stage output, dotted paths allowed.
+
+    Returns:
+        dict: Updated document.
+    """
+    response_cache.invalidate(url=url)
+    collection = connect_to_db()
+    document = collection.find_one_and_update(
+        {'url': url},
+        {'$set': fields, '$addToSet': {'stages': stage}},
+        projection=RELEASE_PROJECTION,
+        return_document=pymongo.ReturnDocument.AFTER
+    )
+    log_info(f"Checkpoint '{stage}' saved: {url}")
+    return document
+
+def update_release_fields(url, fields):
+    """
+    Set fields on a stored press release without replacing the document.
+
+    Args:
+        url (str): Press release URL.
+        fields (dict): Fields to set, dotted paths allowed.
+    """
+    response_cache.invalidate(url=url)
+    collection = connect_to_db()
+    collection.update_one({'url': url}, {'$set': fields})
+
 def store_scraped_data_in_db(data):
     """
     Store scraped data in MongoDB.
@@ -53,18 +194,29 @@ def store_scraped_data_in_db(data):
     """
     try:
         collection = connect_to_db()
+        for item in ([data] if isinstance(data, dict) else data):
+            response_cache.invalidate(url=item['url'])
         if isinstance(data, dict):
-            result = collection.update_one({'url': data['url']}, {'$set': data}, upsert=True)
-            updated_doc = collection.find_one({'url': data['url']})
-            log_info(f"{'Inserted' if result.upserted_id else 'Updated'} document: {data['url']}")
+            updated_doc = collection.find_one_and_update(
+                {'url': data['url']},
+                {'$set': data},
+                upsert=True,
+                projection=RELEASE_PROJECTION,
+                return_document=pymongo.ReturnDocument.AFTER
+            )
+            log_info(f"Stored document: {data['url']}")
             return updated_doc
         elif isinstance(data, list):
-            updated_docs = []
-            for item in data:
-                collection.update_one({'url': item['url']}, {'$set': item}, upsert=True)
-                updated_docs.append(collection.find_one({'url': item['url']}))
+            if not data:
+                return []
+            # One round trip for the writes and one for reading them back
+            collection.bulk_write(
+                [pymongo.UpdateOne({'url': item['url']}, {'$set': item}, upsert=True) for item in data],
+                ordered=False
+            )
+            stored = {doc['url']: doc for doc in collection.find({'url': {'$in': [item['url'] for item in data]}}, RELEASE_PROJECTION)}
             log_info(f"Inserted/Updated {len(data)} documents.")
-            return updated_docs
+            return [stored.get(item['url']) for item in data]
         else:
             raise ValueError("Data must be dict or list of dicts.")
     except Exception as e:
@@ -73,56 +225,73 @@ def store_scraped_data_in_db(data):
 
 def update_translation_status(_id, language, status):
     """
-    Update translation status.
+    Update translation status. The write is buffered and batched with the
+    other updates of the release.
 
     Args:
         _id (ObjectId): Document ID.
         language (str): Translation language.
         status (str): New status.
     """
-    collection = connect_to_db()
-    result = collection.update_one(
-        {"_id": ObjectId(_id)},
-        {"$set": {f"translations.{language}.status": status}}
-    )
-    if result.matched_count > 0:
-        log_info(f"Translation in '{language}' is '{status}'.")
+    response_cache.invalidate(release_id=_id)
+    release_writes.set_nowait(ObjectId(_id), {f"translations.{language}.status": status})
+    log_info(f"Translation in '{language}' is '{status}'.")
 
-def store_translation_in_db(_id, language, translation_data):
+async def store_translation_in_db(_id, language, translation_data):
     """
-    Store translation in database.
+    Store translation in database, batched with other pending updates.
+    Returns once the translation is written.
 
     Args:
         _id (ObjectId): Document ID.
         language (str): Translation language.
         translation_data (dict): Translation data.
     """
+    response_cache.invalidate(release_id=_id)
+    await release_writes.set(ObjectId(_id), {f"translations.{language}": translation_data}, durable=True)
+    log_success(f"Translation in '{language}' completed.")
+
+def update_translation_fields(_id, language, fields):
+    """
+    Update some fields of a stored translation.
+
+    Args:
+        _id (ObjectId): Document ID.
+        language (str): Translation language.
+        fields (dict): Translation fields to set.
+    """
+    response_cache.invalidate(release_id=_id)
     collection = connect_to_db()
-    result = collection.update_one(
+    collection.update_one(
         {"_id": ObjectId(_id)},
-        {"$set": {f"translations.{language}": translation_data}},
-        upsert=True
+        {"$set": {f"translations.{language}.{key}": value for key, value in fields.items()}}
     )
-    if result.matched_count > 0:
-        log_success(f"Translation in '{language}' completed.")
+    log_info(f"Updated {', '.join(fields)} of translation in '{language}'.")
 
-def check_translation_in_db(_id, lang):
+def check_translation_in_db(_id, lang, quiet=False):
     """
     Check if translation exists.
 
     Args:
         _id (ObjectId): Document ID.
         lang (str): Language to check.
+        quiet (bool): Do not log the outcome, for repeated polls.
 
     Returns:
         dict: Translation data if exists and completed, None otherwise.
     """
     collection = connect_to_db()
-    result = collection.find_one({"_id": ObjectId(_id), f"translations.{lang}": {"$exists": True}})
-    if result and result.get("translations").get(lang).get("status") == "completed":
+    result = collection.find_one(
+        {"_id": ObjectId(_id), f"translations.{lang}.status": "completed"},
+        {f"translations.{lang}": 1, "_id": 0}
+    )
+    if quiet:
+        return result["translations"][lang] if result else None
+    if result:
         log_info(f"Translation for '{lang}' exists.")
-        return result["translations"].get(lang)
-    log_warning(f"Translation for '{lang}' does not exist.")
+        return result["translations"][lang]
+    # A missing translation is the normal case before it is generated
+    log_info(f"Translation for '{lang}' does not exist.")
     return None
 
 def release_exist_with_title(title):
@@ -133,9 +302,60 @@ def release_exist_with_title(title):
         title (str): Title to check.
 
     Returns:
-        dict: Document if exists, None otherwise.
+        dict: `_id`, `url` and English title if exists, None otherwise.
     """
     collection = connect_to_db()
-    document = collection.find_one({"title": title})
+    # The title is stored per language, the top level has none
+    document = collection.find_one({"translations.english.title": title}, {"url": 1, "translations.english.title": 1})
     log_info(f"Document with title '{title}' {'exists' if document else 'not found'}.")
-    return document
\ No newline at end of file
+    return document
+
+def acquire_lease(key, owner, ttl):
+    """
+    Try to take an exclusive, expiring lease shared by every process.
+
+    Args:
+        key (str): Lease name.
+        owner (str): Unique id of the caller.
+        ttl (float): Seconds until the lease expires unless renewed.
+
+    Returns:
+        bool: True if the caller now holds the lease.
+    """
+    leases = connect_to_db().database['leases']
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=ttl)
+    try:
+        leases.insert_one({'_id': key, 'owner': owner, 'expires_at': expires_at})
+        return True
+    except pymongo.errors.DuplicateKeyError:
+        # Take over only if the previous holder let it expire
+        result = leases.update_one(
+            {'_id': key, '$or': [{'expires_at': {'$lt': now}}, {'owner': owner}]},
+            {'$set': {'owner': owner, 'expires_at': expires_at}}
+        )
+        return result.matched_count > 0
+
+def renew_lease(key, owner, ttl):
+    """
+    Extend a lease held by `owner`.
+
+    Returns:
+        bool: False if the lease was lost to another owner.
+    """
+    leases = connect_to_db().database['leases']
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
+    result = leases.update_one({'_id': key, 'owner': owner}, {'$set': {'expires_at': expires_at}})
+    return result.matched_count > 0
+
+def release_lease(key, owner):
+    """Release a lease held by `owner`."""
+    leases = connect_to_db().database['leases']
+    leases.delete_one({'_id': key, 'owner': owner})
+
+
+if __name__ == "__main__":
+    # Migration step: python -m database.db
+    ensure_indexes()
+    from database.job_queue import ensure_job_indexes
+    ensure_job_indexes()
@@ -0,0 +1,250 @@
+"""
+Shared job queue in MongoDB, for running the pipeline on worker hosts.
+
+API nodes `enqueue` jobs; worker processes (worker.py) `claim` the oldest
+queued job of the kinds they run, holding a lease they renew with
+`heartbeat`. A job whose lease expires (its worker died or hung) is claimed
+again by another worker, up to JOB_MAX_ATTEMPTS times; failed jobs are
+retried after JOB_RETRY_DELAY seconds.
+
+Jobs are identified by a key (e.g. 'release:<url>'): at most one job per key
+is active (queued or running) at a time, enqueueing it again returns the
+active job.
+
+`cancel` marks a job and the jobs it started cancelled; a running one is
+stopped by its worker at the next heartbeat, which no longer matches.
+"""
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pymongo
+from pymongo import ReturnDocument
+
+# User defined modules
+from database.db import connect_to_db
+from logger import log_info, log_warning, log_error, log_success
+
+JOB_LEASE_TTL = float(os.getenv("JOB_LEASE_TTL", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "30"))
+# Queued jobs before new ones are refused, 0 for no limit
+JOB_QUEUE_LIMIT = int(os.getenv("JOB_QUEUE_LIMIT", "0"))
+
+def jobs_collection():
+    return connect_to_db().database["jobs"]
+
+
+def ensure_job_indexes():
+    """
+    Create the indexes of the job queue. Idempotent, run at startup.
+
+    - key: unique among active jobs (`active` is only set while queued or running)
+    - (status, kind, priority): `claim`
+    - lease_expires_at: re-claiming jobs of dead workers
+    - parent, batches: progress of a release's languages and of a batch
+    """
+    jobs = jobs_collection()
+    jobs.create_index("key", unique=True, partialFilterExpression={"active": True}, name="active_key_unique")
+    jobs.create_index([("status", pymongo.ASCENDING), ("kind", pymongo.ASCENDING), ("priority", pymongo.ASCENDING)],
+                      name="status_kind_priority")
+    jobs.create_index("lease_expires_at", name="lease_expires_at")
+    jobs.create_index("parent", name="parent")
+    jobs.create_index("batches", name="batches")
+    log_success("Job queue indexes ensured.")
+
+
+def enqueue(kind: str, key: str, payload: dict, priority: float = None, parent: str = None, batch: str = None):
+    """
+    Queue a job unless one with the same key is already active.
+
+    Args:
+        kind (str): Job kind, 'release' or 'translation'.
+        key (str): Deduplication key, e.g. 'translation:<release id>:hindi'.
+        payload (dict): Arguments of the job.
+        priority (float): Lower runs first; the submission time by default,
+            so jobs run in submission order across every API node.
+        parent (str): ID of the job that created this one.
+        batch (str): ID of a batch the job belongs to; an already active job
+            joins the batch.
+
+    Returns:
+        dict: The queued job, or the active job with the same key.
+    """
+    now = datetime.now(timezone.utc)
+    job = {
+        "_id": uuid.uuid4().hex[:16],
+        "kind": kind,
+        "key": key,
+        "payload": payload,
+        "priority": priority if priority is not None else now.timestamp(),
+        "parent": parent,
+        "batches": [batch] if batch else [],
+        "status": "queued",
+        "active": True,
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "available_at": now,
+        "created_at": now,
+    }
+    jobs = jobs_collection()
+    while True:
+        try:
+            jobs.insert_one(job)
+            break
+        except pymongo.errors.DuplicateKeyError:
+            existing = jobs.find_one_and_update(
+                {"key": key, "active": True},
+                {"$addToSet": {"batches": {"$each": job["batches"]}}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if existing is not None:
+                log_info(f"Job already active for {key}: {existing['_id']}")
+                return existing
+            # The active job finished in the meantime: insert again, racing other enqueuers
+    log_info(f"Queued {kind} job {job['_id']} for {key}")
+    return job
+
+
+def admit(jobs: int = 1):
+    """
+    Admission control of API nodes in queue mode.
+
+    Raises:
+        Overloaded: JOB_QUEUE_LIMIT jobs are already waiting.
+    """
+    if not JOB_QUEUE_LIMIT:
+        return
+    from scheduler import Overloaded
+
+    queued = jobs_collection().count_documents({"status": "queued"}, limit=JOB_QUEUE_LIMIT + jobs)
+    if queued + jobs > JOB_QUEUE_LIMIT:
+        raise Overloaded("jobs", int(JOB_RETRY_DELAY))
+
+
+def claim(worker_id: str, kinds, ttl: float = JOB_LEASE_TTL):
+    """
+    Take the queued job with the lowest priority, or a running job whose lease expired.
+
+    Args:
+        worker_id (str): Unique ID of the worker process.
+        kinds (list): Job kinds the worker runs.
+        ttl (float): Seconds until the lease expires unless renewed.
+
+    Returns:
+        dict: The claimed job, or None if there is nothing to do.
+    """
+    jobs = jobs_collection()
+    while True:
+        now = datetime.now(timezone.utc)
+        job = jobs.find_one_and_update(
+            {
+                "kind": {"$in": list(kinds)},
+                "$or": [
+                    {"status": "queued", "available_at": {"$lte": now}},
+                    {"status": "running", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {"status": "running", "worker": worker_id, "started_at": now,
+                         "heartbeat_at": now, "lease_expires_at": now + timedelta(seconds=ttl)},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("priority", pymongo.ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return None
+        if job["attempts"] <= job["max_attempts"]:
+            if job["attempts"] > 1:
+                log_warning(f"Retrying {job['kind']} job {job['_id']} (attempt {job['attempts']}/{job['max_attempts']})")
+            return job
+        # Its workers kept dying: give up instead of taking the next one down
+        _finish(job["_id"], worker_id, "failed", error=job.get("error") or "Lease expired too many times")
+        log_error(f"{job['kind'].capitalize()} job {job['_id']} failed after {job['max_attempts']} attempts")
+
+
+def heartbeat(job_id: str, worker_id: str, ttl: float = JOB_LEASE_TTL) -> bool:
+    """
+    Extend the lease of a running job.
+
+    Returns:
+        bool: False if the lease expired and the job was claimed by another worker.
+    """
+    now = datetime.now(timezone.utc)
+    result = jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {"$set": {"heartbeat_at": now, "lease_expires_at": now + timedelta(seconds=ttl)}},
+    )
+    return result.matched_count > 0
+
+
+def _finish(job_id, worker_id, status, **fields):
+    result = jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {"$set": {"status": status, "finished_at": datetime.now(timezone.utc), **fields}, "$unset": {"active": ""}},
+    )
+    return result.matched_count > 0
+
+
+def complete(job_id: str, worker_id: str, result: dict = None) -> bool:
+    """Mark a job completed; False if the worker no longer held its lease."""
+    return _finish(job_id, worker_id, "completed", result=result)
+
+
+def fail(job_id: str, worker_id: str, error: str):
+    """Queue a failed job again after JOB_RETRY_DELAY, or mark it failed after its last attempt."""
+    job = jobs_collection().find_one({"_id": job_id}, {"attempts": 1, "max_attempts": 1})
+    if job is not None and job["attempts"] < job["max_attempts"]:
+        jobs_collection().update_one(
+            {"_id": job_id, "worker": worker_id, "status": "running"},
+            {"$set": {"status": "queued", "error": error,
+                      "available_at": datetime.now(timezone.utc) + timedelta(seconds=JOB_RETRY_DELAY)}},
+        )
+        return
+    _finish(job_id, worker_id, "failed", error=error)
+
+
+def release(job_id: str, worker_id: str):
+    """Give a job back to the queue without counting the attempt, e.g. when a worker shuts down."""
+    jobs_collection().update_one(
+        {"_id": job_id, "worker": worker_id, "status": "running"},
+        {"$set": {"status": "queued", "available_at": datetime.now(timezone.utc)}, "$inc": {"attempts": -1}},
+    )
+
+
+def cancel(job_id: str) -> int:
+    """
+    Cancel a job and the jobs it started, unless they already finished.
+
+    Returns:
+        int: Jobs cancelled, 0 if the job is unknown or everything finished.
+    """
+    result = jobs_collection().update_many(
+        {"$or": [{"_id": job_id}, {"parent": job_id}], "status": {"$in": ["queued", "running"]}},
+        {"$set": {"status": "cancelled", "finished_at": datetime.now(timezone.utc)}, "$unset": {"active": ""}},
+    )
+    if result.modified_count:
+        log_warning(f"Cancelled job {job_id} ({result.modified_count} jobs)")
+    return result.modified_count
+
+
+def get_job(job_id: str):
+    return jobs_collection().find_one({"_id": job_id})
+
+
+def child_jobs(job_id: str):
+    return list(jobs_collection().find({"parent": job_id}))
+
+
+def batch_jobs(batch_id: str):
+    return list(jobs_collection().find({"batches": batch_id, "kind": "release"}))
+
+
+def save_batch(batch: dict):
+    """Store the definition of a queued batch (`_id`, urls, languages, created_at)."""
+    connect_to_db().database["batches"].insert_one(batch)
+
+
+def get_batch(batch_id: str):
+    return connect_to_db().database["batches"].find_one({"_id": batch_id})
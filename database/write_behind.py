@@ -0,0 +1,204 @@
+"""
+Write-behind buffer for press release updates.
+
+Updates are queued per document and written with one `bulk_write` at most
+WRITE_FLUSH_INTERVAL seconds later: every language's status changes and
+results that land in the same window cost a single round trip. Later updates
+of the same field replace earlier ones before anything is sent.
+
+Callers that need their write to be durable (e.g. a completed translation
+that other workers poll for) await `set(..., durable=True)`, which returns once
+the batch holding it is written, group-commit style.
+
+An update the server rejects, or that is lost with its connection, is
+queued again under the updates made since and retried with exponential
+backoff, up to WRITE_MAX_ATTEMPTS times; only then is it dropped and are
+its durable callers failed.
+"""
+import asyncio
+import os
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# User defined modules
+from logger import log_error, log_warning
+
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.1"))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "500"))
+# Attempts of an update before it is dropped; retries wait WRITE_FLUSH_INTERVAL * 2^attempt
+WRITE_MAX_ATTEMPTS = int(os.getenv("WRITE_MAX_ATTEMPTS", "5"))
+
+
+def merge_set(fields: dict, path: str, value):
+    """
+    Add a dotted-path `$set` to `fields` without conflicting paths.
+
+    A path under an already set document is merged into it, and setting a
+    whole document drops the pending paths below it (MongoDB rejects a `$set`
+    holding both 'a' and 'a.b').
+    """
+    for existing in list(fields):
+        if path.startswith(existing + ".") and isinstance(fields[existing], dict):
+            document = fields[existing] = dict(fields[existing])
+            *parents, leaf = path[len(existing) + 1:].split(".")
+            for key in parents:
+                document = document.setdefault(key, {})
+            document[leaf] = value
+            return
+        if existing.startswith(path + "."):
+            del fields[existing]
+    fields[path] = value
+
+
+class WriteBehind:
+    """Coalesce `$set` updates per document into periodic `bulk_write` batches."""
+
+    def __init__(self, get_collection, interval: float = WRITE_FLUSH_INTERVAL, batch_size: int = WRITE_BATCH_SIZE,
+                 max_attempts: int = WRITE_MAX_ATTEMPTS):
+        self.get_collection = get_collection
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self._pending = {}
+        # key -> futures of durable `set` calls, resolved when the key's update is written
+        self._waiters = {}
+        # key -> failed attempts, and loop time before which it is not retried
+        self._attempts = {}
+        self._retry_at = {}
+        self._loop = None
+        self._lock = None
+        self._timer = None
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock, self._timer = loop, asyncio.Lock(), None
+        return loop
+
+    def queue(self, key, fields: dict):
+        """Queue `$set` fields for the document with `_id` = key."""
+        pending = self._pending.setdefault(key, {})
+        for path, value in fields.items():
+            merge_set(pending, path, value)
+
+    def _schedule(self, loop, delay: float = None):
+        if delay is None and len(self._pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+        elif self._timer is None:
+            self._timer = loop.call_later(self.interval if delay is None else delay,
+                                          lambda: asyncio.ensure_future(self.flush()))
+
+    async def set(self, key, fields: dict, durable: bool = False):
+        """
+        Queue an update and schedule a flush.
+
+        Args:
+            key: `_id` of the document.
+            fields (dict): Fields to `$set`, dotted paths allowed.
+            durable (bool): Wait until the update is written.
+
+        Raises:
+            Exception: The error of the last attempt, if a durable update was dropped.
+        """
+        loop = self._bind_loop()
+        self.queue(key, fields)
+        if not durable:
+            self._schedule(loop)
+            return
+
+        waiter = loop.create_future()
+        self._waiters.setdefault(key, []).append(waiter)
+        self._schedule(loop)
+        await waiter
+
+    def set_nowait(self, key, fields: dict):
+        """Queue an update from synchronous code; written directly when no event loop runs."""
+        try:
+            loop = self._bind_loop()
+        except RuntimeError:
+            self.get_collection().update_one({"_id": key}, {"$set": fields})
+            return
+        self.queue(key, fields)
+        self._schedule(loop)
+
+    async def flush(self, force: bool = False):
+        """
+        Write the pending updates in one `bulk_write`, in a worker thread.
+
+        Updates that failed are queued again under the updates made since and
+        retried after a backoff, see WRITE_MAX_ATTEMPTS.
+
+        Args:
+            force (bool): Also send updates waiting out their backoff, e.g.
+                before shutting down.
+        """
+        loop = self._bind_loop()
+        async with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            now = loop.time()
+            keys = [key for key in self._pending if force or self._retry_at.get(key, now) <= now]
+            batch = {key: self._pending.pop(key) for key in keys}
+            waiters = {key: self._waiters.pop(key) for key in keys if key in self._waiters}
+            failed = {}
+            if batch:
+                operations = [UpdateOne({"_id": key}, {"$set": fields}) for key, fields in batch.items()]
+                try:
+                    await asyncio.to_thread(self.get_collection().bulk_write, operations, ordered=False)
+                except BulkWriteError as e:
+                    # Unordered: every operation without a write error was applied
+                    failed = {keys[error["index"]]: e for error in e.details.get("writeErrors", [])}
+                    if e.details.get("writeConcernErrors"):
+                        failed = dict.fromkeys(keys, e)
+                except Exception as e:
+                    failed = dict.fromkeys(keys, e)
+
+            for key in keys:
+                if key not in failed:
+                    self._attempts.pop(key, None)
+                    self._retry_at.pop(key, None)
+                    self._settle(waiters.get(key, []))
+            if failed:
+                self._requeue(loop, batch, waiters, failed)
+
+            if self._pending:
+                # Next retry, or the updates queued while this batch was written
+                due = min(self._retry_at.get(key, now) for key in self._pending)
+                self._schedule(loop, max(due - loop.time(), self.interval))
+
+    def _requeue(self, loop, batch: dict, waiters: dict, failed: dict):
+        dropped = 0
+        for key, error in failed.items():
+            attempts = self._attempts.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                self._attempts.pop(key, None)
+                self._retry_at.pop(key, None)
+                self._settle(waiters.get(key, []), error)
+                dropped += 1
+                continue
+            self._attempts[key] = attempts
+            self._retry_at[key] = loop.time() + self.interval * 2 ** attempts
+            # `$set` is idempotent: send the failed update again, keeping the newer values
+            newer = self._pending.pop(key, None)
+            self._pending[key] = batch[key]
+            if newer:
+                self.queue(key, newer)
+            self._waiters[key] = waiters.get(key, []) + self._waiters.get(key, [])
+
+        error = next(iter(failed.values()))
+        if dropped:
+            log_error(f"Write-behind dropped {dropped} updates after {self.max_attempts} attempts: {error}")
+        if dropped < len(failed):
+            log_warning(f"Write-behind flush failed for {len(failed) - dropped} of {len(batch)} updates, retrying: {error}")
+
+    @staticmethod
+    def _settle(waiters, error: Exception = None):
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if error is None:
+                waiter.set_result(None)
+            else:
+                waiter.set_exception(error)
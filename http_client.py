@@ -0,0 +1,115 @@
+import asyncio
+import os
+import random
+from urllib.parse import urlsplit
+
+import httpx
+
+# User defined modules
+from logger import log_warning
+import metrics
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+HTTP_BACKOFF = float(os.getenv("HTTP_BACKOFF", "0.5"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+_state = {"client": None, "loop": None, "hosts": {}}
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Return the process-wide async HTTP client, creating it on first use.
+
+    The client keeps connections alive between requests and is recreated if the
+    running event loop changes (e.g. successive `asyncio.run` calls in scripts).
+    """
+    loop = asyncio.get_running_loop()
+    if _state["client"] is None or _state["loop"] is not loop:
+        _state["client"] = httpx.AsyncClient(
+            headers=DEFAULT_HEADERS,
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+        _state["loop"] = loop
+        _state["hosts"] = {}
+    return _state["client"]
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    """Semaphore capping concurrent requests to a single host."""
+    host = urlsplit(url).netloc
+    if host not in _state["hosts"]:
+        _state["hosts"][host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return _state["hosts"][host]
+
+
+def _retry_delay(attempt: int, response: httpx.Response = None) -> float:
+    """Exponential backoff with jitter, honouring a numeric Retry-After header."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+    return HTTP_BACKOFF * (2 ** attempt) * (0.5 + random.random())
+
+
+async def request(method: str, url: str, retries: int = HTTP_RETRIES, **kwargs) -> httpx.Response:
+    """
+    Send a request through the shared client with per-host limits and retries.
+
+    Transport errors, timeouts and 429/5xx responses are retried with backoff.
+    The final response is returned as-is; callers decide on `raise_for_status`.
+
+    Args:
+        method (str): HTTP method.
+        url (str): Request URL.
+        retries (int): Retries after the first attempt.
+        **kwargs: Passed to `httpx.AsyncClient.request`.
+
+    Returns:
+        httpx.Response: Response of the last attempt.
+    """
+    client = get_client()
+    for attempt in range(retries + 1):
+        try:
+            async with _host_semaphore(url):
+                response = await client.request(method, url, **kwargs)
+        except (httpx.TransportError, httpx.TimeoutException) as e:
+            if attempt == retries:
+                raise
+            delay = _retry_delay(attempt)
+            log_warning(f"{method} {url} failed ({e!r}), retrying in {delay:.1f}s")
+            metrics.retries.inc(operation="http")
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                return response
+            delay = _retry_delay(attempt, response)
+            log_warning(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            metrics.retries.inc(operation="http")
+        await asyncio.sleep(delay)
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+async def close_client():
+    """Close the shared client and its pooled connections."""
+    client = _state["client"]
+    _state["client"] = None
+    _state["loop"] = None
+    if client is not None:
+        await client.aclose()
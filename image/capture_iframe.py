@@ -1,52 +1,172 @@
-from playwright.async_api import async_playwright
 import os
-from datetime import datetime
+import asyncio
 from urllib.parse import unquote
 
-async def capture_iframe(embed_url):
+# User defined modules
+from logger import log_info, log_error, log_success
+from singleflight import SingleFlight
+from utils import hash_text
+
+# Pages (each in its own browser context) kept open for captures
+CAPTURE_POOL_SIZE = int(os.getenv("CAPTURE_POOL_SIZE", "4"))
+# Milliseconds to wait for a tweet to render
+CAPTURE_TIMEOUT = float(os.getenv("CAPTURE_TIMEOUT", "20000"))
+
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tweets")
+
+# The tweet is ready once its article exists, its images are decoded and fonts are loaded
+TWEET_READY = """() => {
+    const tweet = document.querySelector('article');
+    return !!tweet
+        && document.fonts.status === 'loaded'
+        && [...tweet.querySelectorAll('img')].every(img => img.complete);
+}"""
+
+_state = {"playwright": None, "browser": None, "loop": None, "idle": None, "slots": None, "lock": None, "keeper": None}
+capture_flights = SingleFlight("tweet capture")
+
+
+async def _new_page():
+    context = await _state["browser"].new_context(viewport={"width": 550, "height": 600})
+    return await context.new_page()
+
+
+async def _shutdown(playwright, browser):
+    try:
+        if browser is not None:
+            await browser.close()
+    finally:
+        if playwright is not None:
+            await playwright.stop()
+
+
+async def _keep_browser(playwright, browser):
     """
-    Capture screenshot of a tweet from its embed URL.
+    Tie the browser to the event loop that launched it.
 
-    Args:
-        embed_url (str): URL of the embedded tweet.
+    `asyncio.run` cancels this task when its loop ends, which closes Chromium
+    before the loop is gone; a later loop launches its own browser.
+    """
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await _shutdown(playwright, browser)
+
+
+async def get_page_pool():
+    """
+    Launch Chromium on first use and return the pool of idle pages.
+
+    At most CAPTURE_POOL_SIZE pages exist at a time: captures take one of the
+    `slots`, reuse an idle page or open a new one. The browser stays open
+    until `close_browser` or the end of the event loop, and is relaunched if
+    it crashed.
 
     Returns:
-        str: Path to the saved screenshot, or None if failed.
+        tuple: Semaphore of capture slots and queue of idle live pages.
     """
-    curr_folder = os.path.dirname(os.path.abspath(__file__))
-    output_dir = os.path.join(curr_folder, "tweets")
-    os.makedirs(output_dir, exist_ok=True)
+    loop = asyncio.get_running_loop()
+    if _state["loop"] is not loop:
+        # The previous loop's browser was closed with it (see `_keep_browser`)
+        _state.update(playwright=None, browser=None, idle=None, keeper=None, lock=asyncio.Lock(),
+                      slots=asyncio.Semaphore(CAPTURE_POOL_SIZE), loop=loop)
+
+    async with _state["lock"]:
+        if _state["browser"] is None or not _state["browser"].is_connected():
+            from playwright.async_api import async_playwright
+
+            if _state["keeper"] is not None:
+                # Crashed: stop its Playwright driver before starting over
+                _state["keeper"].cancel()
+                await asyncio.gather(_state["keeper"], return_exceptions=True)
+            playwright = await async_playwright().start()
+            browser = await playwright.chromium.launch(headless=True)
+            _state.update(playwright=playwright, browser=browser, idle=asyncio.Queue(),
+                          keeper=asyncio.create_task(_keep_browser(playwright, browser)))
+            # Let the keeper enter its try block, so cancelling it always closes the browser
+            await asyncio.sleep(0)
+            log_info(f"Launched Chromium for up to {CAPTURE_POOL_SIZE} capture pages")
+    return _state["slots"], _state["idle"]
+
+
+async def close_browser():
+    """Close the shared browser and stop Playwright."""
+    keeper = _state["keeper"]
+    _state.update(playwright=None, browser=None, idle=None, keeper=None)
+    if keeper is not None and keeper.get_loop() is asyncio.get_running_loop():
+        keeper.cancel()
+        await asyncio.gather(keeper, return_exceptions=True)
+
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
+async def _capture(url: str, filepath: str):
+    slots, idle = await get_page_pool()
+    async with slots:
+        page = None
         try:
-            page = await browser.new_page()
-            await page.set_viewport_size({"width": 550, "height": 600})
-            await page.goto(unquote(embed_url), wait_until='networkidle')
-            await page.wait_for_selector('article', timeout=20000)
-            await page.wait_for_timeout(5000)
-            
+            page = idle.get_nowait() if not idle.empty() else await _new_page()
+            await page.goto(url, wait_until='domcontentloaded', timeout=CAPTURE_TIMEOUT)
+            await page.wait_for_function(TWEET_READY, timeout=CAPTURE_TIMEOUT)
+
             tweet = await page.query_selector('article')
-            if not tweet:
-                print("Could not find tweet content")
-                return None
-
-            filename = f"tweet_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            filepath = os.path.join(output_dir, filename)
-            
-            await tweet.screenshot(path=filepath)
-            print(f"Screenshot saved to: {filepath}")
+            # Write next to the target and rename, so an interrupted capture is never cached
+            await tweet.screenshot(path=f"{filepath}.part", type="jpeg")
+            os.replace(f"{filepath}.part", filepath)
+            log_success(f"Screenshot saved to: {filepath}")
             return filepath
-                
+
         except Exception as e:
-            print(f"Error capturing tweet: {str(e)}")
+            log_error(f"Error capturing tweet: {str(e)}")
+            # The page may be left mid-navigation or crashed: drop it, the next capture opens a fresh one
+            if page is not None:
+                try:
+                    await page.context.close()
+                except Exception:
+                    # The browser itself is gone; get_page_pool relaunches it on the next capture
+                    pass
             return None
         finally:
-            await browser.close()
+            # Only live pages of the current browser go back to the pool
+            if page is not None and not page.is_closed() and idle is _state["idle"]:
+                idle.put_nowait(page)
+
 
+async def capture_iframe(embed_url):
+    """
+    Capture screenshot of a tweet from its embed URL.
+
+    Screenshots are named after a hash of the URL, so a tweet captured before
+    is returned from disk and concurrent captures of one URL share a page.
+
+    Args:
+        embed_url (str): URL of the embedded tweet.
+
+    Returns:
+        str: Path to the saved screenshot, or None if failed.
+    """
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    url = unquote(embed_url)
+    filepath = os.path.join(OUTPUT_DIR, f"tweet_{hash_text(url)[:16]}.jpg")
+
+    if os.path.exists(filepath):
+        return filepath
+
+    return await capture_flights.do(url, _capture, url, filepath)
+
+
+async def capture_iframes(embed_urls):
+    """
+    Capture screenshots of many tweets in parallel, CAPTURE_POOL_SIZE at a time.
+
+    Args:
+        embed_urls (list): URLs of the embedded tweets.
+
+    Returns:
+        list: Screenshot paths of the captured tweets, in input order.
+    """
+    paths = await asyncio.gather(*(capture_iframe(url) for url in embed_urls))
+    return [path for path in paths if path]
 
 
 # if __name__ == "__main__":
-#     import asyncio
-#     example_embed_url = f"https://t.co/aewpSJixkT"
-#     asyncio.run(capture_iframe(example_embed_url))
\ No newline at end of file
+#     example_embed_urls = ["https://t.co/aewpSJixkT"]
+#     print(asyncio.run(capture_iframes(example_embed_urls)))
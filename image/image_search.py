@@ -216,22 +216,89 @@
 
 
 import os
-import openai
 import json
+import time
+import asyncio
+from collections import OrderedDict
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
 from typing import List, Dict
-from logger import log
+
+# User defined modules
+import http_client
+from logger import log, log_error
+from singleflight import SingleFlight
+from summarize.summarize import get_client
+from scheduler import slot
+import metrics
+from tracing import traced
 
 load_dotenv()
 
 # Configure APIs
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 SEARCH_ENGINE_ID = os.getenv("SEARCH_ENGINE_ID")
-openai.api_key = os.getenv("OPENAI_API_KEY")
+SEARCH_URL = "https://www.googleapis.com/customsearch/v1"
 PIB_SITE = "pib.gov.in"
 
-def process_with_gpt(content: str) -> List[str]:
+IMAGE_SEARCH_CONCURRENCY = int(os.getenv("IMAGE_SEARCH_CONCURRENCY", "4"))
+IMAGE_SEARCH_CACHE_TTL = float(os.getenv("IMAGE_SEARCH_CACHE_TTL", "86400"))
+IMAGE_SEARCH_CACHE_SIZE = int(os.getenv("IMAGE_SEARCH_CACHE_SIZE", "1024"))
+
+search_flights = SingleFlight("image search")
+# (concept, num, site filter) -> (expiry time, results)
+search_cache = OrderedDict()
+
+
+async def rest_search_transport(params: Dict) -> Dict:
+    """
+    Query the Custom Search JSON API through the shared HTTP client.
+
+    Args:
+        params (Dict): Query parameters, without the API key and engine ID.
+
+    Returns:
+        Dict: Decoded API response.
+    """
+    response = await http_client.get(SEARCH_URL, params={"key": GOOGLE_API_KEY, "cx": SEARCH_ENGINE_ID, **params})
+    response.raise_for_status()
+    return response.json()
+
+
+_transport = rest_search_transport
+
+
+def set_search_transport(transport):
+    """
+    Replace the search transport, e.g. with a stub returning canned responses.
+
+    Args:
+        transport (callable): Coroutine function taking the query parameters and
+            returning a Custom Search JSON response.
+    """
+    global _transport
+    _transport = transport
+
+
+def _cache_get(key):
+    entry = search_cache.get(key)
+    if entry is not None and entry[0] < time.monotonic():
+        del search_cache[key]
+        entry = None
+    metrics.count_lookup("image_search", entry is not None)
+    if entry is None:
+        return None
+    search_cache.move_to_end(key)
+    return entry[1]
+
+
+def _cache_put(key, results):
+    search_cache[key] = (time.monotonic() + IMAGE_SEARCH_CACHE_TTL, results)
+    search_cache.move_to_end(key)
+    while len(search_cache) > IMAGE_SEARCH_CACHE_SIZE:
+        search_cache.popitem(last=False)
+
+
+async def process_with_gpt(content: str) -> List[str]:
     """
     Extract visual concepts from content using GPT-3.5.
 
@@ -248,15 +315,16 @@ def process_with_gpt(content: str) -> List[str]:
     Example output: ["traditional Indian handicrafts on display", "Ministry of Statistics and Programme Implementation", "farmers harvesting wheat crop", "solar panel installation", "Ms. Puja Singh Mandol Additional Secretary", "Attended by representatives from the State Government of Haryana"]
     """
 
-    completion = openai.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": content}
-        ],
-        max_tokens=150,
-        temperature=0.3
-    )
+    async with slot("network"):
+        completion = await get_client().chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
+            ],
+            max_tokens=150,
+            temperature=0.3
+        )
 
     response_text = completion.choices[0].message.content.strip()
 
@@ -267,46 +335,64 @@ def process_with_gpt(content: str) -> List[str]:
         return [phrase.strip() for phrase in response_text.split('\n') if phrase.strip()]
 
 
-def google_image_search(prompt: str, num_images: int = 1, prioritize_pib: bool = False) -> List[Dict]:
+async def _search(prompt: str, num_images: int, site_filter: str) -> List[Dict]:
+    """Run one cached image search; failures are logged and return no images."""
+    key = (prompt, num_images, site_filter)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    async def fetch():
+        async with slot("network"):
+            res = await _transport({"q": f"{site_filter} {prompt}", "searchType": "image", "num": num_images})
+        return [{
+            'url': item['link'],
+            'source': item.get('displayLink', ''),
+            'title': item.get('title', ''),
+            'context': prompt
+        } for item in res.get('items', [])]
+
+    try:
+        results = await search_flights.do(key, fetch)
+    except Exception as e:
+        log_error(f"Image search failed for '{prompt}': {e}")
+        return []
+
+    _cache_put(key, results)
+    return results
+
+
+async def google_image_search(prompt: str, num_images: int = 1, prioritize_pib: bool = False) -> List[Dict]:
     """
     Search images using Google Custom Search API.
 
     Args:
         prompt (str): Search query.
         num_images (int): Number of images to return.
-        prioritize_pib (bool): Prioritize PIB site in search.
+        prioritize_pib (bool): Prioritize PIB site in search. Other sites
+            are only searched when PIB has too few images, each query costing quota.
 
     Returns:
         List[Dict]: Image search results.
     """
-    service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-
-    search_query = f"site:{PIB_SITE} {prompt}" if prioritize_pib else f"-site:{PIB_SITE} {prompt}"
-
-    res = service.cse().list(
-        q=search_query,
-        cx=SEARCH_ENGINE_ID,
-        searchType='image',
-        num=num_images
-    ).execute()
+    if not prioritize_pib:
+        return await _search(prompt, num_images, f"-site:{PIB_SITE}")
 
-    image_results = [{
-        'url': item['link'],
-        'source': item.get('displayLink', ''),
-        'title': item.get('title', ''),
-        'context': prompt
-    } for item in res.get('items', [])]
+    pib_results = await _search(prompt, num_images, f"site:{PIB_SITE}")
+    if len(pib_results) >= num_images:
+        return pib_results
+    other_results = await _search(prompt, num_images, f"-site:{PIB_SITE}")
+    return pib_results + other_results[:num_images - len(pib_results)]
 
-    if prioritize_pib and not image_results:
-        return google_image_search(prompt, num_images, False)
-        
-    return image_results
 
-
-def search_images_from_content(content: str, num_images_per_chunk: int = 1, max_chunks: int = 8) -> List[Dict]:
+@traced("search_images_from_content")
+async def search_images_from_content(content: str, num_images_per_chunk: int = 1, max_chunks: int = 8) -> List[Dict]:
     """
     Process content and search for related images.
 
+    Concepts are searched concurrently, at most IMAGE_SEARCH_CONCURRENCY at a
+    time, and results keep the order of the concepts.
+
     Args:
         content (str): Input text to process.
         num_images_per_chunk (int): Images per concept.
@@ -315,16 +401,16 @@ def search_images_from_content(content: str, num_images_per_chunk: int = 1, max_
     Returns:
         List[Dict]: Image search results.
     """
-    chunks = process_with_gpt(content)
-    chunks = chunks[:max_chunks]
-
-    images = []
-    for chunk in chunks:
-        log(f"Searching Image for Chunk :{chunk}")
-        chunk_results = google_image_search(chunk, num_images_per_chunk)
-        images.extend(chunk_results)
-
-    return images
+    with metrics.stage_seconds.time(stage="image_search"):
+        chunks = await process_with_gpt(content)
+        chunks = chunks[:max_chunks]
 
+        semaphore = asyncio.Semaphore(IMAGE_SEARCH_CONCURRENCY)
 
+        async def search_chunk(chunk):
+            async with semaphore:
+                log(f"Searching Image for Chunk :{chunk}")
+                return await google_image_search(chunk, num_images_per_chunk)
 
+        results = await asyncio.gather(*(search_chunk(chunk) for chunk in chunks))
+    return [image for chunk_results in results for image in chunk_results]
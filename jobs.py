@@ -0,0 +1,230 @@
+"""
+Queue mode of the API: jobs are enqueued in MongoDB and run by worker.py.
+
+With EXECUTION_MODE=queue, API nodes only answer from completed results and
+enqueue work; every pipeline stage runs on worker processes, on any number of
+hosts sharing the database. A release job runs the English pipeline and
+enqueues one translation job per language, so the languages of one release
+spread over every worker.
+
+The default, EXECUTION_MODE=local, runs the pipeline inside the API process.
+"""
+import asyncio
+import os
+import time
+
+# User defined modules
+from database import job_queue
+from database.db import is_url_scraped
+from utils import tgt_langs
+import response_cache
+
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "local")
+# Seconds between job status reads of a streaming client
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+def queue_mode() -> bool:
+    return EXECUTION_MODE == "queue"
+
+
+def enqueue_release(url: str, refresh: bool = False, languages=None, batch: str = None, priority: float = None):
+    """
+    Queue the pipeline of a press release for the workers.
+
+    Args:
+        url (str): Press release URL.
+        refresh (bool): Re-fetch the release and regenerate what changed.
+        languages (list): Target languages, all of `tgt_langs` by default.
+        batch (str): ID of the batch the release belongs to.
+        priority (float): Lower runs first, the submission time by default.
+
+    Returns:
+        dict: The release job, or the already active one for this URL.
+    """
+    key = f"release:{url}" + (":refresh" if refresh else "")
+    payload = {"url": url, "refresh": refresh, "languages": languages}
+    return job_queue.enqueue("release", key, payload, priority=priority, batch=batch)
+
+
+def completed_result(url: str):
+    """
+    Result of a release whose every language is completed, without running anything.
+
+    The response cache is only used with `RESPONSE_CACHE_DB`: releases are
+    written by the workers, whose invalidations never reach the memory of
+    this process.
+
+    Returns:
+        dict: `_id` and per-language `result`, or None if work remains.
+    """
+    use_cache = response_cache.shared()
+    if use_cache:
+        cached = response_cache.get(url)
+        if cached is not None:
+            return cached
+    return read_completed_result(url, cache=use_cache)
+
+
+def read_completed_result(url: str, cache: bool = True):
+    """
+    Read the result of a release whose every language is completed from the database.
+
+    Args:
+        url (str): Release URL.
+        cache (bool): Put the result in the response cache, unless the
+            release is written to while it is read.
+
+    Returns:
+        dict: `_id` and per-language `result`, or None if work remains.
+    """
+    since = response_cache.generation()
+    release = is_url_scraped(url)
+    translations = (release or {}).get("translations", {})
+    languages = ["english", *tgt_langs]
+    if any(translations.get(lang, {}).get("status") != "completed" for lang in languages):
+        return None
+    output = {
+        "_id": str(release["_id"]),
+        "result": [{"lang": lang, "video": translations[lang].get("video"), "status": "completed"} for lang in languages],
+    }
+    if cache:
+        response_cache.put(url, output, since=since)
+    return output
+
+
+def job_progress(job_id: str):
+    """
+    Status of a release job and of the translation jobs it started.
+
+    Returns:
+        dict: Overall status ('queued', 'running', 'completed', 'failed',
+        'cancelled' or 'completed_with_errors'), attempts, error and
+        per-language status and video, or None if the job is unknown.
+    """
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return None
+
+    result = job.get("result") or {}
+    languages = {"english": {"status": job["status"], "video": result.get("video")}}
+    for child in job_queue.child_jobs(job_id):
+        languages[child["payload"]["lang"]] = {
+            "status": child["status"],
+            "video": (child.get("result") or {}).get("video"),
+            "attempts": child["attempts"],
+            "error": child.get("error") if child["status"] == "failed" else None,
+        }
+
+    status = job["status"]
+    if status == "completed":
+        statuses = [language["status"] for language in languages.values()]
+        if any(s not in FINISHED_STATUSES for s in statuses):
+            status = "running"
+        elif "cancelled" in statuses:
+            status = "cancelled"
+        elif "failed" in statuses:
+            status = "completed_with_errors"
+
+    return {
+        "id": job["_id"],
+        "url": job["payload"]["url"],
+        "status": status,
+        "attempts": job["attempts"],
+        "error": job.get("error"),
+        "release_id": result.get("release_id"),
+        "languages": languages,
+    }
+
+
+def is_finished(progress: dict) -> bool:
+    return progress["status"] not in ("queued", "running")
+
+
+async def follow_job(job_id: str):
+    """
+    Yield progress events of a queued job until it finishes.
+
+    Yields:
+        dict: A 'job' event on every status change and a 'language' event as
+        each language completes or fails, like the local streaming endpoint.
+    """
+    reported = {}
+    status = None
+    while True:
+        progress = await asyncio.to_thread(job_progress, job_id)
+        if progress["status"] != status:
+            status = progress["status"]
+            yield {"event": "job", "id": job_id, "status": status}
+        for lang, language in progress["languages"].items():
+            if language["status"] in FINISHED_STATUSES and lang not in reported:
+                reported[lang] = language["status"]
+                yield {"event": "language", "lang": lang, "status": language["status"],
+                       "video": language.get("video"), "error": language.get("error")}
+        if is_finished(progress):
+            return
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def submit_queued_batch(batch_id: str, urls, languages, refresh: bool = False):
+    """Queue the releases of a batch in submission order, see `batch.submit_batch`."""
+    submitted_at = time.time()
+    job_queue.save_batch({"_id": batch_id, "created_at": submitted_at, "urls": urls,
+                          "languages": languages, "refresh": refresh})
+    for index, url in enumerate(urls):
+        # Releases of one batch keep their order, and run before those of later batches
+        enqueue_release(url, refresh, languages, batch=batch_id, priority=submitted_at + index * 1e-6)
+
+
+def cancel_queued_batch(batch_id: str) -> bool:
+    """Cancel the releases of a queued batch that no other batch shares."""
+    if job_queue.get_batch(batch_id) is None:
+        return False
+    for job in job_queue.batch_jobs(batch_id):
+        if job["batches"] == [batch_id]:
+            job_queue.cancel(job["_id"])
+    return True
+
+
+def queued_batch_progress(batch_id: str):
+    """Aggregate progress of a queued batch, in the format of `batch.batch_progress`."""
+    batch = job_queue.get_batch(batch_id)
+    if batch is None:
+        return None
+
+    total = len(batch["urls"]) * (1 + len(batch["languages"]))
+    completed = failed = cancelled = 0
+    releases = {url: {"status": "queued", "stage": None, "languages": {}} for url in batch["urls"]}
+    for job in job_queue.batch_jobs(batch_id):
+        progress = job_progress(job["_id"])
+        url = job["payload"]["url"]
+        release = releases[url] = {"status": progress["status"], "id": progress["release_id"], "job_id": job["_id"],
+                                   "languages": {lang: language for lang, language in progress["languages"].items() if lang != "english"}}
+        finished = [language["status"] for language in progress["languages"].values() if language["status"] in FINISHED_STATUSES]
+        completed += finished.count("completed")
+        failed += finished.count("failed")
+        cancelled += finished.count("cancelled")
+        if job["status"] == "failed":
+            # Nothing more will be reported for this release
+            failed += len(batch["languages"])
+            release["error"] = job.get("error")
+        elif job["status"] == "cancelled":
+            cancelled += len(batch["languages"]) - len(release["languages"])
+
+    done = completed + failed + cancelled
+    finished = all(r["status"] not in ("queued", "running") for r in releases.values())
+    return {
+        "id": batch_id,
+        "status": "finished" if finished else "running",
+        "languages": batch["languages"],
+        "total": total,
+        "completed": completed,
+        "failed": failed,
+        "cancelled": cancelled,
+        "pending": total - done,
+        "progress": round(100 * done / total, 1) if total else 100.0,
+        "elapsed": round(time.time() - batch["created_at"], 1),
+        "releases": releases,
+    }
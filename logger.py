@@ -1,51 +1,200 @@
+"""
+Structured, non-blocking logging.
+
+Log calls only put the record on a bounded queue (`QueueHandler`); a
+`QueueListener` thread formats it and writes it to stdout and to the buffer
+behind /stream-logs, so a slow terminal or pipe never blocks the event loop.
+When the queue is full, records are dropped and counted instead of blocking.
+
+Records are JSON lines carrying the job context bound with `log_context` /
+`bind_log_context` (job_id, url, language, stage). Set LOG_FORMAT=console for
+the coloured, human-readable format instead.
+"""
+import asyncio
+import atexit
+import contextvars
+import json
 import logging
-import io
+import logging.handlers
+import os
+import queue
 import sys
-import asyncio
-from termcolor import colored
-from fastapi.responses import StreamingResponse
+import threading
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
 
-# Configure logging to display in the terminal
-log_stream = io.StringIO()  # Keeps in-memory log output for streaming
-log_handler = logging.StreamHandler(sys.stdout)  # Log to stdout (console)
-log_handler.setLevel(logging.INFO)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Records waiting for the listener thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Formatted lines kept for /stream-logs
+LOG_BUFFER_LINES = int(os.getenv("LOG_BUFFER_LINES", "1000"))
 
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-log_handler.setFormatter(formatter)
+CONTEXT_FIELDS = ("job_id", "url", "language", "stage")
 
-# Add a StringIO handler for capturing logs to stream
-string_handler = logging.StreamHandler(log_stream)
-string_handler.setLevel(logging.INFO)
-string_handler.setFormatter(formatter)
+_context = contextvars.ContextVar("log_context", default={})
+_state = {"listener": None, "dropped": 0}
+_lock = threading.Lock()
+# (sequence, line) of the latest formatted records
+_lines = deque(maxlen=LOG_BUFFER_LINES)
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-logger.addHandler(log_handler)
-logger.addHandler(string_handler)  # Add the StringIO handler
+
+
+@contextmanager
+def log_context(**fields):
+    """Add fields (job_id, url, language, stage) to every record logged inside the block."""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def bind_log_context(**fields):
+    """Add fields to every record logged by the current task from now on (and the tasks it starts)."""
+    _context.set({**_context.get(), **fields})
+
+
+def current_log_context() -> dict:
+    return _context.get()
+
+
+class _ContextFilter(logging.Filter):
+    """Copy the job context onto the record in the logging thread, before it is queued."""
+
+    def filter(self, record):
+        for field, value in _context.get().items():
+            if value is not None:
+                setattr(record, field, value)
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _state["dropped"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "kind": getattr(record, "kind", None),
+            "message": record.getMessage(),
+        }
+        entry.update((field, getattr(record, field)) for field in CONTEXT_FIELDS if hasattr(record, field))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """Coloured lines with an emoji per kind of message, for development."""
+
+    STYLES = {
+        "step": ("==>", None),
+        "info": ("🔹", "blue"),
+        "success": ("✅", "green"),
+        "warning": ("⚠️", "yellow"),
+        "error": ("❌", "red"),
+    }
+
+    def __init__(self):
+        super().__init__("%(asctime)s - %(levelname)s - %(message)s")
+
+    def formatMessage(self, record):
+        from termcolor import colored
+
+        prefix, color = self.STYLES.get(getattr(record, "kind", None), ("", None))
+        context = " ".join(f"{field}={getattr(record, field)}" for field in ("job_id", "language", "stage") if hasattr(record, field))
+        message = f"{prefix} {record.message}" + (f" [{context}]" if context else "")
+        record.message = colored(message, color) if color else message
+        return super().formatMessage(record)
+
+
+class _BufferHandler(logging.Handler):
+    """Keeps the latest formatted lines for /stream-logs."""
+
+    def __init__(self):
+        super().__init__()
+        self.sequence = 0
+
+    def emit(self, record):
+        self.sequence += 1
+        _lines.append((self.sequence, self.format(record)))
+
+
+def setup_logging(log_format: str = None):
+    """
+    Route records through the queue to stdout and the /stream-logs buffer.
+
+    Called on the first log call; call it earlier to pick a format explicitly.
+
+    Args:
+        log_format (str): 'json' or 'console', LOG_FORMAT by default.
+    """
+    with _lock:
+        if _state["listener"] is not None:
+            return
+        formatter = ConsoleFormatter() if (log_format or LOG_FORMAT) == "console" else JsonFormatter()
+        stdout_handler = logging.StreamHandler(sys.stdout)
+        buffer_handler = _BufferHandler()
+        for handler in (stdout_handler, buffer_handler):
+            handler.setFormatter(formatter)
+
+        queue_handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        queue_handler.addFilter(_ContextFilter())
+        logger.setLevel(LOG_LEVEL)
+        logger.addHandler(queue_handler)
+        logger.propagate = False
+
+        listener = logging.handlers.QueueListener(queue_handler.queue, stdout_handler, buffer_handler)
+        listener.start()
+        _state["listener"] = listener
+    # Write what is still queued when the process exits
+    atexit.register(listener.stop)
+
+
+def _log(level, kind, message):
+    if _state["listener"] is None:
+        setup_logging()
+    if _state["dropped"]:
+        with _lock:
+            dropped, _state["dropped"] = _state["dropped"], 0
+        logger.warning(f"{dropped} log records were dropped, the log queue was full", extra={"kind": "warning"})
+    logger.log(level, message, extra={"kind": kind})
+
 
 # Async function to stream logs
 async def log_generator():
+    """Yield formatted log lines as they are written, starting with the buffered ones."""
+    last = 0
     while True:
-        log_stream.seek(0)  # Go to the beginning of the log buffer
-        logs = log_stream.read()  # Read the content
-        log_stream.truncate(0)  # Clear the buffer after reading
-        if logs:
-            yield logs  # Yield logs to StreamingResponse
+        entries = [(sequence, line) for sequence, line in list(_lines) if sequence > last]
+        if entries:
+            last = entries[-1][0]
+            yield "\n".join(line for _, line in entries) + "\n"
         await asyncio.sleep(0.1)  # Adjust delay for responsiveness
 
-# Log messages with color and emoji
 def log(message: str):
-    logger.info(f"==> {message}")
+    _log(logging.INFO, "step", message)
 
 def log_info(message: str):
-    logger.info(colored(f"🔹 {message}", "blue"))
+    _log(logging.INFO, "info", message)
 
 def log_success(message: str):
-    logger.info(colored(f"✅ {message}", "green"))
+    _log(logging.INFO, "success", message)
 
 def log_warning(message: str):
-    logger.warning(colored(f"⚠️ {message}", "yellow"))
+    _log(logging.WARNING, "warning", message)
 
 def log_error(message: str):
-    logger.error(colored(f"❌ {message}", "red"))
-
+    _log(logging.ERROR, "error", message)
@@ -0,0 +1,191 @@
+"""
+Pipeline metrics in the Prometheus text exposition format, served on /metrics.
+
+Stages observe their duration into histograms, caches and retries count into
+counters, and gauges such as queue depth are read from the scheduler when
+the endpoint is scraped. Every process keeps its own metrics: API processes
+serve them on /metrics, queue workers on the port given by
+WORKER_METRICS_PORT (see `start_server`), and Prometheus aggregates across
+the fleet.
+
+Usage:
+    with metrics.stage_seconds.time(stage="summarize"):
+        ...
+    metrics.cache_hits.inc(cache="response")
+"""
+import asyncio
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds, from a cached lookup to a long render
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200)
+
+_lock = threading.Lock()
+_registry = []
+# Called before every exposition, to refresh gauges from their source
+_collectors = []
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_labels(names, values)} {_number(value)}"
+                     for name, values, value, names in self._iter_samples())
+        return "\n".join(lines)
+
+    def _iter_samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, key, value, self.labelnames
+
+
+class Counter(Metric):
+    """Monotonic count, e.g. cache hits."""
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Current value, e.g. queue depth."""
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        with _lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Distribution of observations in cumulative buckets, e.g. stage durations."""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with _lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds, whether or not it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _iter_samples(self):
+        names = self.labelnames + ("le",)
+        for key, (counts, total) in sorted(self._values.items()):
+            for bound, count in zip(self.buckets, counts):
+                yield f"{self.name}_bucket", key + (_number(bound),), count, names
+            yield f"{self.name}_sum", key, total, self.labelnames
+            yield f"{self.name}_count", key, counts[-1], self.labelnames
+
+
+def register_collector(collect):
+    """Run `collect()` before every exposition, e.g. to set gauges from scheduler stats."""
+    _collectors.append(collect)
+
+
+def count_lookup(cache: str, hit: bool):
+    """Count a cache lookup as a hit or a miss."""
+    (cache_hits if hit else cache_misses).inc(cache=cache)
+
+
+def exposition() -> str:
+    """Every metric in the Prometheus text format (version 0.0.4)."""
+    for collect in _collectors:
+        collect()
+    with _lock:
+        return "\n".join(metric.expose() for metric in _registry) + "\n"
+
+
+async def start_server(port: int, host: str = "0.0.0.0"):
+    """
+    Serve `exposition()` on GET /metrics, for processes without an HTTP API.
+
+    Args:
+        port (int): Port to listen on.
+        host (str): Interface to bind.
+
+    Returns:
+        asyncio.Server: Close it on shutdown.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            # Skip the headers, the request has no body
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+                status, body = "200 OK", exposition().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("ascii") + body
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# Pipeline stages: scrape, summarize, image_search, tts, image_download, render
+stage_seconds = Histogram("ttv_stage_seconds", "Duration of a pipeline stage.", ["stage"])
+translate_seconds = Histogram("ttv_translate_seconds", "Translation, narration and render of one language.", ["language"])
+translate_sentences = Histogram("ttv_translate_sentences", "Sentences per translated text.", ["language"],
+                                buckets=(1, 2, 5, 10, 20, 50, 100, 200))
+translate_tokens_per_second = Histogram("ttv_translate_tokens_per_second", "Generated tokens per second of a model batch.",
+                                        ["language"], buckets=(5, 10, 25, 50, 100, 250, 500, 1000, 2500))
+tts_seconds = Histogram("ttv_tts_seconds", "Speech synthesis of one narration.", ["language", "backend"])
+render_fps = Histogram("ttv_render_fps", "Encoded frames per second of a render.", buckets=(1, 2, 5, 10, 20, 30, 60, 120, 240))
+
+cache_hits = Counter("ttv_cache_hits_total", "Lookups answered from a cache.", ["cache"])
+cache_misses = Counter("ttv_cache_misses_total", "Lookups a cache could not answer.", ["cache"])
+retries = Counter("ttv_retries_total", "Retried operations.", ["operation"])
+failures = Counter("ttv_failures_total", "Failed stages and languages.", ["stage"])
+
+queue_depth = Gauge("ttv_queue_depth", "Jobs waiting for a slot of a resource class.", ["resource"])
+in_flight = Gauge("ttv_in_flight_jobs", "Jobs holding a slot of a resource class.", ["resource"])
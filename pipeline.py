@@ -0,0 +1,144 @@
+import asyncio
+import uuid
+
+# User-defined modules
+from scrap.scrap import scrape_press_release
+from scrap.refresh import refresh_press_release
+from translate.translate import translate
+from logger import log_info, log_success, log_warning, bind_log_context, current_log_context
+from utils import emit_event
+from scheduler import set_priority, slot
+import response_cache
+import metrics
+import jobs
+
+# Jobs running in this process by ID, until they finish
+running_jobs = {}
+
+
+async def text_to_video(url: str, refresh: bool = False, on_event=None, languages=None, job_priority=None):
+    """
+    Run the full pipeline for one press release: scrape, summarize, render the
+    English video, then translate and render every target language.
+
+    Args:
+        url (str): PIB press release URL.
+        refresh (bool): Re-fetch an already scraped release and re-run the stages
+            whose inputs changed on PIB since it was scraped.
+        on_event (callable): Receives progress events: 'stage' for each English
+            stage, then 'language' as English and each translation complete.
+        languages (list): Target languages to translate, all by default.
+        job_priority (tuple): Scheduling priority (see `scheduler.new_priority`),
+            by default the time of this call, so earlier releases finish first.
+
+    Returns:
+        dict: `_id` of the release and the per-language results.
+    """
+    # Every record logged for this job carries its ID and URL; batches set their own ID
+    bind_log_context(job_id=current_log_context().get("job_id") or uuid.uuid4().hex[:12], url=url)
+    if not refresh:
+        cached = response_cache.get(url)
+        metrics.count_lookup("response", cached is not None)
+        if cached is not None:
+            log_info(f"Serving cached result: {url}")
+            return cached_result(cached, on_event, languages)
+
+    set_priority(job_priority)
+
+    async with slot("release"):
+        if refresh:
+            await refresh_press_release(url)
+
+        # Scrape the press release
+        press_release = await scrape_press_release(url, on_event)
+
+    _id = press_release["_id"]
+    title = press_release["translations"]["english"]["title"]
+    summary = press_release["translations"]["english"]["summary"]
+    content = press_release["translations"]["english"]["content"]
+    ministry = press_release["translations"]["english"]["ministry"]
+    video = press_release["translations"]["english"]["video"]
+    images = press_release["images"]
+
+    log_success(f"Scraped press release titled: {title}")
+    emit_event(on_event, "language", lang="english", status="completed", video=video)
+
+    # Translate the content
+    log_info(f"Starting translation for Press Release titled: {title}")
+
+    result = await translate(
+        _id=_id,
+        images=images,
+        title=title,
+        summary=summary,
+        content=content,
+        ministry=ministry,
+        on_event=on_event,
+        languages=languages
+    )
+
+    result.append(
+        {
+            "lang": 'english',
+            "video": video,
+            "status": "completed",
+        }
+    )
+    log_success(f"Translation completed for: {title}")
+
+    output = {"_id": _id, "result": result}
+    if languages is None and all(isinstance(item, dict) and item.get("status") == "completed" for item in result):
+        # Cache what the database holds now: a concurrent refresh may have replaced
+        # the English video this job read when its scrape finished
+        await asyncio.to_thread(jobs.read_completed_result, url)
+    return output
+
+
+def start_job(work, job_id: str = None):
+    """
+    Run a job in its own task, so it can be aborted with `cancel_job`.
+
+    Args:
+        work (coroutine): The job, e.g. `text_to_video(url)`.
+        job_id (str): ID of the job, a new one by default.
+
+    Returns:
+        tuple: Job ID and task.
+    """
+    job_id = job_id or uuid.uuid4().hex[:12]
+
+    async def run():
+        bind_log_context(job_id=job_id)
+        return await work
+
+    task = asyncio.create_task(run())
+    running_jobs[job_id] = task
+    task.add_done_callback(lambda _: running_jobs.pop(job_id, None))
+    return job_id, task
+
+
+def cancel_job(job_id: str) -> bool:
+    """
+    Cancel a running job. Work shared with other jobs keeps running for them.
+
+    Returns:
+        bool: False if no such job is running.
+    """
+    task = running_jobs.get(job_id)
+    if task is None:
+        return False
+    log_warning(f"Cancelling job {job_id}")
+    task.cancel()
+    return True
+
+
+def cached_result(cached, on_event=None, languages=None):
+    """Answer from a cached completed result, limited to `languages` plus English."""
+    wanted = None if languages is None else {"english", *languages}
+    result = []
+    for item in cached["result"]:
+        lang = item.get("lang") or item.get("language")
+        if wanted is None or lang in wanted:
+            result.append(item)
+            emit_event(on_event, "language", lang=lang, status=item["status"], video=item.get("video"))
+    return {"_id": cached["_id"], "result": result}
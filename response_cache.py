@@ -0,0 +1,158 @@
+"""
+Read-through cache of completed text-to-video results, keyed by release URL.
+
+A finished release always answers the same thing, yet building the answer
+costs one query for the release plus one per language. Completed results are
+kept in an in-process LRU and, when RESPONSE_CACHE_DB is set, in a local
+SQLite file shared by every worker process on the host.
+
+database/db.py invalidates the entry of a release on every write to it, by URL
+or by document ID.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Optional SQLite file shared by the processes of this host, e.g. "output/response_cache.sqlite"
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB") or None
+
+_lock = threading.Lock()
+# url -> (stored_at, result)
+_entries = OrderedDict()
+# release _id -> url, to invalidate on writes that only know the ID
+_urls_by_id = {}
+_store = {"connection": None}
+# Sequence number of the last invalidation, and of the last one of each
+# ("url", url) / ("id", release_id), so a result read before a write to its
+# release is not cached. Older marks are pruned below `floor`.
+_generation = {"value": 0, "floor": 0}
+_invalidated = OrderedDict()
+
+
+def _db():
+    if RESPONSE_CACHE_DB is None:
+        return None
+    if _store["connection"] is None:
+        connection = sqlite3.connect(RESPONSE_CACHE_DB, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(url TEXT PRIMARY KEY, release_id TEXT, stored_at REAL, payload TEXT)"
+        )
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_release_id ON responses (release_id)")
+        _store["connection"] = connection
+    return _store["connection"]
+
+
+def _remember(url, stored_at, result):
+    _entries[url] = (stored_at, result)
+    _entries.move_to_end(url)
+    _urls_by_id[str(result["_id"])] = url
+    while len(_entries) > RESPONSE_CACHE_SIZE:
+        old_url, (_, old_result) = _entries.popitem(last=False)
+        _urls_by_id.pop(str(old_result["_id"]), None)
+
+
+def get(url: str):
+    """
+    Cached result of a completed release.
+
+    Returns:
+        dict: `_id` and per-language `result`, or None on a miss.
+    """
+    with _lock:
+        entry = _entries.get(url)
+        db = _db()
+        if db is None:
+            if entry is None:
+                return None
+            _entries.move_to_end(url)
+            return entry[1]
+
+        # The shared store is authoritative: another process may have invalidated the entry
+        row = db.execute("SELECT stored_at, payload FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            if entry is not None:
+                del _entries[url]
+            return None
+        if entry is not None and entry[0] == row[0]:
+            _entries.move_to_end(url)
+            return entry[1]
+        result = json.loads(row[1])
+        _remember(url, row[0], result)
+        return result
+
+
+def shared() -> bool:
+    """Whether results are kept in the SQLite store that other processes of the host invalidate."""
+    return RESPONSE_CACHE_DB is not None
+
+
+def generation() -> int:
+    """Current invalidation generation, read right before the reads of a result to `put`."""
+    with _lock:
+        return _generation["value"]
+
+
+def _written_since(url: str, release_id, since: int) -> bool:
+    if since < _generation["floor"]:
+        return True
+    return max(_invalidated.get(("url", url), 0), _invalidated.get(("id", str(release_id)), 0)) > since
+
+
+def _mark(key, value: int):
+    _invalidated[key] = value
+    _invalidated.move_to_end(key)
+    while len(_invalidated) > RESPONSE_CACHE_SIZE:
+        _, oldest = _invalidated.popitem(last=False)
+        _generation["floor"] = max(_generation["floor"], oldest)
+
+
+def put(url: str, result: dict, since: int = None):
+    """
+    Cache the result of a release whose every language is completed.
+
+    Args:
+        url (str): Release URL.
+        result (dict): `_id` and per-language `result`.
+        since (int): `generation()` before the result was read; nothing is
+            cached if this release was written to in the meantime.
+    """
+    stored_at = time.time()
+    with _lock:
+        if since is not None and _written_since(url, result["_id"], since):
+            return
+        _remember(url, stored_at, result)
+        db = _db()
+        if db is not None:
+            db.execute(
+                "INSERT OR REPLACE INTO responses (url, release_id, stored_at, payload) VALUES (?, ?, ?, ?)",
+                (url, str(result["_id"]), stored_at, json.dumps(result, default=str)),
+            )
+
+
+def invalidate(url: str = None, release_id=None):
+    """Drop the cached result of a release, by URL or document ID."""
+    with _lock:
+        _generation["value"] += 1
+        if release_id is not None:
+            _mark(("id", str(release_id)), _generation["value"])
+        if url is None and release_id is not None:
+            url = _urls_by_id.get(str(release_id))
+        if url is not None:
+            _mark(("url", url), _generation["value"])
+        if url is not None:
+            entry = _entries.pop(url, None)
+            if entry is not None:
+                _urls_by_id.pop(str(entry[1]["_id"]), None)
+
+        db = _db()
+        if db is not None:
+            if url is not None:
+                db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            if release_id is not None:
+                db.execute("DELETE FROM responses WHERE release_id = ?", (str(release_id),))
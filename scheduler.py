@@ -0,0 +1,276 @@
+"""
+Host-wide scheduling of pipeline work by resource class.
+
+Jobs hold a slot of a job class while they run:
+
+- release: English pipelines (scrape, summary, narration, image search, render)
+- translation: translate, narrate and render one language
+
+and each stage takes a slot of the resource it is bound by:
+
+- inference: IndicTrans2 and Piper models (memory and compute bound, in worker threads)
+- network: edge-tts, OpenAI and Google search requests
+- render: x264 encoding and HLS packaging (CPU bound, in worker threads)
+
+Every class has its own concurrency limit and queue limit. The API calls
+`admit` before accepting a job and answers 429 with Retry-After while a queue
+is full, instead of accepting work the host can only thrash on.
+
+Blocking work run with `run_in_thread` is cancellable: when the awaiting task
+is cancelled, the function is asked to stop at its next `check_cancelled`
+and keeps its slot until it does, so a freed slot means freed CPU.
+"""
+import asyncio
+import contextvars
+import functools
+import heapq
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+# User defined modules
+import metrics
+from tracing import span
+
+# Concurrent slots per resource class, shared by every request, batch and script in the process
+LIMITS = {
+    "release": int(os.getenv("MAX_CONCURRENT_RELEASES", "2")),
+    "translation": int(os.getenv("MAX_CONCURRENT_TRANSLATIONS", "3")),
+    "inference": int(os.getenv("MAX_CONCURRENT_INFERENCE", "1")),
+    "network": int(os.getenv("MAX_CONCURRENT_NETWORK", "16")),
+    "render": int(os.getenv("MAX_CONCURRENT_RENDERS", str(max((os.cpu_count() or 2) // 4, 1)))),
+}
+
+# Waiting jobs per class before new jobs are refused, 0 for no limit
+QUEUE_LIMITS = {
+    "release": int(os.getenv("RELEASE_QUEUE_LIMIT", "20")),
+    "translation": int(os.getenv("TRANSLATION_QUEUE_LIMIT", "60")),
+    "inference": int(os.getenv("INFERENCE_QUEUE_LIMIT", "40")),
+    "network": int(os.getenv("NETWORK_QUEUE_LIMIT", "200")),
+    "render": int(os.getenv("RENDER_QUEUE_LIMIT", "20")),
+}
+
+# Weight of the latest sample in the moving averages of wait and hold times
+EWMA_WEIGHT = 0.2
+
+# Priority of the work running in the current task; lower runs first. Set once
+# per release, so its languages share it and gather'ed subtasks inherit it.
+priority = contextvars.ContextVar("priority", default=None)
+_sequence = itertools.count()
+# Set once the task awaiting the worker thread is cancelled, see `check_cancelled`
+_cancel_event = contextvars.ContextVar("cancel_event", default=None)
+
+
+class Overloaded(Exception):
+    """A resource class queue is full; retry after `retry_after` seconds."""
+
+    def __init__(self, resource: str, retry_after: int):
+        super().__init__(f"The '{resource}' queue is full, retry in {retry_after}s")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+class Cancelled(Exception):
+    """Raised in a worker thread by `check_cancelled` once its caller was cancelled."""
+
+
+class PriorityLimiter:
+    """
+    Semaphore that hands free slots to the waiter with the lowest priority.
+
+    Releases are prioritized by when they were submitted, so the languages of
+    an older release run before those of a newer one: each release finishes as
+    early as possible instead of every release progressing slowly at once.
+    Queue wait and slot hold times are tracked for `stats` and `Retry-After`.
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: int = 0):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.active = 0
+        self.completed = 0
+        self.wait_avg = 0.0
+        self.wait_max = 0.0
+        self.hold_avg = 0.0
+        self._waiters = []
+        self._sequence = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    def _record(self, attribute: str, seconds: float):
+        average = getattr(self, attribute)
+        setattr(self, attribute, seconds if not average else average + EWMA_WEIGHT * (seconds - average))
+
+    async def acquire(self, job_priority=None):
+        started = time.monotonic()
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (job_priority or current_priority(), next(self._sequence), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just before the cancellation
+                    self.release()
+                raise
+
+        waited = time.monotonic() - started
+        self._record("wait_avg", waited)
+        self.wait_max = max(self.wait_max, waited)
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # The slot passes straight to the waiter, `active` is unchanged
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, job_priority=None):
+        with span(f"wait.{self.name}"):
+            await self.acquire(job_priority)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.completed += 1
+            self._record("hold_avg", time.monotonic() - started)
+            self.release()
+
+    def is_full(self, incoming: int = 1) -> bool:
+        # An empty queue always admits, so a batch larger than the limit is not refused forever
+        return bool(self.max_waiting) and self.waiting > 0 and self.waiting + incoming > self.max_waiting
+
+    def retry_after(self) -> int:
+        """Seconds until the queue should have room, from the average slot hold time."""
+        excess = max(self.waiting - self.max_waiting + 1, 1)
+        return max(math.ceil(self.hold_avg * excess / self.limit), 1)
+
+
+limiters = {name: PriorityLimiter(name, limit, QUEUE_LIMITS.get(name, 0)) for name, limit in LIMITS.items()}
+
+
+def current_priority():
+    """Priority of the current task, or a new one ordering it after everything already queued."""
+    return priority.get() or new_priority()
+
+
+def new_priority(submitted_at: float = None):
+    """Priority of work submitted at `submitted_at` (now by default), FIFO among equal times."""
+    return (submitted_at if submitted_at is not None else time.monotonic(), next(_sequence))
+
+
+def set_priority(job_priority=None):
+    """Give the current task (and the tasks it starts) a priority, a new one by default."""
+    job_priority = job_priority or new_priority()
+    priority.set(job_priority)
+    return job_priority
+
+
+def slot(resource: str):
+    """
+    Wait for a host-wide slot of a resource class.
+
+    Usage:
+        async with slot("network"):
+            ...
+    """
+    return limiters[resource].slot(priority.get())
+
+
+def cancel_requested() -> bool:
+    """Whether the task awaiting the current worker thread was cancelled."""
+    event = _cancel_event.get()
+    return event is not None and event.is_set()
+
+
+def check_cancelled():
+    """
+    Stop blocking work whose caller was cancelled; call it between units of work.
+
+    A no-op outside of `run_cancellable` threads.
+
+    Raises:
+        Cancelled: The task awaiting this thread was cancelled.
+    """
+    if cancel_requested():
+        raise Cancelled()
+
+
+async def run_cancellable(func, *args):
+    """
+    Run a blocking function in a worker thread, like `asyncio.to_thread`.
+
+    If the calling task is cancelled, `check_cancelled` raises in the thread
+    and the cancellation is only propagated once the thread returned.
+    """
+    cancelled = threading.Event()
+    context = contextvars.copy_context()
+    context.run(_cancel_event.set, cancelled)
+    future = asyncio.get_running_loop().run_in_executor(None, functools.partial(context.run, func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancelled.set()
+        try:
+            await future
+        except BaseException:
+            pass
+        raise
+
+
+async def run_in_thread(resource: str, func, *args):
+    """Run a blocking function in a worker thread once a slot of `resource` is free (see `run_cancellable`)."""
+    async with slot(resource):
+        return await run_cancellable(func, *args)
+
+
+def admit(releases: int = 1):
+    """
+    Admission control for new jobs.
+
+    Args:
+        releases (int): Releases the job will queue.
+
+    Raises:
+        Overloaded: A resource class has no room left in its queue.
+    """
+    for name, limiter in limiters.items():
+        if limiter.is_full(releases if name == "release" else 1):
+            raise Overloaded(name, limiter.retry_after())
+
+
+def stats():
+    """Limits, queue depth and wait times per resource class."""
+    return {
+        name: {
+            "limit": limiter.limit,
+            "active": limiter.active,
+            "waiting": limiter.waiting,
+            "queue_limit": limiter.max_waiting,
+            "completed": limiter.completed,
+            "wait_seconds_avg": round(limiter.wait_avg, 3),
+            "wait_seconds_max": round(limiter.wait_max, 3),
+            "hold_seconds_avg": round(limiter.hold_avg, 3),
+        }
+        for name, limiter in limiters.items()
+    }
+
+
+def _collect_metrics():
+    for name, limiter in limiters.items():
+        metrics.queue_depth.set(limiter.waiting, resource=name)
+        metrics.in_flight.set(limiter.active, resource=name)
+
+
+metrics.register_collector(_collect_metrics)
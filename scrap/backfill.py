@@ -0,0 +1,193 @@
+"""
+Backfill press releases for a date range.
+
+Lists releases from allRel.aspx for every (date, ministry) pair, drops the ones
+already stored in MongoDB and runs the text-to-video pipeline for the rest.
+Progress is saved after every step, so an interrupted run resumes where it
+stopped when started again with the same progress file.
+
+Usage:
+    python -m scrap.backfill --start 2025-01-01 --end 2025-01-31
+    python -m scrap.backfill --start 2025-01-01 --end 2025-01-31 --ministries 3 15 --list-only
+"""
+import argparse
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+# User defined modules
+from scrap.scrap import get_press_releases
+from database.db import find_scraped_urls, flush_writes
+from pipeline import text_to_video
+from summarize.summarize import set_summarizer, SUMMARIZER_MODES
+from logger import log_info, log_warning, log_error, log_success
+from utils import RateLimiter
+
+DEFAULT_PROGRESS_FILE = "backfill_progress.json"
+
+
+def load_progress(path):
+    """Load the progress file, or start a fresh one."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            progress = json.load(file)
+        log_info(f"Resuming backfill from {path}")
+    else:
+        progress = {}
+    progress.setdefault("listed", {})
+    progress.setdefault("done", [])
+    progress.setdefault("failed", {})
+    return progress
+
+
+def save_progress(path, progress):
+    """Atomically write the progress file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(progress, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def date_range(start, end):
+    """Yield every date from start to end, inclusive."""
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+async def list_releases(dates, ministries, progress, limiter, concurrency, save):
+    """
+    List releases for every (date, ministry) pair not listed yet.
+
+    Returns:
+        list: Release URLs found across the whole range, including earlier runs.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def list_one(date, ministry_id):
+        key = f"{date.strftime('%Y-%m-%d')}|{ministry_id}"
+        if key in progress["listed"]:
+            return
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                releases = await get_press_releases(date, ministry_id, raise_errors=True)
+            except Exception as e:
+                log_warning(f"Listing {key} failed, it will be retried on the next run: {e}")
+                return
+        progress["listed"][key] = [release["url"] for release in releases]
+        save()
+
+    await asyncio.gather(*(list_one(date, ministry_id) for date in dates for ministry_id in ministries))
+
+    urls = {}
+    for listed in progress["listed"].values():
+        urls.update(dict.fromkeys(listed))
+    return list(urls)
+
+
+async def process_releases(urls, progress, limiter, workers, save):
+    """Run the text-to-video pipeline for queued URLs with a fixed worker pool."""
+    queue = asyncio.Queue()
+    for url in urls:
+        queue.put_nowait(url)
+
+    async def worker():
+        while True:
+            try:
+                url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await limiter.acquire()
+            try:
+                await text_to_video(url)
+                progress["done"].append(url)
+                progress["failed"].pop(url, None)
+                log_success(f"Backfilled {url} ({len(progress['done'])} done, {queue.qsize()} queued)")
+            except Exception as e:
+                progress["failed"][url] = str(e)
+                log_error(f"Backfill failed for {url}: {e}")
+            save()
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def backfill(start, end, ministries, progress_file=DEFAULT_PROGRESS_FILE, rate=1.0,
+                   list_concurrency=4, workers=2, list_only=False):
+    """
+    Backfill all press releases between two dates.
+
+    Args:
+        start (datetime): First date.
+        end (datetime): Last date (inclusive).
+        ministries (list): allRel.aspx ministry ids, '0' for all ministries.
+        progress_file (str): Path of the resumable progress file.
+        rate (float): Maximum requests per second sent to pib.gov.in.
+        list_concurrency (int): Listing requests in flight at once.
+        workers (int): Releases processed at once.
+        list_only (bool): Only list and dedupe, do not process.
+
+    Returns:
+        dict: Final progress state.
+    """
+    progress = load_progress(progress_file)
+    limiter = RateLimiter(rate)
+
+    def save():
+        save_progress(progress_file, progress)
+
+    urls = await list_releases(list(date_range(start, end)), ministries, progress, limiter, list_concurrency, save)
+    log_info(f"Listed {len(urls)} releases between {start:%Y-%m-%d} and {end:%Y-%m-%d}")
+
+    done = set(progress["done"])
+    pending = [url for url in urls if url not in done]
+    already_scraped = find_scraped_urls(pending) if pending else set()
+    unseen = [url for url in pending if url not in already_scraped]
+    log_info(f"{len(unseen)} unseen releases queued, {len(already_scraped)} already in database")
+
+    if list_only:
+        return progress
+
+    await process_releases(unseen, progress, limiter, workers, save)
+    await flush_writes()
+
+    if progress["failed"]:
+        log_warning(f"{len(progress['failed'])} releases failed, re-run to retry them")
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--start", required=True, type=lambda s: datetime.strptime(s, "%Y-%m-%d"), help="First date (YYYY-MM-DD)")
+    parser.add_argument("--end", required=True, type=lambda s: datetime.strptime(s, "%Y-%m-%d"), help="Last date, inclusive (YYYY-MM-DD)")
+    parser.add_argument("--ministries", nargs="+", default=["0"], help="Ministry ids, 0 for all")
+    parser.add_argument("--progress-file", default=DEFAULT_PROGRESS_FILE)
+    parser.add_argument("--rate", type=float, default=1.0, help="Max requests per second to pib.gov.in")
+    parser.add_argument("--list-concurrency", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--list-only", action="store_true", help="List and dedupe without processing")
+    parser.add_argument("--summarizer", choices=SUMMARIZER_MODES, default="extractive",
+                        help="Summarizer for the backfill (default: local extractive)")
+    args = parser.parse_args()
+
+    set_summarizer(args.summarizer)
+
+    if args.end < args.start:
+        parser.error("--end must not be before --start")
+
+    asyncio.run(backfill(
+        args.start,
+        args.end,
+        args.ministries,
+        progress_file=args.progress_file,
+        rate=args.rate,
+        list_concurrency=args.list_concurrency,
+        workers=args.workers,
+        list_only=args.list_only,
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark PIB page extraction and check it matches the BeautifulSoup selectors.
+
+Compares `scrap.extract` against the original html.parser/CSS-selector code on
+the saved pages in scrap/fixtures (or any pages given on the command line) and
+exits non-zero if any extracted value differs.
+
+Usage:
+    python -m scrap.benchmark_extract --runs 200
+    python -m scrap.benchmark_extract saved_release.html --runs 50
+"""
+import argparse
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+# User defined modules
+from scrap.extract import txt_cleaner, extract_press_release, extract_hidden_inputs, extract_release_listing
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def soup_press_release(page):
+    """Reference implementation: the selectors scrape_press_release used before."""
+    soup = BeautifulSoup(page, 'html.parser')
+    content = txt_cleaner(' '.join([p.get_text() for p in soup.select('.innner-page-main-about-us-content-right-part p')]))
+    title = txt_cleaner(soup.select_one('div h2').get_text() if soup.select_one('div h2') else 'No Title')
+    date_posted = txt_cleaner(soup.select_one('div.ReleaseDateSubHeaddateTime').get_text() if soup.select_one('div.ReleaseDateSubHeaddateTime') else 'No Date Provided')
+    ministry = txt_cleaner(soup.select_one('div.MinistryNameSubhead').get_text() if soup.select_one('div.MinistryNameSubhead') else 'No Ministry Provided')
+    img_src = [img.get('src') for img in soup.select('div.innner-page-main-about-us-content-right-part img')] or None
+    iframe_src = [a['href'] for a in soup.select('div.innner-page-main-about-us-content-right-part blockquote.twitter-tweet a[href]')]
+    return {
+        'title': title,
+        'date_posted': date_posted,
+        'ministry': ministry,
+        'content': content,
+        'images': img_src,
+        'tweets': [src for src in iframe_src if src.startswith('https://t.co/')],
+    }
+
+
+def soup_hidden_inputs(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    return {tag.get('name'): tag.get('value', '') for tag in soup.find_all('input', type='hidden') if tag.get('name')}
+
+
+def soup_release_listing(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    content_area = soup.find('div', class_='content-area')
+    if not content_area:
+        return None
+    releases = []
+    for ul in content_area.find_all('ul'):
+        ministry_header = ul.find('h3', class_='font104')
+        if ministry_header:
+            for li in ul.find_all('li'):
+                a_tag = li.find('a', href=True)
+                if a_tag:
+                    releases.append((a_tag.text.strip(), a_tag['href'], ministry_header.text.strip()))
+    return releases
+
+
+PAIRS = {
+    "press_release": (soup_press_release, extract_press_release),
+    "hidden_inputs": (soup_hidden_inputs, extract_hidden_inputs),
+    "release_listing": (soup_release_listing, extract_release_listing),
+}
+
+
+def timed(func, page, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        func(page)
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="*", help="HTML files (default: every fixture)")
+    parser.add_argument("--runs", type=int, default=100)
+    args = parser.parse_args()
+
+    pages = args.pages or sorted(
+        os.path.join(FIXTURES_DIR, name) for name in os.listdir(FIXTURES_DIR) if name.endswith(".html")
+    )
+
+    mismatches = 0
+    print(f"{'page':<24} {'extractor':<16} {'bs4 (ms)':>9} {'lxml (ms)':>10} {'speedup':>8}  parity")
+    for path in pages:
+        with open(path, "rb") as file:
+            page = file.read()
+        for name, (reference, fast) in PAIRS.items():
+            same = reference(page) == fast(page)
+            mismatches += not same
+            slow_ms = timed(reference, page, args.runs)
+            fast_ms = timed(fast, page, args.runs)
+            print(f"{os.path.basename(path):<24} {name:<16} {slow_ms:>9.3f} {fast_ms:>10.3f} {slow_ms / fast_ms:>7.1f}x  {'ok' if same else 'MISMATCH'}")
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Targeted HTML extraction for PIB pages.
+
+Pages are parsed with lxml's C parser and every selector is a precompiled XPath
+evaluated once per page. Press release fields that live in the article body are
+looked up inside the content region only. The extracted values are identical to
+what the previous BeautifulSoup/html.parser selectors produced; run
+`python -m scrap.benchmark_extract` to check parity and timings on the fixtures.
+"""
+import re
+
+from lxml import etree, html as lxml_html
+
+
+def txt_cleaner(txt):
+    """
+    Cleans up text by removing extra whitespace, new lines, and carriage returns.
+
+    Args:
+    - txt (str): The text to be cleaned.
+
+    Returns:
+    - str: The cleaned text.
+    """
+    if txt:
+        cleaned_string = txt.strip()
+        cleaned_string = re.sub(r'\s+', ' ', cleaned_string)
+        return cleaned_string
+    return ''
+
+
+def _has_class(name):
+    """XPath predicate matching a single CSS class token."""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+CONTENT_REGION = etree.XPath(f"//*[{_has_class('innner-page-main-about-us-content-right-part')}]")
+TITLE = etree.XPath("(//div//h2)[1]")
+DATE_POSTED = etree.XPath(f"(//div[{_has_class('ReleaseDateSubHeaddateTime')}])[1]")
+MINISTRY = etree.XPath(f"(//div[{_has_class('MinistryNameSubhead')}])[1]")
+PARAGRAPHS = etree.XPath(".//p")
+IMAGES = etree.XPath(".//img")
+TWEET_LINKS = etree.XPath(f".//blockquote[{_has_class('twitter-tweet')}]//a[@href]")
+# Same strings as BeautifulSoup's get_text(): skips script/style/template contents and comments
+TEXT = etree.XPath(".//text()[not(ancestor::script) and not(ancestor::style) and not(ancestor::template)]")
+
+HIDDEN_INPUTS = etree.XPath("//input[@type='hidden']")
+LISTING_AREA = etree.XPath(f"(//div[{_has_class('content-area')}])[1]")
+LISTING_GROUPS = etree.XPath(".//ul")
+MINISTRY_HEADER = etree.XPath(f"(.//h3[{_has_class('font104')}])[1]")
+LIST_ITEMS = etree.XPath(".//li")
+ITEM_LINK = etree.XPath("(.//a[@href])[1]")
+
+XML_DECLARATION = re.compile(r'^\s*<\?xml[^>]*\?>')
+
+
+def parse_html(page):
+    """
+    Parse an HTML page with lxml.
+
+    Args:
+        page (bytes or str): Raw page; bytes are decoded as UTF-8 when possible.
+
+    Returns:
+        lxml.html.HtmlElement: Document root.
+    """
+    if isinstance(page, bytes):
+        try:
+            page = page.decode('utf-8')
+        except UnicodeDecodeError:
+            # Let lxml honour the charset declared in the page
+            return lxml_html.document_fromstring(page)
+    # lxml refuses str input that still carries an encoding declaration
+    return lxml_html.document_fromstring(XML_DECLARATION.sub('', page, count=1))
+
+
+def get_text(element):
+    return ''.join(TEXT(element))
+
+
+def _first_text(xpath, root, default):
+    matches = xpath(root)
+    return get_text(matches[0]) if matches else default
+
+
+def _in_regions(xpath, regions, div_only=False):
+    """Evaluate a relative XPath in every content region, keeping document order."""
+    seen = set()
+    found = []
+    for region in regions:
+        if div_only and region.tag != 'div':
+            continue
+        for element in xpath(region):
+            if element not in seen:
+                seen.add(element)
+                found.append(element)
+    return found
+
+
+def extract_press_release(page):
+    """
+    Extract the fields of a press release page.
+
+    Args:
+        page (bytes or str): Raw HTML of a PressReleasePage.aspx page.
+
+    Returns:
+        dict: `title`, `date_posted`, `ministry`, `content`, `images` (list of
+        image sources or None) and `tweets` (t.co links of embedded tweets).
+    """
+    root = parse_html(page)
+    regions = CONTENT_REGION(root)
+
+    content = txt_cleaner(' '.join(get_text(p) for p in _in_regions(PARAGRAPHS, regions)))
+    title = txt_cleaner(_first_text(TITLE, root, 'No Title'))
+    date_posted = txt_cleaner(_first_text(DATE_POSTED, root, 'No Date Provided'))
+    ministry = txt_cleaner(_first_text(MINISTRY, root, 'No Ministry Provided'))
+
+    images = [img.get('src') for img in _in_regions(IMAGES, regions, div_only=True)] or None
+    tweet_hrefs = [a.get('href') for a in _in_regions(TWEET_LINKS, regions, div_only=True)]
+
+    return {
+        'title': title,
+        'date_posted': date_posted,
+        'ministry': ministry,
+        'content': content,
+        'images': images,
+        'tweets': [href for href in tweet_hrefs if href.startswith('https://t.co/')],
+    }
+
+
+def extract_hidden_inputs(page):
+    """
+    Extract the hidden ASP.NET form fields (__VIEWSTATE, __EVENTVALIDATION, ...).
+
+    Returns:
+        dict: Field name to value.
+    """
+    form_data = {}
+    for input_tag in HIDDEN_INPUTS(parse_html(page)):
+        name = input_tag.get('name')
+        if name:
+            form_data[name] = input_tag.get('value', '')
+    return form_data
+
+
+def extract_release_listing(page):
+    """
+    Extract release links from an allRel.aspx listing page.
+
+    Returns:
+        list: `(title, href, ministry)` tuples, or None if the page has no content area.
+    """
+    areas = LISTING_AREA(parse_html(page))
+    if not areas:
+        return None
+
+    releases = []
+    for ul in LISTING_GROUPS(areas[0]):
+        headers = MINISTRY_HEADER(ul)
+        if not headers:
+            continue
+        ministry_name = get_text(headers[0]).strip()
+        for li in LIST_ITEMS(ul):
+            links = ITEM_LINK(li)
+            if links:
+                releases.append((get_text(links[0]).strip(), links[0].get('href'), ministry_name))
+    return releases
@@ -0,0 +1,174 @@
+"""
+Refresh already-scraped press releases that PIB corrected after publication.
+
+Pages are re-fetched with If-None-Match / If-Modified-Since, so an unchanged
+release usually costs a single 304 response. When the page did change, the
+hashes of the extracted title, content and ministry decide which stages run:
+
+- content: summary, image search, narration, renders and every translation
+- ministry: ministry translations and all renders (the header image)
+- title: title translations only
+
+Usage:
+    python -m scrap.refresh https://pib.gov.in/PressReleasePage.aspx?PRID=2096307
+    python -m scrap.refresh --sweep --older-than 24 --concurrency 8 --rate 2
+"""
+import argparse
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+# User defined modules
+from scrap.scrap import fetch_press_release, process_press_release, page_hashes
+from database.db import get_release_validators, iter_release_validators, update_release_fields, is_url_scraped, flush_writes
+from translate.translate import translate, refresh_translation
+from scheduler import slot
+from video.create_video import create_video, delete_images
+from logger import log_info, log_warning, log_error, log_success
+from utils import RateLimiter, convert_object_ids
+
+
+def artifact_paths(release):
+    """Audio, subtitle and video files of every language of a release."""
+    paths = []
+    for translation in release.get("translations", {}).values():
+        paths.extend(translation[key] for key in ("audio", "subtitle", "video") if translation.get(key))
+    return paths
+
+
+async def refresh_press_release(url: str, release: dict = None):
+    """
+    Conditionally re-fetch a stored press release and re-run the stages whose inputs changed.
+
+    Args:
+        url (str): Press release URL.
+        release (dict): Stored validators (`etag`, `last_modified`), looked up if omitted.
+
+    Returns:
+        dict: `url`, `status` ('missing', 'not_modified', 'unchanged' or 'updated')
+        and the list of `changed` fields.
+    """
+    release = release or get_release_validators(url)
+    if not release:
+        log_warning(f"Cannot refresh {url}, it was never scraped")
+        return {"url": url, "status": "missing", "changed": []}
+
+    page, validators = await fetch_press_release(url, release.get("etag"), release.get("last_modified"))
+    checked = {**validators, "checked_at": datetime.now(timezone.utc)}
+
+    if page is None:
+        update_release_fields(url, checked)
+        return {"url": url, "status": "not_modified", "changed": []}
+
+    document = convert_object_ids(is_url_scraped(url))
+    english = document["translations"]["english"]
+    # Releases stored before hashing was added are compared on their stored fields
+    old_hashes = document.get("hashes") or page_hashes(english)
+    new_hashes = page_hashes(page)
+    changed = [field for field in new_hashes if new_hashes[field] != old_hashes.get(field)]
+
+    if not changed:
+        update_release_fields(url, {**checked, "hashes": new_hashes})
+        return {"url": url, "status": "unchanged", "changed": []}
+
+    log_info(f"Release changed ({', '.join(changed)}): {url}")
+
+    if "content" in changed:
+        # The summary depends on the content, so every stage of every language is stale
+        delete_images(artifact_paths(document))
+        updated = await process_press_release(url, page, validators)
+        english = updated["translations"]["english"]
+        await translate(
+            _id=updated["_id"],
+            images=updated["images"],
+            title=english["title"],
+            summary=english["summary"],
+            content=english["content"],
+            ministry=english["ministry"]
+        )
+    else:
+        english = {**english, **{field: page[field] for field in changed}}
+        fields = {f"translations.english.{field}": page[field] for field in changed}
+        # A release stopped before its render gets it from `resume_press_release`, with the new ministry
+        if "ministry" in changed and "render" in document.get("stages", []):
+            video_path = await create_video(images=document["images"],audio_path=english["audio"],srt_path=english["subtitle"],ministry=english["ministry"], output_path=english["video"])
+            if video_path != english["video"]:
+                delete_images([english["video"]])
+            english["video"] = fields["translations.english.video"] = video_path
+
+        update_release_fields(url, {**fields, **checked, "hashes": new_hashes})
+
+        async def refresh_one(lang, translation):
+            async with slot("translation"):
+                return await refresh_translation(document["_id"], document["images"], english, translation, lang, changed)
+
+        await asyncio.gather(*(
+            refresh_one(lang, translation)
+            for lang, translation in document["translations"].items()
+            if lang != "english" and translation.get("status") == "completed"
+        ))
+
+    log_success(f"Refreshed {url}")
+    return {"url": url, "status": "updated", "changed": changed}
+
+
+async def sweep(older_than_hours: float = 24, concurrency: int = 8, rate: float = 2.0, limit: int = 0):
+    """
+    Refresh every completed release not checked in the last `older_than_hours`.
+
+    Args:
+        older_than_hours (float): Skip releases checked more recently than this.
+        concurrency (int): Releases refreshed at once.
+        rate (float): Maximum requests per second sent to pib.gov.in.
+        limit (int): Maximum number of releases, 0 for all.
+
+    Returns:
+        dict: Number of releases per refresh status.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours)
+    releases = iter_release_validators(checked_before=cutoff, limit=limit)
+    log_info(f"Freshness sweep over {len(releases)} releases")
+
+    limiter = RateLimiter(rate)
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {}
+
+    async def check(release):
+        async with semaphore:
+            await limiter.acquire()
+            try:
+                status = (await refresh_press_release(release["url"], release))["status"]
+            except Exception as e:
+                log_error(f"Refresh failed for {release['url']}: {e}")
+                status = "failed"
+        counts[status] = counts.get(status, 0) + 1
+
+    await asyncio.gather(*(check(release) for release in releases))
+    log_success(f"Freshness sweep done: {counts}")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("urls", nargs="*", help="Press release URLs to refresh")
+    parser.add_argument("--sweep", action="store_true", help="Refresh every stored release")
+    parser.add_argument("--older-than", type=float, default=24, help="Hours since the last check (sweep)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="Max requests per second to pib.gov.in")
+    parser.add_argument("--limit", type=int, default=0, help="Max releases per sweep, 0 for all")
+    args = parser.parse_args()
+
+    if not args.sweep and not args.urls:
+        parser.error("give URLs or --sweep")
+
+    async def run():
+        if args.sweep:
+            await sweep(args.older_than, args.concurrency, args.rate, args.limit)
+        for url in args.urls:
+            print(await refresh_press_release(url))
+        await flush_writes()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,64 @@
 
-import requests
-from bs4 import BeautifulSoup
-import re
-from datetime import datetime
-from urllib.parse import urljoin
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 import asyncio
+import httpx
+from datetime import datetime, timezone
+from urllib.parse import urljoin
+import time
 
 # User defined modules
-from utils import convert_object_ids,parse_date_posted,rename
-from database.db import store_scraped_data_in_db, is_url_scraped
+from utils import convert_object_ids,parse_date_posted,rename,hash_text,emit_event
+from database.db import store_scraped_data_in_db, is_url_scraped, save_stage_checkpoint, update_release_fields
 from summarize.summarize import summarize_text
 from speech.tts import generate_tts_audio_and_subtitles
-from logger import log_info, log_warning, log_error, log_success 
+from logger import log_info, log_warning, log_error, log_success, bind_log_context
 from image.image_search import search_images_from_content
 from image.capture_iframe import capture_iframe
 from video.create_video import create_video
+from scrap.extract import extract_press_release, extract_hidden_inputs, extract_release_listing
+from singleflight import SingleFlight, run_exclusive
+import http_client
+import metrics
+from tracing import traced
 # from utils import save_html_to_file
 
 
-# Initialize a session to maintain the connection across requests
-session = requests.Session()
-
 BASE_URL = 'https://pib.gov.in/allRel.aspx'
 
-def txt_cleaner(txt):
-    """
-    Cleans up text by removing extra whitespace, new lines, and carriage returns.
-    
-    Args:
-    - txt (str): The text to be cleaned.
-    
-    Returns:
-    - str: The cleaned text.
-    """
-    if txt:
-        cleaned_string = txt.strip()
-        cleaned_string = re.sub(r'\s+', ' ', cleaned_string)
-        return cleaned_string
-    return ''
+# The __VIEWSTATE of allRel.aspx stays valid for many POSTs, so it is fetched
+# once and reused until it expires or the server rejects it.
+FORM_DATA_TTL = 15 * 60
+_form_data_cache = {"data": None, "fetched_at": 0.0}
+
+scrape_flights = SingleFlight("scrape")
 
-def get_form_data():
+async def get_form_data(refresh: bool = False):
     """
     Fetches the necessary form data including __VIEWSTATE and __EVENTVALIDATION.
+
+    The result is cached for FORM_DATA_TTL seconds.
+
+    Args:
+    - refresh (bool): Ignore the cached form data and fetch it again.
     
     Returns:
     - dict: A dictionary containing form data.
     """
-    response = session.get(BASE_URL)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    
-    form_data = {}
-    for input_tag in soup.find_all('input', type='hidden'):
-        name = input_tag.get('name')
-        value = input_tag.get('value', '')
-        if name:
-            form_data[name] = value
+    cached = _form_data_cache["data"]
+    if cached and not refresh and time.monotonic() - _form_data_cache["fetched_at"] < FORM_DATA_TTL:
+        return dict(cached)
 
-    return form_data
+    response = await http_client.get(BASE_URL)
+    form_data = extract_hidden_inputs(response.content)
 
-def get_press_releases(date: datetime, ministry_id: str = '0'):
+    if form_data:
+        _form_data_cache.update(data=form_data, fetched_at=time.monotonic())
+    return dict(form_data)
+
+async def get_press_releases(date: datetime, ministry_id: str = '0', raise_errors: bool = False):
     """
     Fetches press releases for a specific date and ministry.
+
+    Errors are logged and an empty list is returned, unless `raise_errors` is set.
     """
     try:
         day = date.day
@@ -70,166 +66,287 @@ def get_press_releases(date: datetime, ministry_id: str = '0'):
         year = date.year
 
         # Get the initial form data
-        form_data = get_form_data()
+        form_data = await get_form_data()
         if not form_data:
             log_error("Failed to retrieve initial form data.")
             return []
 
-        # Update form data with selected values
-        payload = {
-            'ctl00$ContentPlaceHolder1$ddlMinistry': ministry_id,
-            'ctl00$ContentPlaceHolder1$ddlday': str(day),
-            'ctl00$ContentPlaceHolder1$ddlMonth': str(month),
-            'ctl00$ContentPlaceHolder1$ddlYear': str(year),
-            'ctl00$ContentPlaceHolder1$hydregionid': '3',
-            'ctl00$ContentPlaceHolder1$hydLangid': '1',
-            '__EVENTTARGET': 'ctl00$ContentPlaceHolder1$ddlMinistry',  # Update based on the dropdown
-            '__EVENTARGUMENT': '',
-        }
-
-        # Merge with the extracted hidden form data
-        payload.update(form_data)
-
-        headers = {
-            'User-Agent': 'Mozilla/5.0',
-            'Content-Type': 'application/x-www-form-urlencoded',
-        }
-
-        response = session.post(BASE_URL, data=payload, headers=headers)
+        response = await _post_listing(form_data, ministry_id, day, month, year)
+        if response.status_code >= 500 or b'content-area' not in response.content:
+            # The cached __VIEWSTATE was rejected, retry once with a fresh one
+            log_warning("Form state rejected, refreshing __VIEWSTATE")
+            metrics.retries.inc(operation="viewstate")
+            response = await _post_listing(await get_form_data(refresh=True), ministry_id, day, month, year)
         response.raise_for_status()
 
         log_info(f"Request URL: {response.url}")
         log_info(f"Response status code: {response.status_code}")
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        content_area = soup.find('div', class_='content-area')
-        if not content_area:
+        listing = extract_release_listing(response.content)
+        if listing is None:
             log_warning(f"No press releases found for {date.strftime('%Y-%m-%d')}")
             return []
 
-        releases = []
-        for ul in content_area.find_all('ul'):
-            ministry_header = ul.find('h3', class_='font104')
-            if ministry_header:
-                ministry_name = ministry_header.text.strip()
-                for li in ul.find_all('li'):
-                    a_tag = li.find('a', href=True)
-                    if a_tag:
-                        title = a_tag.text.strip()
-                        relative_url = a_tag['href']
-                        full_url = urljoin(BASE_URL, relative_url)
-                        releases.append({
-                            'title': title,
-                            'url': full_url,
-                            'ministry': ministry_name,
-                            'date': date.strftime('%Y-%m-%d')
-                        })
+        releases = [
+            {
+                'title': title,
+                'url': urljoin(BASE_URL, relative_url),
+                'ministry': ministry_name,
+                'date': date.strftime('%Y-%m-%d')
+            }
+            for title, relative_url, ministry_name in listing
+        ]
         log_info(f"Found {len(releases)} releases for {date.strftime('%Y-%m-%d')}")
         return releases
 
     except Exception as e:
         log_error(f"Error fetching press releases for {date.strftime('%Y-%m-%d')}: {e}")
+        if raise_errors:
+            raise
         return []
 
 
-async def scrape_press_release(url: str):
+async def _post_listing(form_data, ministry_id, day, month, year):
+    """POST the allRel.aspx form for one day and ministry."""
+    # Update form data with selected values
+    payload = {
+        'ctl00$ContentPlaceHolder1$ddlMinistry': ministry_id,
+        'ctl00$ContentPlaceHolder1$ddlday': str(day),
+        'ctl00$ContentPlaceHolder1$ddlMonth': str(month),
+        'ctl00$ContentPlaceHolder1$ddlYear': str(year),
+        'ctl00$ContentPlaceHolder1$hydregionid': '3',
+        'ctl00$ContentPlaceHolder1$hydLangid': '1',
+        '__EVENTTARGET': 'ctl00$ContentPlaceHolder1$ddlMinistry',  # Update based on the dropdown
+        '__EVENTARGUMENT': '',
+    }
+
+    # Merge with the extracted hidden form data
+    payload.update(form_data)
+
+    headers = {
+        'User-Agent': 'Mozilla/5.0',
+        'Content-Type': 'application/x-www-form-urlencoded',
+    }
+
+    return await http_client.post(BASE_URL, data=payload, headers=headers)
+
+
+def summary_bounds(content: str):
+    """Summary length bounds derived from the word count of the content."""
+    content_length = len(content.split())
+    max_length = min(1024, max(300, content_length // 2))
+    min_length = max(20, max(200, content_length // 4))
+    return max_length, min_length
+
+
+def page_hashes(page: dict):
+    """Hashes of the extracted fields that feed the pipeline stages."""
+    return {field: hash_text(page[field]) for field in ('title', 'content', 'ministry')}
+
+
+async def fetch_press_release(url: str, etag: str = None, last_modified: str = None):
+    """
+    Fetch and extract a press release, conditionally if validators are given.
+
+    Args:
+        url (str): Press release URL.
+        etag (str): ETag from the previous fetch.
+        last_modified (str): Last-Modified from the previous fetch.
+
+    Returns:
+        tuple: (extracted page dict, or None if the page is unchanged (304),
+        dict with the new `etag` and `last_modified` validators)
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    response = await http_client.get(url, headers=headers)
+    validators = {
+        'etag': response.headers.get('ETag', etag),
+        'last_modified': response.headers.get('Last-Modified', last_modified),
+    }
+    if response.status_code == 304:
+        return None, validators
+
+    response.raise_for_status()
+    return extract_press_release(response.content), validators
+
+
+@traced("scrape_press_release")
+async def scrape_press_release(url: str, on_event=None):
     """
     Scrape and process press release from given URL.
 
+    Concurrent calls for the same URL share a single scrape; stage events go to
+    the caller that started it.
+
     Args:
         url (str): Press release URL
+        on_event (callable): Receives a progress event as each English stage completes
 
     Returns:
         dict: Processed press release data
     """
-    try:
-        cached_data = is_url_scraped(url)
-        if cached_data:
-            log_info(f"Retrieved cached data: {url}")
-            return convert_object_ids(cached_data)
+    return await scrape_flights.do(url, _scrape_press_release, url, on_event)
 
-        log_info(f"Starting fresh scrape: {url}")
 
-        session = requests.Session()
-        retries = Retry(total=3, backoff_factor=0.5)
-        session.mount('https://', HTTPAdapter(max_retries=retries))
+def completed_release(release):
+    """Return the release if its English video is done, None otherwise."""
+    if release and release.get('translations', {}).get('english', {}).get('status') == 'completed':
+        return convert_object_ids(release)
+    return None
 
-        response = await asyncio.to_thread(
-            session.get, 
-            url, 
-            headers={'User-Agent': 'Mozilla/5.0'}
-        )
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        content = txt_cleaner(' '.join([p.get_text() for p in soup.select('.innner-page-main-about-us-content-right-part p')]))
-        title = txt_cleaner(soup.select_one('div h2').get_text() if soup.select_one('div h2') else 'No Title')
-        date_posted = txt_cleaner(soup.select_one('div.ReleaseDateSubHeaddateTime').get_text() if soup.select_one('div.ReleaseDateSubHeaddateTime') else 'No Date Provided')
-        ministry = txt_cleaner(soup.select_one('div.MinistryNameSubhead').get_text() if soup.select_one('div.MinistryNameSubhead') else 'No Ministry Provided')
 
+async def _scrape_press_release(url: str, on_event=None):
+    try:
+        cached_data = completed_release(is_url_scraped(url))
+        if cached_data:
+            log_info(f"Retrieved cached data: {url}")
+            return cached_data
 
-        log_info(f"Summarizing: {title}")
-        content_length = len(content.split())
-        max_length = min(1024, max(300, content_length // 2))
-        min_length = max(20, max(200, content_length // 4))
-        summary = summarize_text(content, max_length, min_length)
-        # summary = "Union Minister for Education, Shri Dharmendra Pradhan, launched 41 new books under the PM YUVA 2.0 scheme at the New Delhi World Book Fair 2025. He praised the young authors, emphasized the scheme's impact on promoting Indian languages and literature, and announced initiatives to further this cause. The event was attended by dignitaries and highlighted the importance of literature in preserving cultural heritage."
+        async def scrape():
+            release = is_url_scraped(url)
+            if release and release.get('stages'):
+                log_info(f"Resuming scrape after '{release['stages'][-1]}': {url}")
+                return await resume_press_release(release, on_event)
 
-        log_info(f"Summarization complete: {title}")
+            log_info(f"Starting fresh scrape: {url}")
+            started = time.perf_counter()
+            with metrics.stage_seconds.time(stage="scrape"):
+                page, validators = await fetch_press_release(url)
+            emit_event(on_event, "stage", lang="english", stage="extract", seconds=round(time.perf_counter() - started, 2))
+            return await process_press_release(url, page, validators, on_event)
 
-        img_src = [img.get('src') for img in soup.select('div.innner-page-main-about-us-content-right-part img')] or None
-        
-        iframe_src = [a['href'] for a in soup.select('div.innner-page-main-about-us-content-right-part blockquote.twitter-tweet a[href]')]
+        # Another process may be scraping the same URL, its result lands in the database
+        return await run_exclusive(f"scrape:{url}", scrape, done=lambda: completed_release(is_url_scraped(url)))
 
-        tweet_links = [src for src in iframe_src if src.startswith('https://t.co/')]
-        
+    except httpx.HTTPError as e:
+        log_error(f"Network error scraping {url}: {e}")
+        raise
+    except Exception as e:
+        log_error(f"Unexpected error scraping {url}: {e}")
+        raise
 
-        generated_images = search_images_from_content(summary,max_chunks=(audio_duration//4 - len(img_src)))
 
-        img_src.extend(item['url'] for item in generated_images if not item['url'].startswith('https://lookaside'))
+async def process_press_release(url: str, page: dict, validators: dict = None, on_event=None):
+    """
+    Store an extracted press release as the first checkpoint and run the
+    English stages. The stored document replaces any previous English results.
 
-        log_info(f"Started Speeching of '{title}' for language 'english'")
+    Args:
+        url (str): Press release URL
+        page (dict): Output of `extract_press_release`
+        validators (dict): `etag` / `last_modified` of the fetched page
+        on_event (callable): Receives a progress event as each stage completes
 
-        summary_audio = await generate_tts_audio_and_subtitles(summary, f"{title}", 'english')
-        audio_duration = summary_audio.get("duration")
-        
-        log_success(f"Completed Speeching of '{title}' for language 'english'")
-        
-        log_info(f"Started Video Generation of '{title}' for language 'english'")
+    Returns:
+        dict: Stored press release data
+    """
+    release = store_scraped_data_in_db({
+        'url': url,
+        'page_images': page['images'] or [],
+        'date_posted': parse_date_posted(page['date_posted']),
+        'tweets': page['tweets'],
+        **(validators or {}),
+        'hashes': page_hashes(page),
+        'checked_at': datetime.now(timezone.utc),
+        'stages': ['extract'],
+        'translations': {
+            'english': {
+                'title': page['title'],
+                'content': page['content'],
+                'ministry': page['ministry'],
+                'status': 'in_progress',
+            }
+        },
+    })
+    return await resume_press_release(release, on_event)
+
+
+async def resume_press_release(release: dict, on_event=None):
+    """
+    Run the English stages not recorded in `release['stages']`:
+    summary -> tts -> images -> render.
 
-        video_path = f"output/{rename(title)}/english.mp4"
+    Each stage's output is saved on the document as soon as it is produced,
+    so a failed run resumes from the first incomplete stage.
 
-        create_video(images=img_src,audio_path=summary_audio.get("audio").lstrip('\\'),srt_path=summary_audio.get("subtitle").lstrip('\\'),ministry=ministry, output_path=video_path)
+    Args:
+        release (dict): Stored press release with at least the extract checkpoint
+        on_event (callable): Receives a progress event as each stage completes
 
-        log_success(f"Completed Video Generation of '{title}' for language 'english'")
+    Returns:
+        dict: Completed press release data
+    """
+    url = release['url']
+    stages = release.get('stages', [])
+    english = release['translations']['english']
+    title = english['title']
+    ministry = english['ministry']
+    started = time.perf_counter()
 
-        data = {
-            'url': url,
-            'images': img_src,
-            'date_posted': parse_date_posted(date_posted),
-            'tweets': tweet_links,
-            'translations': {
-                'english': {
-                    'title': title,
-                    'content': content,
-                    'summary': summary,
-                    'ministry': ministry,
-                    'audio': summary_audio.get("audio").lstrip('\\').replace('\\','/'),
-                    'video': video_path,
-                    'subtitle': summary_audio.get("subtitle").lstrip('\\').replace('\\','/'),
-                    'status': 'completed',
-                }
-            },
-        }
+    bind_log_context(language="english")
 
-        db_data = store_scraped_data_in_db(data)
-        log_info(f"Scrape successful: {url}")
-        return convert_object_ids(db_data)
+    def stage_done(stage, **fields):
+        nonlocal started
+        emit_event(on_event, "stage", lang="english", stage=stage, seconds=round(time.perf_counter() - started, 2), **fields)
+        started = time.perf_counter()
 
-    except requests.exceptions.RequestException as e:
-        log_error(f"Network error scraping {url}: {e}")
+    try:
+        if 'summary' not in stages:
+            bind_log_context(stage='summary')
+            log_info(f"Summarizing: {title}")
+            max_length, min_length = summary_bounds(english['content'])
+            summary = await summarize_text(english['content'], max_length, min_length)
+            release = save_stage_checkpoint(url, 'summary', {'translations.english.summary': summary})
+            log_info(f"Summarization complete: {title}")
+            stage_done('summary')
+        summary = release['translations']['english']['summary']
+
+        if 'tts' not in stages:
+            bind_log_context(stage='tts')
+            summary_audio = await generate_tts_audio_and_subtitles(summary, f"{title}", 'english')
+            release = save_stage_checkpoint(url, 'tts', {
+                'translations.english.audio': summary_audio.get("audio").lstrip('\\').replace('\\','/'),
+                'translations.english.subtitle': summary_audio.get("subtitle").lstrip('\\').replace('\\','/'),
+                'translations.english.duration': summary_audio.get("duration"),
+            })
+            stage_done('tts')
+        english = release['translations']['english']
+
+        if 'images' not in stages:
+            bind_log_context(stage='images')
+            img_src = list(release.get('page_images') or [])
+            # Roughly one image every four seconds of narration
+            max_chunks = english['duration'] // 4 - len(img_src)
+            if max_chunks > 0:
+                generated_images = await search_images_from_content(summary, max_chunks=max_chunks)
+                img_src.extend(item['url'] for item in generated_images if not item['url'].startswith('https://lookaside'))
+            release = save_stage_checkpoint(url, 'images', {'images': img_src})
+            stage_done('images')
+
+        if 'render' not in stages:
+            bind_log_context(stage='render')
+            log_info(f"Started Video Generation of '{title}' for language 'english'")
+            video_path = await create_video(images=release['images'],audio_path=english['audio'],srt_path=english['subtitle'],ministry=ministry, output_path=f"output/{rename(title)}/english.mp4")
+            release = save_stage_checkpoint(url, 'render', {
+                'translations.english.video': video_path,
+                'translations.english.status': 'completed',
+            })
+            log_success(f"Completed Video Generation of '{title}' for language 'english'")
+            stage_done('render', video=video_path)
+
+    except asyncio.CancelledError:
+        # Every caller went away or the job was aborted; resumed from the last checkpoint next time
+        update_release_fields(url, {'translations.english.status': 'cancelled'})
         raise
-    except Exception as e:
-        log_error(f"Unexpected error scraping {url}: {e}")
-        raise
\ No newline at end of file
+    except Exception:
+        update_release_fields(url, {'translations.english.status': 'failed'})
+        metrics.failures.inc(stage="english")
+        raise
+
+    log_info(f"Scrape successful: {url}")
+    return convert_object_ids(release)
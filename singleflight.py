@@ -0,0 +1,111 @@
+import asyncio
+import os
+import socket
+import uuid
+
+# User defined modules
+from database.db import acquire_lease, renew_lease, release_lease
+from logger import log_info, log_warning
+
+LEASE_TTL = float(os.getenv("LEASE_TTL", "60"))
+LEASE_POLL_INTERVAL = float(os.getenv("LEASE_POLL_INTERVAL", "2"))
+
+# Identifies this process as a lease owner
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key onto one in-flight task.
+
+    The first caller starts the work; callers arriving while it runs await the
+    same task and receive its result or exception. The task is shielded, so a
+    cancelled waiter does not cancel the work for the others; once every
+    waiter is cancelled, nobody needs the result and the work is cancelled.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        # Waiters per in-flight task
+        self._waiters = {}
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def do(self, key, func, *args, **kwargs):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            log_info(f"Joining in-flight {self.name} for {key}")
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Later callers start over instead of joining the cancelled work
+                    self._forget(key, task)
+                    task.cancel()
+                    log_info(f"Cancelled {self.name} for {key}, no caller is waiting")
+
+
+async def _heartbeat(key, ttl):
+    """Keep renewing a lease while the work holding it runs."""
+    while True:
+        await asyncio.sleep(ttl / 3)
+        if not renew_lease(key, PROCESS_ID, ttl):
+            log_warning(f"Lost lease '{key}'")
+            return
+
+
+async def run_exclusive(key, func, done, ttl: float = LEASE_TTL, poll_interval: float = LEASE_POLL_INTERVAL):
+    """
+    Run `func` in at most one process at a time, using a MongoDB lease.
+
+    Processes that find the lease taken poll `done` until the holder's result
+    is stored, or take the lease over if the holder released it after a failure
+    or stopped renewing it.
+
+    Args:
+        key (str): Lease name.
+        func (callable): Coroutine function doing the work.
+        done (callable): Returns the stored result, or None while not available.
+        ttl (float): Lease lifetime in seconds, renewed while `func` runs.
+        poll_interval (float): Seconds between checks while another process works.
+
+    Returns:
+        Any: Result of `func`, or of `done` if another process did the work.
+    """
+    waiting = False
+    while True:
+        result = done()
+        if result is not None:
+            return result
+
+        if acquire_lease(key, PROCESS_ID, ttl):
+            # The previous holder may have finished between the check and the acquire
+            result = done()
+            if result is None:
+                break
+            release_lease(key, PROCESS_ID)
+            return result
+
+        if not waiting:
+            log_info(f"'{key}' is being processed by another worker, waiting")
+            waiting = True
+        await asyncio.sleep(poll_interval)
+
+    heartbeat = asyncio.create_task(_heartbeat(key, ttl))
+    try:
+        return await func()
+    finally:
+        heartbeat.cancel()
+        release_lease(key, PROCESS_ID)
@@ -0,0 +1,182 @@
+import io
+import os
+import wave
+from typing import Dict, List
+
+# User defined modules
+from logger import log_info
+from utils import split_sentences
+from scheduler import check_cancelled, run_cancellable
+
+PIPER_VOICES_DIR = os.getenv("PIPER_VOICES_DIR", os.path.join("models", "piper"))
+
+
+class TTSBackend:
+    """
+    Interface implemented by every speech synthesis engine.
+
+    `synthesize` returns a dict with the encoded audio bytes, the file extension
+    of that encoding and the word timings (seconds) used to build subtitles:
+
+        {"audio": b"...", "extension": "mp3", "words": [{"text": "..", "start": 0.0, "end": 0.4}]}
+    """
+
+    name = None
+    extension = None
+
+    def supports(self, lang: str, config: Dict) -> bool:
+        """Return True if this backend can speak the given language."""
+        raise NotImplementedError
+
+    async def synthesize(self, text: str, lang: str, config: Dict) -> Dict:
+        raise NotImplementedError
+
+
+class EdgeTTSBackend(TTSBackend):
+    """Remote Microsoft Edge neural voices streamed over edge-tts."""
+
+    name = "edge"
+    extension = "mp3"
+    resource = "network"
+
+    def supports(self, lang, config):
+        return bool(config.get("voice"))
+
+    async def synthesize(self, text, lang, config):
+        import edge_tts
+
+        communicate = edge_tts.Communicate(text, voice=config["voice"], rate=config["rate"], pitch=config["pitch"])
+        audio = bytearray()
+        words = []
+
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio.extend(chunk["data"])
+            elif chunk["type"] == "WordBoundary":
+                # edge-tts reports offsets in 100ns ticks
+                start = chunk["offset"] / 10_000_000
+                words.append({
+                    "text": chunk["text"],
+                    "start": start,
+                    "end": start + chunk["duration"] / 10_000_000,
+                })
+
+        return {"audio": bytes(audio), "extension": self.extension, "words": words}
+
+
+class PiperTTSBackend(TTSBackend):
+    """
+    Local CPU synthesis with Piper ONNX voices.
+
+    Voices are read from `PIPER_VOICES_DIR/<local_voice>.onnx` (+ `.onnx.json`).
+    Piper does not emit word boundaries, so every sentence is synthesized on its
+    own and its measured duration is spread over its words by character length.
+    """
+
+    name = "piper"
+    extension = "wav"
+    resource = "inference"
+
+    def __init__(self, voices_dir: str = PIPER_VOICES_DIR):
+        self.voices_dir = voices_dir
+        self._voices = {}
+
+    def _model_path(self, voice: str) -> str:
+        return os.path.join(self.voices_dir, f"{voice}.onnx")
+
+    def supports(self, lang, config):
+        voice = config.get("local_voice")
+        return bool(voice) and os.path.exists(self._model_path(voice))
+
+    def _load_voice(self, voice: str):
+        if voice not in self._voices:
+            from piper.voice import PiperVoice
+
+            log_info(f"Loading Piper voice '{voice}'")
+            self._voices[voice] = PiperVoice.load(self._model_path(voice))
+        return self._voices[voice]
+
+    @staticmethod
+    def _length_scale(rate: str) -> float:
+        """Convert an edge-tts style rate ("+5%") into a Piper length scale."""
+        try:
+            return 1 / (1 + float(rate.rstrip("%")) / 100)
+        except (AttributeError, ValueError):
+            return 1.0
+
+    def _synthesize_sync(self, text, config):
+        voice = self._load_voice(config["local_voice"])
+        sample_rate = voice.config.sample_rate
+        length_scale = self._length_scale(config.get("rate", "+0%"))
+
+        pcm = bytearray()
+        words = []
+        for sentence in split_sentences(text) or [text]:
+            check_cancelled()
+            start = len(pcm) / 2 / sample_rate
+            for raw in voice.synthesize_stream_raw(sentence, length_scale=length_scale):
+                pcm.extend(raw)
+            end = len(pcm) / 2 / sample_rate
+            words.extend(_spread_words(sentence, start, end))
+
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav_file:
+            wav_file.setnchannels(1)
+            wav_file.setsampwidth(2)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(bytes(pcm))
+
+        return {"audio": buffer.getvalue(), "extension": self.extension, "words": words}
+
+    async def synthesize(self, text, lang, config):
+        return await run_cancellable(self._synthesize_sync, text, config)
+
+
+def _spread_words(sentence: str, start: float, end: float) -> List[Dict]:
+    """Distribute the [start, end] span of a sentence over its words by length."""
+    tokens = sentence.split()
+    total = sum(len(token) for token in tokens)
+    if not total:
+        return []
+
+    words = []
+    cursor = start
+    for token in tokens:
+        duration = (end - start) * len(token) / total
+        words.append({"text": token, "start": cursor, "end": cursor + duration})
+        cursor += duration
+    return words
+
+
+BACKENDS = {
+    EdgeTTSBackend.name: EdgeTTSBackend(),
+    PiperTTSBackend.name: PiperTTSBackend(),
+}
+
+
+def get_backend(lang: str, config: Dict) -> TTSBackend:
+    """
+    Pick the TTS backend for a language.
+
+    The `backend` key of the language entry in `LANGUAGES` decides, and the
+    `TTS_BACKEND` environment variable overrides it for every language (e.g.
+    `TTS_BACKEND=piper` for offline backfills). A backend that cannot speak the
+    language falls back to edge-tts.
+
+    Args:
+        lang (str): Language name.
+        config (dict): Entry of `LANGUAGES` for the language.
+
+    Returns:
+        TTSBackend: Backend instance to use.
+    """
+    name = os.getenv("TTS_BACKEND") or config.get("backend", EdgeTTSBackend.name)
+    backend = BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Unknown TTS backend '{name}'.")
+
+    if not backend.supports(lang, config):
+        if name != EdgeTTSBackend.name:
+            log_info(f"TTS backend '{name}' has no voice for '{lang}', using edge-tts")
+        return BACKENDS[EdgeTTSBackend.name]
+    return backend
@@ -0,0 +1,84 @@
+"""
+Benchmark TTS backends on latency and real-time factor (RTF).
+
+RTF is synthesis time divided by the duration of the produced audio, so values
+below 1.0 mean faster than real time.
+
+Usage:
+    python -m speech.benchmark_tts --backends edge piper --langs english hindi --runs 3
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from moviepy.editor import AudioFileClip
+
+# User defined modules
+from speech.backends import BACKENDS
+from utils import LANGUAGES
+
+SAMPLE_TEXT = (
+    "Union Minister for Education launched 41 new books under the PM YUVA 2.0 scheme at the "
+    "New Delhi World Book Fair. He praised the young authors and emphasized the scheme's impact "
+    "on promoting Indian languages and literature."
+)
+
+
+def audio_duration(result):
+    """Measure the duration of synthesized audio bytes."""
+    with tempfile.NamedTemporaryFile(suffix=f".{result['extension']}", delete=False) as tmp:
+        tmp.write(result["audio"])
+    try:
+        clip = AudioFileClip(tmp.name)
+        duration = clip.duration
+        clip.close()
+        return duration
+    finally:
+        os.remove(tmp.name)
+
+
+async def bench(backend_name, lang, text, runs):
+    backend = BACKENDS[backend_name]
+    config = LANGUAGES[lang]
+    if not backend.supports(lang, config):
+        return None
+
+    latencies = []
+    rtfs = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await backend.synthesize(text, lang, config)
+        elapsed = time.perf_counter() - start
+        latencies.append(elapsed)
+        rtfs.append(elapsed / max(audio_duration(result), 1e-6))
+
+    return {
+        "latency_p50": statistics.median(latencies),
+        "latency_max": max(latencies),
+        "rtf": statistics.median(rtfs),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--langs", nargs="+", default=["english", "hindi"])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--text", default=SAMPLE_TEXT)
+    args = parser.parse_args()
+
+    print(f"{'backend':<8} {'lang':<10} {'p50 (s)':>8} {'max (s)':>8} {'RTF':>6}")
+    for backend_name in args.backends:
+        for lang in args.langs:
+            stats = await bench(backend_name, lang, args.text, args.runs)
+            if stats is None:
+                print(f"{backend_name:<8} {lang:<10} {'n/a (no voice)':>24}")
+                continue
+            print(f"{backend_name:<8} {lang:<10} {stats['latency_p50']:>8.2f} {stats['latency_max']:>8.2f} {stats['rtf']:>6.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,25 +1,34 @@
-import edge_tts
+import asyncio
 import os
-from moviepy.editor import AudioFileClip
 
 # User defined modules
 from logger import log_info, log_error, log_success
-from utils import rename,restructure_srt,LANGUAGES,rootFolder
-
+from utils import rename,restructure_srt,words_to_srt,LANGUAGES,rootFolder
+from speech.backends import get_backend
+from scheduler import slot
+import artifacts
+import metrics
+from tracing import span, traced
+
+@traced("generate_tts_audio_and_subtitles")
 async def generate_tts_audio_and_subtitles(text: str, title: str, lang: str):
-    """Generate TTS using edge-tts stream and save audio and subtitles."""
+    """
+    Generate TTS with the language's backend and save audio and subtitles.
+
+    Narrations are kept in the artifact store under a hash of the backend,
+    voice and text, so identical narrations are synthesized once and shared
+    by hardlink; the release files are named after that hash.
+    """
     if lang not in LANGUAGES:
         raise ValueError(f"Language '{lang}' is not supported.")
-    
-    voice = LANGUAGES[lang]["voice"]
-    rate = LANGUAGES[lang]["rate"]
-    pitch = LANGUAGES[lang]["pitch"]
+
+    backend = get_backend(lang, LANGUAGES[lang])
+    key = artifacts.input_key("tts", backend.name, LANGUAGES[lang], lang, text)
 
     # Define output files
     output_dir = os.path.join(rootFolder, "output", rename(title))
-    os.makedirs(output_dir, exist_ok=True)  # Ensure output directory exists
-    audio_file_path = os.path.join(output_dir, f"{lang}.mp3")
-    subtitle_file_path = os.path.join(output_dir, f"{lang}.srt")
+    audio_file_path = artifacts.keyed_path(os.path.join(output_dir, f"{lang}.{backend.extension}"), key)
+    subtitle_file_path = artifacts.keyed_path(os.path.join(output_dir, f"{lang}.srt"), key)
 
 
     # Convert absolute paths to relative paths from the root folder
@@ -31,45 +40,44 @@ async def generate_tts_audio_and_subtitles(text: str, title: str, lang: str):
     relative_subtitle_path = f"\\{relative_subtitle_path}"
 
 
-
-    # Check if the audio and subtitle files already exist
-    if os.path.exists(audio_file_path) and os.path.exists(subtitle_file_path):
-        log_info(f"Audio and subtitles already exist for language '{lang}', returning existing file paths.")
-        # Get the duration of the audio file
-        audio = AudioFileClip(audio_file_path)
-        duration = int(audio.duration)
-
-        return {"audio": audio_file_path, "subtitle": subtitle_file_path, "duration":duration}  
-    
-    log_info(f"Started Speeching of '{title}' for language '{lang}'")
-
     try:
-        # Initialize the communicator for streaming and subtitle generation
-        communicate = edge_tts.Communicate(text, voice=voice, rate=rate, pitch=pitch)
-        submaker = edge_tts.SubMaker()
-        
-        # Open files for audio and subtitles
-        with open(audio_file_path, "wb") as audio_file, open(subtitle_file_path, "w", encoding="utf-8") as srt_file:
-            # Stream the audio and feed the subtitles in real-time
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_file.write(chunk["data"])
-                elif chunk["type"] == "WordBoundary":
-                    submaker.feed(chunk)
-            
-            # Write subtitles to the file after streaming is complete
-            srt_file.write(submaker.get_srt())
-        
+        # The manifest is SQLite and the store a filesystem: keep both off the event loop
+        audio_blob = await asyncio.to_thread(artifacts.lookup, f"{key}:audio")
+        subtitle_blob = await asyncio.to_thread(artifacts.lookup, f"{key}:subtitle")
+        metrics.count_lookup("narration", bool(audio_blob and subtitle_blob))
+        if audio_blob and subtitle_blob:
+            log_info(f"Audio and subtitles already exist for language '{lang}', reusing stored artifacts.")
+        else:
+            log_info(f"Started Speeching of '{title}' for language '{lang}' with '{backend.name}'")
+
+            # Edge waits on the network, Piper on local inference
+            async with slot(backend.resource):
+                with metrics.tts_seconds.time(language=lang, backend=backend.name), span("tts.synthesize", backend=backend.name):
+                    result = await backend.synthesize(text, lang, LANGUAGES[lang])
+
+            audio_temp_path = artifacts.temp_path(f".{backend.extension}")
+            subtitle_temp_path = artifacts.temp_path(".srt")
+            with open(audio_temp_path, "wb") as audio_file, open(subtitle_temp_path, "w", encoding="utf-8") as srt_file:
+                audio_file.write(result["audio"])
+                srt_file.write(words_to_srt(result["words"]))
+
+            # Reconstruct before storing, stored artifacts are never modified in place
+            restructure_srt(subtitle_temp_path);
+
+            audio_blob = await asyncio.to_thread(artifacts.store, audio_temp_path, f"{key}:audio")
+            subtitle_blob = await asyncio.to_thread(artifacts.store, subtitle_temp_path, f"{key}:subtitle")
+            log_success(f"Completed Speeching of '{title}' for language '{lang}'")
+
+        await asyncio.to_thread(artifacts.link, audio_blob, audio_file_path)
+        await asyncio.to_thread(artifacts.link, subtitle_blob, subtitle_file_path)
 
         # Get the duration of the audio file
+        from moviepy.editor import AudioFileClip
+
         audio = AudioFileClip(audio_file_path)
         duration = int(audio.duration)
+        audio.close()
 
-        # Reconstruct 
-        restructure_srt(subtitle_file_path);
-        
-        log_success(f"Completed Speeching of '{title}' for language '{lang}'")
-        
         # Return file paths (strings)
         return {"audio": relative_audio_path, "subtitle": relative_subtitle_path, "duration":duration }
     
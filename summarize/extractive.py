@@ -0,0 +1,171 @@
+"""
+Local extractive summarizer.
+
+Scores sentences with vectorized NumPy over a TF-IDF sentence matrix, either by
+TextRank (PageRank over the cosine-similarity graph) or by similarity to the
+document centroid, then picks the best sentences that fit the character bounds
+`scrape_press_release` computes. No network access is needed.
+
+Benchmark:
+    python -m summarize.extractive --sentences 20 100 500 --runs 20
+"""
+import re
+
+import numpy as np
+
+# user defined modules
+from utils import split_sentences
+
+METHODS = ("textrank", "tfidf")
+
+STOPWORDS = frozenset("""
+a an and are as at be been but by for from has have he her his in into is it its of on or
+our shall she that the their them they this to was were which will with who would also said
+""".split())
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tfidf_matrix(sentences):
+    """
+    Build an L2-normalized TF-IDF matrix with one row per sentence.
+
+    Args:
+        sentences (list): Sentences to vectorize.
+
+    Returns:
+        np.ndarray: Matrix of shape (len(sentences), vocabulary size).
+    """
+    vocabulary = {}
+    rows, cols = [], []
+    for row, sentence in enumerate(sentences):
+        for word in WORD_PATTERN.findall(sentence.lower()):
+            if word in STOPWORDS or len(word) < 2:
+                continue
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+
+    counts = np.zeros((len(sentences), max(len(vocabulary), 1)))
+    np.add.at(counts, (rows, cols), 1.0)
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    weights = counts * idf
+
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return np.divide(weights, norms, out=np.zeros_like(weights), where=norms > 0)
+
+
+def textrank_scores(matrix, damping=0.85, tolerance=1e-6, max_iterations=100):
+    """PageRank over the sentence cosine-similarity graph."""
+    n = matrix.shape[0]
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, 0.0)
+
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # Sentences without links spread their rank uniformly
+    transition = np.divide(similarity, out_weight, out=np.full_like(similarity, 1.0 / n), where=out_weight > 0)
+
+    scores = np.full(n, 1.0 / n)
+    for _ in range(max_iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ scores)
+        if np.abs(updated - scores).sum() < tolerance:
+            return updated
+        scores = updated
+    return scores
+
+
+def centroid_scores(matrix):
+    """Cosine similarity of each sentence to the document centroid."""
+    centroid = matrix.sum(axis=0)
+    norm = np.linalg.norm(centroid)
+    return matrix @ (centroid / norm) if norm else np.zeros(matrix.shape[0])
+
+
+def select_sentences(sentences, scores, max_length, min_length):
+    """
+    Greedily pick the best-scored sentences that fit in `max_length` characters,
+    stopping once `min_length` is reached and no better sentence fits.
+
+    Returns:
+        str: Selected sentences in their original order.
+    """
+    chosen = []
+    length = 0
+    for index in np.argsort(-scores, kind="stable"):
+        added = len(sentences[index]) + (1 if chosen else 0)
+        if length + added > max_length:
+            if length >= min_length:
+                break
+            continue
+        chosen.append(index)
+        length += added
+
+    if not chosen:
+        # Every sentence is longer than max_length: cut the best one at a word boundary
+        best = sentences[int(np.argmax(scores))]
+        return best[:max_length].rsplit(" ", 1)[0]
+
+    return " ".join(sentences[index] for index in sorted(chosen))
+
+
+def extractive_summary(text: str, max_length: int, min_length: int, method: str = "textrank") -> str:
+    """
+    Summarize text locally by selecting its most central sentences.
+
+    Args:
+        text (str): Text to summarize.
+        max_length (int): Maximum summary length in characters.
+        min_length (int): Length in characters to reach when possible.
+        method (str): 'textrank' or 'tfidf' (centroid similarity).
+
+    Returns:
+        str: Summary made of sentences from the text.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown extractive method '{method}'.")
+
+    sentences = split_sentences(text)
+    if not sentences:
+        return ""
+    if len(sentences) == 1:
+        return select_sentences(sentences, np.ones(1), max_length, min(min_length, max_length))
+
+    matrix = tfidf_matrix(sentences)
+    scores = textrank_scores(matrix) if method == "textrank" else centroid_scores(matrix)
+    # Press releases lead with their key facts: slightly favour early sentences
+    scores = scores * (1 + 0.1 / np.arange(1, len(sentences) + 1))
+    return select_sentences(sentences, scores, max_length, min(min_length, max_length))
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import statistics
+    import time
+
+    parser = argparse.ArgumentParser(description="Benchmark the extractive summarizer")
+    parser.add_argument("--sentences", type=int, nargs="+", default=[20, 100, 500])
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    words = ("ministry scheme minister india government launched development farmers education "
+             "digital infrastructure national health rural women youth states crore programme").split()
+
+    print(f"{'sentences':>9} {'method':<9} {'p50 (ms)':>9} {'max (ms)':>9}")
+    for count in args.sentences:
+        text = " ".join(
+            " ".join(random.choice(words) for _ in range(random.randint(8, 30))).capitalize() + "."
+            for _ in range(count)
+        )
+        content_length = len(text.split())
+        max_length = min(1024, max(300, content_length // 2))
+        min_length = max(20, max(200, content_length // 4))
+        for method in METHODS:
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                extractive_summary(text, max_length, min_length, method)
+                timings.append((time.perf_counter() - start) * 1000)
+            print(f"{count:>9} {method:<9} {statistics.median(timings):>9.2f} {max(timings):>9.2f}")
@@ -1,18 +1,76 @@
-from openai import OpenAI
+import asyncio
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv
 
 # user defined modules
 from logger import log_info, log_error,log_success
+from utils import RateLimiter, hash_text
+from singleflight import SingleFlight
+from scheduler import slot
+import metrics
+from tracing import traced
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def summarize_text(text: str, max_length: int, min_length: int) -> str:
-    try:
-        log_info(f"Summary Generation started")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
+# 'openai' (API only), 'extractive' (local, no network) or 'auto' (API, local fallback)
+SUMMARIZER = os.getenv("SUMMARIZER", "openai")
+SUMMARIZER_MODES = ("openai", "extractive", "auto")
+EXTRACTIVE_METHOD = os.getenv("EXTRACTIVE_METHOD", "textrank")
+# Deadline of the API call in 'auto' mode before falling back to the local summarizer
+SUMMARY_FALLBACK_DEADLINE = float(os.getenv("SUMMARY_FALLBACK_DEADLINE", "20"))
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-3.5-turbo")
+# Point at a local OpenAI-compatible stand-in for tests, e.g. http://127.0.0.1:8080/v1
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+SUMMARY_DEADLINE = float(os.getenv("SUMMARY_DEADLINE", "60"))
+SUMMARY_RATE_LIMIT = float(os.getenv("SUMMARY_RATE_LIMIT", "1"))
+SUMMARY_RATE_BURST = float(os.getenv("SUMMARY_RATE_BURST", "3"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "512"))
+
+_client = None
+rate_limiter = RateLimiter(SUMMARY_RATE_LIMIT, SUMMARY_RATE_BURST)
+summary_flights = SingleFlight("summary")
+summary_cache = OrderedDict()
+
+
+def get_client():
+    """Return the shared async OpenAI client, importing the SDK on first use."""
+    global _client
+    if _client is None:
+        from openai import AsyncOpenAI
+
+        _client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL, timeout=SUMMARY_DEADLINE)
+    return _client
+
+
+def set_summarizer(mode: str):
+    """Select the summarizer mode for this process ('openai', 'extractive' or 'auto')."""
+    global SUMMARIZER
+    if mode not in SUMMARIZER_MODES:
+        raise ValueError(f"Unknown summarizer '{mode}', expected one of {SUMMARIZER_MODES}.")
+    SUMMARIZER = mode
+
+
+def _cache_get(key):
+    metrics.count_lookup("summary", key in summary_cache)
+    if key in summary_cache:
+        summary_cache.move_to_end(key)
+        return summary_cache[key]
+    return None
+
+
+def _cache_put(key, summary):
+    summary_cache[key] = summary
+    summary_cache.move_to_end(key)
+    while len(summary_cache) > SUMMARY_CACHE_SIZE:
+        summary_cache.popitem(last=False)
+
+
+async def _request_summary(text: str, max_length: int, min_length: int) -> str:
+    await rate_limiter.acquire()
+    async with slot("network"):
+        response = await get_client().chat.completions.create(
+            model=SUMMARY_MODEL,
             messages=[
                 {
                     "role": "system",
@@ -26,9 +84,95 @@ def summarize_text(text: str, max_length: int, min_length: int) -> str:
             temperature=0.7,
             max_tokens=max_length
         )
+    return response.choices[0].message.content.strip()
+
+
+@traced("summarize_text")
+async def summarize_text(text: str, max_length: int, min_length: int, deadline: float = None) -> str:
+    """
+    Summarize text with the configured SUMMARIZER.
+
+    'extractive' selects sentences locally, 'openai' calls the API and 'auto'
+    calls the API with SUMMARY_FALLBACK_DEADLINE, falling back to the local
+    summarizer if it fails or is too slow.
+
+    Args:
+        text (str): Text to summarize.
+        max_length (int): Upper bound of the summary length in characters.
+        min_length (int): Lower bound of the summary length in characters.
+        deadline (float): Seconds before an API request is abandoned.
+
+    Returns:
+        str: Summary.
+    """
+    with metrics.stage_seconds.time(stage="summarize"):
+        return await _summarize_text(text, max_length, min_length, deadline)
+
+
+async def _summarize_text(text, max_length, min_length, deadline):
+    if SUMMARIZER == "extractive":
+        return local_summary(text, max_length, min_length)
+
+    if SUMMARIZER == "auto":
+        try:
+            return await summarize_with_api(text, max_length, min_length, deadline or SUMMARY_FALLBACK_DEADLINE)
+        except RuntimeError:
+            log_info(f"Falling back to the extractive summarizer")
+            return local_summary(text, max_length, min_length)
+
+    return await summarize_with_api(text, max_length, min_length, deadline or SUMMARY_DEADLINE)
+
+
+def local_summary(text: str, max_length: int, min_length: int) -> str:
+    """Summarize with the local extractive summarizer, cached like API results."""
+    key = (hash_text(text), f"extractive-{EXTRACTIVE_METHOD}", max_length, min_length)
+    summary = _cache_get(key)
+    if summary is None:
+        # NumPy is only loaded by processes that summarize locally
+        from summarize.extractive import extractive_summary
+
+        summary = extractive_summary(text, max_length, min_length, EXTRACTIVE_METHOD)
+        _cache_put(key, summary)
+    log_success(f"Extractive summary generated")
+    return summary
+
+
+async def summarize_with_api(text: str, max_length: int, min_length: int, deadline: float = SUMMARY_DEADLINE) -> str:
+    """
+    Summarize text through the API without blocking the event loop.
+
+    Results are cached by (content hash, model, length bounds) and identical
+    concurrent requests share one API call. Calls are rate limited with a token
+    bucket and abandoned once `deadline` seconds have passed, including the
+    time spent waiting for the rate limiter.
+
+    Args:
+        text (str): Text to summarize.
+        max_length (int): Upper bound of the summary length.
+        min_length (int): Lower bound of the summary length.
+        deadline (float): Seconds before the request is abandoned.
+
+    Returns:
+        str: Summary.
+    """
+    key = (hash_text(text), SUMMARY_MODEL, max_length, min_length)
+    cached = _cache_get(key)
+    if cached is not None:
+        log_info(f"Summary cache hit")
+        return cached
+
+    try:
+        log_info(f"Summary Generation started")
+        summary = await summary_flights.do(
+            key, lambda: asyncio.wait_for(_request_summary(text, max_length, min_length), deadline)
+        )
+        _cache_put(key, summary)
         log_success(f"Summary Generation completed")
-        return response.choices[0].message.content.strip()
+        return summary
 
+    except asyncio.TimeoutError:
+        log_error(f"Summary Generation exceeded its {deadline:.0f}s deadline")
+        raise RuntimeError(f"Error generating summary: deadline of {deadline:.0f}s exceeded")
     except Exception as e:
         log_error(f"Error generating summary: {str(e)}")
         raise RuntimeError(f"Error generating summary: {str(e)}")
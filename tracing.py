@@ -0,0 +1,246 @@
+"""
+Opt-in tracing of a single job, exported as Chrome trace-event JSON.
+
+A traced request (`?trace=true`) records a span around every instrumented
+pipeline function, nested through contextvars across tasks and worker
+threads. Open the export in chrome://tracing or https://ui.perfetto.dev: each
+asyncio task and worker thread gets its own track.
+
+Spans of CPU-bound work in worker threads (model batches, renders) can carry
+a sampling profile (`?profile=true`): the span's thread is sampled every
+TRACE_PROFILE_INTERVAL seconds and the hottest stacks are attached to the span.
+
+When no trace is active, instrumented functions cost one contextvar lookup.
+
+Usage:
+    @traced("summarize_text")
+    async def summarize_text(...): ...
+
+    with span("render.encode"):
+        ...
+
+    with trace("text_to_video", url=url) as job_trace:
+        await text_to_video(url)
+    chrome_trace(job_trace)
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+# Finished traces kept for export
+TRACE_KEEP = int(os.getenv("TRACE_KEEP", "50"))
+TRACE_PROFILE_INTERVAL = float(os.getenv("TRACE_PROFILE_INTERVAL", "0.005"))
+# Stacks attached to a profiled span, hottest first
+PROFILE_TOP_STACKS = 15
+
+_current = contextvars.ContextVar("trace_span", default=None)
+traces = OrderedDict()
+
+
+class Trace:
+    """Spans of one traced job."""
+
+    def __init__(self, name: str, profile: bool = False):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.profile = profile
+        self.started_ns = time.perf_counter_ns()
+        self.spans = []
+        # (task or thread) -> (track ID, track name)
+        self.tracks = {}
+
+    def track(self):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            key, name = id(task), task.get_name()
+        else:
+            key, name = threading.get_ident(), threading.current_thread().name
+        if key not in self.tracks:
+            self.tracks[key] = (len(self.tracks) + 1, name)
+        return self.tracks[key][0]
+
+
+class _Sampler(threading.Thread):
+    """Samples the stack of one thread until stopped."""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="trace-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+        total = sum(self.stacks.values())
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": total,
+            "top": [
+                # The innermost frames are the informative ones
+                {"stack": stack.split(";")[-8:], "share": round(count / total, 3)}
+                for stack, count in self.stacks.most_common(PROFILE_TOP_STACKS)
+            ],
+        }
+
+
+class _Span:
+    __slots__ = ("trace", "name", "args", "profile", "started_ns", "track", "sampler", "token")
+
+    def __init__(self, job_trace: Trace, name: str, args: dict, profile: bool):
+        self.trace = job_trace
+        self.name = name
+        self.args = args
+        self.profile = profile and job_trace.profile
+
+    def __enter__(self):
+        self.track = self.trace.track()
+        self.token = _current.set(self)
+        self.sampler = None
+        if self.profile:
+            self.sampler = _Sampler(threading.get_ident(), TRACE_PROFILE_INTERVAL)
+            self.sampler.start()
+        self.started_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ended_ns = time.perf_counter_ns()
+        _current.reset(self.token)
+        if self.sampler is not None:
+            self.args["profile"] = self.sampler.stop()
+        if exc_type is not None:
+            self.args["error"] = repr(exc)
+        self.trace.spans.append((self.name, self.started_ns, ended_ns, self.track, self.args))
+        return False
+
+
+class _NoSpan:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name: str, profile: bool = False, **args):
+    """
+    Record a span of the current trace around a block; a no-op when not tracing.
+
+    Args:
+        name (str): Span name, e.g. 'render.encode'.
+        profile (bool): Sample the stack while the span is open, if the
+            trace was started with profiling. Only useful for spans running
+            in a worker thread: the event loop thread interleaves other tasks.
+        **args: Shown with the span in the trace viewer.
+    """
+    parent = _current.get()
+    if parent is None:
+        return _NO_SPAN
+    return _Span(parent.trace, name, args, profile)
+
+
+def traced(name: str = None, profile: bool = False):
+    """Decorate a sync or async function to record a span per call while tracing."""
+    def decorate(func):
+        span_name = name or func.__qualname__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _current.get() is None:
+                    return await func(*args, **kwargs)
+                with span(span_name, profile=profile):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name, profile=profile):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
+
+
+@contextmanager
+def trace(name: str, profile: bool = False, **args):
+    """
+    Trace the block and everything it awaits or starts, kept for `get_trace`.
+
+    Tasks created inside the block inherit the trace, tasks created before it
+    do not: start the trace inside the task that does the work.
+
+    Yields:
+        Trace: Its `id` locates the export.
+    """
+    job_trace = Trace(name, profile)
+    try:
+        with _Span(job_trace, name, args, False):
+            yield job_trace
+    finally:
+        traces[job_trace.id] = job_trace
+        while len(traces) > TRACE_KEEP:
+            traces.popitem(last=False)
+
+
+def current_trace_id():
+    """ID of the trace of the current task, or None."""
+    current = _current.get()
+    return current.trace.id if current is not None else None
+
+
+def get_trace(trace_id: str):
+    return traces.get(trace_id)
+
+
+def chrome_trace(job_trace: Trace) -> dict:
+    """
+    Export a trace in the Chrome trace-event format.
+
+    Returns:
+        dict: JSON object with complete ('X') events in microseconds, and a
+        thread name per task or worker thread.
+    """
+    pid = os.getpid()
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": pid, "tid": track, "args": {"name": name}}
+        for track, name in job_trace.tracks.values()
+    ]
+    for name, started_ns, ended_ns, track, args in job_trace.spans:
+        events.append({
+            "name": name,
+            "cat": "pipeline",
+            "ph": "X",
+            "ts": (started_ns - job_trace.started_ns) / 1000,
+            "dur": (ended_ns - started_ns) / 1000,
+            "pid": pid,
+            "tid": track,
+            "args": args,
+        })
+    return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"id": job_trace.id, "name": job_trace.name}}
@@ -1,40 +1,131 @@
-import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-from IndicTransToolkit.processor import IndicProcessor 
 import os
 import asyncio
+import threading
 import time
 from typing import Dict
-from torch.amp import autocast
 
-from database.db import store_translation_in_db, check_translation_in_db, update_translation_status
+from database.db import store_translation_in_db, check_translation_in_db, update_translation_status, update_translation_fields
 from speech.tts import generate_tts_audio_and_subtitles
-from logger import log_info, log_error, log_warning, log_success
-from utils import split_sentences,tgt_langs,rename
-from video.create_video import create_video
+from logger import log_info, log_error, log_warning, log_success, bind_log_context
+from utils import split_sentences,tgt_langs,rename,emit_event
+from video.create_video import create_video, delete_images
+from singleflight import SingleFlight, run_exclusive
+from scheduler import slot, run_in_thread, cancel_requested, check_cancelled
+import metrics
+from tracing import span, traced
 
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "max_split_size_mb:128,garbage_collection_threshold:0.8"
 
-DEVICE = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
-torch.cuda.empty_cache()
-
 model_name = "ai4bharat/indictrans2-en-indic-1B"
-tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
-model = AutoModelForSeq2SeqLM.from_pretrained(
-    model_name,
-    trust_remote_code=True,
-    torch_dtype=torch.float16,
-    low_cpu_mem_usage=True,
-    use_cache=True  # Required for gradient checkpointing
-).to(DEVICE)
+_state = {"model": None}
+_model_lock = threading.Lock()
 
-# Enable gradient checkpointing using new format
-model._set_gradient_checkpointing(False)
+src_lang = "eng_Latn"
+# Metrics are labelled by language name, e.g. 'hin_Deva' -> 'hindi'
+language_names = {code: name for name, code in tgt_langs.items()}
 
-ip = IndicProcessor(inference=True)
+translation_flights = SingleFlight("translation")
 
-src_lang = "eng_Latn"
+def load_model():
+    """
+    Import torch and transformers and load the model on first use (blocking).
+
+    Processes that never translate (API nodes in queue mode, release workers)
+    start without paying for them.
+
+    Returns:
+        dict: torch, device, tokenizer, model and IndicProcessor.
+    """
+    with _model_lock:
+        if _state["model"] is None:
+            import torch
+            from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+            from IndicTransToolkit.processor import IndicProcessor
+
+            device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+            torch.cuda.empty_cache()
+            log_info(f"Loading translation model {model_name} on {device}")
+
+            tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+            model = AutoModelForSeq2SeqLM.from_pretrained(
+                model_name,
+                trust_remote_code=True,
+                torch_dtype=torch.float16,
+                low_cpu_mem_usage=True,
+                use_cache=True  # Required for gradient checkpointing
+            ).to(device)
+
+            # Enable gradient checkpointing using new format
+            model._set_gradient_checkpointing(False)
+
+            _state.update(torch=torch, device=device, tokenizer=tokenizer, ip=IndicProcessor(inference=True), model=model)
+    return _state
+
+def _stop_when_cancelled(input_ids, scores, **kwargs):
+    """Stopping criterion ending generation at the next token once the caller was cancelled."""
+    return cancel_requested()
+
+@traced("translate_chunk", profile=True)
+def translate_chunk(chunk, tgt_lang):
+    """Translate a batch of sentences with the model (blocking)."""
+    loaded = load_model()
+    torch, tokenizer, model, ip = loaded["torch"], loaded["tokenizer"], loaded["model"], loaded["ip"]
+    from transformers import StoppingCriteriaList
+
+    check_cancelled()
+    try:
+        batch = ip.preprocess_batch(chunk, src_lang=src_lang, tgt_lang=tgt_lang)
+    except Exception as e:
+        log_error(f"Preprocessing failed: {e}")
+        raise
 
+    max_length = 256
+    inputs = tokenizer(
+        batch,
+        truncation=True,
+        padding=True,
+        max_length=max_length,
+        return_tensors="pt",
+        return_attention_mask=True,
+    ).to(loaded["device"])
+
+    generate_started = time.perf_counter()
+    with span("model.generate", sentences=len(chunk)):
+        with torch.amp.autocast(device_type="cuda:0"):
+            with torch.no_grad():
+                generated_tokens = model.generate(
+                    **inputs,
+                    use_cache=True,
+                    min_length=0,
+                    max_length=max_length,
+                    num_beams=2,
+                    length_penalty=0.6,
+                    early_stopping=True,
+                    no_repeat_ngram_size=2,
+                    stopping_criteria=StoppingCriteriaList([_stop_when_cancelled]),
+                )
+    # Generation stopped early: the batch is incomplete and nobody awaits it
+    check_cancelled()
+    generated = int((generated_tokens != tokenizer.pad_token_id).sum())
+    metrics.translate_tokens_per_second.observe(generated / (time.perf_counter() - generate_started),
+                                                language=language_names.get(tgt_lang, tgt_lang))
+
+    try:
+        with tokenizer.as_target_tokenizer():
+            decoded = tokenizer.batch_decode(
+                generated_tokens.detach().cpu(),
+                skip_special_tokens=True,
+                clean_up_tokenization_spaces=True,
+            )
+        chunk_translations = ip.postprocess_batch(decoded, lang=tgt_lang)
+    except Exception as e:
+        log_error(f"Decoding/postprocessing failed: {e}")
+        raise
+
+    torch.cuda.empty_cache()
+    return chunk_translations
+
+@traced("translateIn")
 async def translateIn(text, tgt_lang):
     try:
         if not text or not text.strip():
@@ -45,6 +136,7 @@ async def translateIn(text, tgt_lang):
         if not input_sentences:
             log_warning(f"No valid sentences found for translation to {tgt_lang}")
             return ""
+        metrics.translate_sentences.observe(len(input_sentences), language=tgt_lang)
 
         tgt_lang = tgt_langs.get(tgt_lang)
         if not tgt_lang:
@@ -57,49 +149,10 @@ async def translateIn(text, tgt_lang):
         for i in range(0, len(input_sentences), chunk_size):
             chunk = input_sentences[i:i + chunk_size]
             
-            try:
-                batch = ip.preprocess_batch(chunk, src_lang=src_lang, tgt_lang=tgt_lang)
-            except Exception as e:
-                log_error(f"Preprocessing failed: {e}")
-                raise
-
-            max_length = 256
-            inputs = tokenizer(
-                batch,
-                truncation=True,
-                padding=True,
-                max_length=max_length,
-                return_tensors="pt",
-                return_attention_mask=True,
-            ).to(DEVICE)
-
-            with autocast(device_type="cuda:0"):
-                with torch.no_grad():
-                    generated_tokens = model.generate(
-                        **inputs,
-                        use_cache=True,
-                        min_length=0,
-                        max_length=max_length,
-                        num_beams=2,
-                        length_penalty=0.6,
-                        early_stopping=True,
-                        no_repeat_ngram_size=2,
-                    )
-
-            try:
-                with tokenizer.as_target_tokenizer():
-                    decoded = tokenizer.batch_decode(
-                        generated_tokens.detach().cpu(),
-                        skip_special_tokens=True,
-                        clean_up_tokenization_spaces=True,
-                    )
-                chunk_translations = ip.postprocess_batch(decoded, lang=tgt_lang)
-                translations.extend(chunk_translations)
-            except Exception as e:
-                log_error(f"Decoding/postprocessing failed: {e}")
-                raise
-
-            torch.cuda.empty_cache()
+            # The model runs in a worker thread, one inference slot per chunk
+            with span("translateIn.chunk", language=tgt_lang, sentences=len(chunk)):
+                chunk_translations = await run_in_thread("inference", translate_chunk, chunk, tgt_lang)
+            translations.extend(chunk_translations)
 
         result = ' '.join(translations).strip()
         result = result.replace(' .', '.').replace(' ,', ',')
@@ -111,86 +164,173 @@ async def translateIn(text, tgt_lang):
         raise
 
 async def translate_and_store(_id, title,images, summary, content, ministry, lang):
+    """
+    Translate, narrate and render one language of a press release.
+
+    Concurrent calls for the same (_id, lang) share a single run, in this
+    process through a single-flight and across processes through a lease.
+    """
+    return await translation_flights.do((str(_id), lang), _translate_and_store, _id, title, images, summary, content, ministry, lang)
+
+async def _translate_and_store(_id, title,images, summary, content, ministry, lang):
+    # Whether this process does the work, rather than waiting on another's lease
+    running = False
     try:
         translation = check_translation_in_db(_id, lang)
         if translation:
             log_warning(f"Translation exists for {lang}, {title}")
             return {**translation,"language":lang}
 
-        log_info(f"Starting translation for {title} in {lang}")
-        update_translation_status(_id, lang, "in_progress")
-
-        translations = await asyncio.gather(
-            translateIn(title, lang),
-            translateIn(ministry, lang),
-            translateIn(summary, lang),
-            translateIn(content, lang)
-        )
-        
-        translated_title, translated_ministry, translated_summary, translated_content = translations
-        log_success(f"Translation completed for {lang}")
-
-        try:
-            summary_audio = await generate_tts_audio_and_subtitles(translated_summary, f"{title}", lang)
-        except Exception as e:
-            log_warning(f"TTS failed for {lang}: {e}")
-            summary_audio = {"audio": None, "subtitle": None}
-
-        
-        video_path = f"output/{rename(title)}/{lang}.mp4"
-
-        create_video(images=images,audio_path=summary_audio.get("audio").lstrip('\\'),srt_path=summary_audio.get("subtitle").lstrip('\\'),ministry=ministry, output_path=video_path)
-
-        store_translation_in_db(
-            _id,
-            lang,
-            {
-                "title": translated_title,
-                "summary": translated_summary,
-                "content": translated_content,
-                "ministry": translated_ministry,
-                "audio": summary_audio.get("audio").lstrip('\\').replace('\\','/'),
-                "video": video_path,
-                "subtitle": summary_audio.get("subtitle").lstrip('\\').replace('\\','/'),
-                "status": "completed",
-            }
-        )
-
-        log_info(f"Stored translation for {title} in {lang}")
-
-        return {
-                "lang": lang,
-                "video": video_path,
-                "status": "completed",
-            }
-
+        def done():
+            # Polled while another process holds the lease
+            translation = check_translation_in_db(_id, lang, quiet=True)
+            return {**translation,"language":lang} if translation else None
+
+        async def run():
+            nonlocal running
+            running = True
+            log_info(f"Starting translation for {title} in {lang}")
+            update_translation_status(_id, lang, "in_progress")
+            bind_log_context(stage="translate")
+
+            translations = await asyncio.gather(
+                translateIn(title, lang),
+                translateIn(ministry, lang),
+                translateIn(summary, lang),
+                translateIn(content, lang)
+            )
+
+            translated_title, translated_ministry, translated_summary, translated_content = translations
+            log_success(f"Translation completed for {lang}")
+
+            bind_log_context(stage="tts")
+            try:
+                summary_audio = await generate_tts_audio_and_subtitles(translated_summary, f"{title}", lang)
+            except Exception as e:
+                log_warning(f"TTS failed for {lang}: {e}")
+                metrics.failures.inc(stage="tts")
+                summary_audio = {"audio": None, "subtitle": None}
+
+
+            bind_log_context(stage="render")
+            video_path = await create_video(images=images,audio_path=summary_audio.get("audio").lstrip('\\'),srt_path=summary_audio.get("subtitle").lstrip('\\'),ministry=ministry, output_path=f"output/{rename(title)}/{lang}.mp4")
+
+            await store_translation_in_db(
+                _id,
+                lang,
+                {
+                    "title": translated_title,
+                    "summary": translated_summary,
+                    "content": translated_content,
+                    "ministry": translated_ministry,
+                    "audio": summary_audio.get("audio").lstrip('\\').replace('\\','/'),
+                    "video": video_path,
+                    "subtitle": summary_audio.get("subtitle").lstrip('\\').replace('\\','/'),
+                    "status": "completed",
+                }
+            )
+
+            log_info(f"Stored translation for {title} in {lang}")
+
+            return {
+                    "lang": lang,
+                    "video": video_path,
+                    "status": "completed",
+                }
+
+        return await run_exclusive(f"translate:{_id}:{lang}", run, done)
+
+    except asyncio.CancelledError:
+        log_warning(f"Cancelled translation for {lang}")
+        if running:
+            update_translation_status(_id, lang, "cancelled")
+        raise
     except Exception as e:
         log_error(f"Failed translation for {lang}: {e}")
         update_translation_status(_id, lang, "failed")
         raise
 
-MAX_CONCURRENT_TRANSLATIONS = 3
-
-async def translate(_id: str,images, title: str, summary: str, content: str, ministry: str):
+async def refresh_translation(_id, images, english, translation, lang, changed):
+    """
+    Re-run only the stages of an existing translation whose English inputs changed.
+
+    Handles title and ministry changes; a content change invalidates the summary
+    and therefore every stage, which goes through `translate` instead.
+
+    Args:
+        _id (str): Document ID.
+        images (list): Images of the release.
+        english (dict): Updated English translation (title, ministry, ...).
+        translation (dict): Stored translation for `lang`.
+        lang (str): Target language.
+        changed (list): Changed fields, subset of ('title', 'ministry').
+    """
+    updates = {}
+    if "title" in changed:
+        updates["title"] = await translateIn(english["title"], lang)
+
+    if "ministry" in changed:
+        updates["ministry"] = await translateIn(english["ministry"], lang)
+        # The ministry header is part of the render, the narration is unchanged
+        updates["video"] = await create_video(images=images,audio_path=translation["audio"],srt_path=translation["subtitle"],ministry=english["ministry"], output_path=translation["video"])
+        if updates["video"] != translation["video"]:
+            # Drops this release's link, the stored render is collected once unreferenced
+            delete_images([translation["video"]])
+
+    if updates:
+        update_translation_fields(_id, lang, updates)
+    return {"lang": lang, "video": updates.get("video", translation["video"]), "status": "completed", "refreshed": sorted(updates)}
+
+async def translate(_id: str,images, title: str, summary: str, content: str, ministry: str, on_event=None, languages=None):
+    """
+    Translate, narrate and render every target language of a press release.
+
+    Args:
+        _id (str): Document ID.
+        images (list): Images of the release.
+        title, summary, content, ministry (str): English fields to translate.
+        languages (list): Target languages, all of `tgt_langs` by default.
+        on_event (callable): Receives a 'language' event with the video path and
+            timing as each language completes or fails.
+
+    Returns:
+        list: Per-language results.
+    """
+    # The English stages of the caller are over, each language binds its own context
+    bind_log_context(language=None, stage=None)
     try:
         start_time = time.time()
-        total_languages = len(tgt_langs)
+        languages = languages or list(tgt_langs)
+        total_languages = len(languages)
         completed = 0
-        semaphore = asyncio.Semaphore(MAX_CONCURRENT_TRANSLATIONS)
 
         async def controlled_translate(tgt_lang: str) -> Dict:
             nonlocal completed
-            async with semaphore:
+            bind_log_context(language=tgt_lang)
+            # Host-wide limit, shared with every other release being translated
+            async with slot("translation"):
+                lang_start = time.time()
                 try:
-                    translation_data = await translate_and_store(_id, title,images, summary, content, ministry, tgt_lang)
+                    with metrics.translate_seconds.time(language=tgt_lang), span("translate.language", language=tgt_lang):
+                        translation_data = await translate_and_store(_id, title,images, summary, content, ministry, tgt_lang)
                     completed += 1
                     log_info(f"Progress: {completed}/{total_languages}")
+                    emit_event(on_event, "language", lang=tgt_lang, status=translation_data.get("status"),
+                               video=translation_data.get("video"), seconds=round(time.time() - lang_start, 2),
+                               completed=completed, total=total_languages)
                     return {**translation_data}
+                except asyncio.CancelledError:
+                    emit_event(on_event, "language", lang=tgt_lang, status="cancelled",
+                               seconds=round(time.time() - lang_start, 2), completed=completed, total=total_languages)
+                    raise
                 except Exception as e:
                     log_error(f"Failed {tgt_lang}: {str(e)}")
+                    metrics.failures.inc(stage="translate")
+                    emit_event(on_event, "language", lang=tgt_lang, status="failed", error=str(e),
+                               seconds=round(time.time() - lang_start, 2), completed=completed, total=total_languages)
                     return {"lang": tgt_lang, "status": "failed", "error": str(e)}
 
-        translation_tasks = [controlled_translate(lang) for lang in tgt_langs]
+        translation_tasks = [controlled_translate(lang) for lang in languages]
         results = await asyncio.gather(*translation_tasks, return_exceptions=True)
 
         successful = sum(1 for r in results if isinstance(r, dict) and r.get("status") == "completed")
@@ -1,6 +1,9 @@
 from bson import ObjectId
 import re
 import os
+import time
+import asyncio
+import hashlib
 
 from datetime import datetime
 import pytz 
@@ -69,6 +72,28 @@ def restructure_srt(input_srt_path, max_words=10, max_duration=3):
         for idx, (start, end, text) in enumerate(subtitle_entries, 1):
             output_file.write(f"{idx}\n{start} --> {end}\n{text}\n\n")
 
+def format_srt_time(seconds):
+    """Format seconds as an SRT timestamp (HH:MM:SS,mmm)."""
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+def words_to_srt(words):
+    """
+    Build a word-by-word SRT document from word timings.
+
+    Args:
+        words (list): Dicts with `text`, `start` and `end` (seconds).
+
+    Returns:
+        str: SRT content with one cue per word.
+    """
+    return "".join(
+        f"{idx}\n{format_srt_time(word['start'])} --> {format_srt_time(word['end'])}\n{word['text']}\n\n"
+        for idx, word in enumerate(words, 1)
+    )
 
 
 def ensure_directory_exists(directory):
@@ -109,6 +134,15 @@ def convert_object_ids(data):
         return str(data)
     return data
 
+def emit_event(on_event, event, **fields):
+    """Send a progress event (a dict with an 'event' type) to `on_event`, if one was given."""
+    if on_event is not None:
+        on_event({"event": event, **fields})
+
+def hash_text(text):
+    """Return the SHA-256 hex digest of a string."""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
 def split_sentences(text):
     """
     Split text into sentences while preserving common abbreviations.
@@ -154,73 +188,123 @@ tgt_langs = {
     "bengali": "ben_Beng",
 }
 
-# Your provided LANGUAGES dictionary
+# Voice settings per language. `backend` selects the TTS engine (see speech/backends.py)
+# and `local_voice` names the Piper voice used when synthesizing offline.
 LANGUAGES = {
     "english": {
         "voice": "en-IN-NeerjaNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": "en_US-lessac-medium"
     },
     "hindi": {
         "voice": "hi-IN-SwaraNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": "hi_IN-pratham-medium"
     },
     "urdu": {
         "voice": "ur-PK-UzmaNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
     "gujrati": {
         "voice": "gu-IN-NiranjanNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
     "marathi": {
         "voice": "mr-IN-AarohiNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
     "telugu": {
         "voice": "te-IN-MohanNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": "te_IN-maya-medium"
     },
     "kannada": {
         "voice": "kn-IN-GaganNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
     "malayalam": {
         "voice": "ml-IN-MidhunNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": "ml_IN-meera-medium"
     },
     "tamil": {
         "voice": "ta-IN-PallaviNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
     "bengali": {
         "voice": "bn-IN-TanishaaNeural",
         "rate": "+5%",
         "pitch": "-5Hz",
-        "generate_subtitles": True
+        "generate_subtitles": True,
+        "backend": "edge",
+        "local_voice": None
     },
 }
 
 rootFolder = os.path.dirname(os.path.abspath(__file__))
 
 
+class RateLimiter:
+    """
+    Async token bucket limiter.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum burst size, defaults to `rate` (at least 1).
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1):
+        """Wait until `tokens` are available and consume them."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
 def parse_date_posted(date_posted_str):
     # Example input: "Posted On: 24 AUG 2024 9:48AM by PIB Delhi"
     date_pattern = r"Posted On: (\d{2}) (\w{3}) (\d{4}) (\d{1,2}):(\d{2})(AM|PM)"
@@ -263,8 +347,3 @@ def parse_date_posted(date_posted_str):
     ist_datetime = ist_timezone.localize(naive_datetime)
 
     return ist_datetime
-
-# Example usage
-date_str = "Posted On: 24 AUG 2024 9:48AM by PIB Delhi"
-parsed_date = parse_date_posted(date_str)
-print(parsed_date)  # Output: 2024-08-24 09:48:00+05:30
\ No newline at end of file
@@ -1,42 +1,73 @@
 import os
-import moviepy.editor as mp
-import requests
-import pysrt
-from PIL import Image,ImageFilter
-import numpy as np
+import asyncio
+import shutil
+import subprocess
+import time
 
 # User defined modules
-from moviepy.config import change_settings
 from logger import log_info, log_warning, log_success
 from utils import ensure_directory_exists
+import http_client
+import artifacts
+import metrics
+from tracing import span, traced
+from scheduler import run_in_thread, check_cancelled
+
+# moviepy, PIL and numpy are imported by the functions that render, keeping
+# them out of the startup of API processes. TextClip needs ImageMagick:
+# moviepy reads its path from the IMAGEMAGICK_BINARY environment variable
+# (e.g. C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe on Windows).
 
-# Set ImageMagick binary path (required for TextClip on Windows)
-change_settings({"IMAGEMAGICK_BINARY": r"C:\Program Files\ImageMagick-7.1.1-Q16-HDRI\magick.exe"})
 def time_to_seconds(t):
     """Convert datetime.time object to seconds"""
     return t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1000000
 
 
+# Also package each render as an HLS playlist ('<video>/index.m3u8') for segmented streaming
+VIDEO_HLS = os.getenv("VIDEO_HLS", "0") == "1"
+HLS_SEGMENT_SECONDS = int(os.getenv("HLS_SEGMENT_SECONDS", "4"))
+
+# Bump when render_video changes its output, so stored renders are not reused
+RENDER_VERSION = 1
+
 INTRO_PATH = "assets/intro.mp4"
 HEADER_PATH = "assets/headers"
 BGM_PATH = "assets/bgm.mp3"
 
 
-def download_image(url, save_path):
-    """Download an image from a URL if not already present."""
-    if os.path.exists(save_path):
-        log_warning(f"Image already exists: {save_path}")
-        return save_path
-    
-    response = requests.get(url, stream=True)
-    if response.status_code == 200:
-        with open(save_path, 'wb') as file:
-            for chunk in response.iter_content(1024):
-                file.write(chunk)
-        log_success(f"Downloaded: {save_path}")
-    else:
+async def download_image(url):
+    """
+    Download an image into the artifact store, once per URL.
+
+    Returns:
+        str: Path of the stored image, or None if the download failed.
+    """
+    key = artifacts.input_key("image", url)
+    stored = await asyncio.to_thread(artifacts.lookup, key)
+    metrics.count_lookup("image", bool(stored))
+    if stored:
+        log_warning(f"Image already exists: {stored}")
+        return stored
+
+    try:
+        with metrics.stage_seconds.time(stage="image_download"):
+            response = await http_client.get(url)
+    except Exception as e:
+        log_info(f"Failed to download {url}: {e}")
+        metrics.failures.inc(stage="image_download")
+        return None
+
+    if response.status_code != 200:
         log_info(f"Failed to download {url}")
-    return save_path
+        return None
+
+    # Identical images behind different URLs are stored once
+    partial_path = artifacts.temp_path(os.path.splitext(url.split('?')[0])[1] or ".jpg")
+    with open(partial_path, 'wb') as file:
+        file.write(response.content)
+    stored = await asyncio.to_thread(artifacts.store, partial_path, key)
+    log_success(f"Downloaded: {url} -> {stored}")
+    return stored
 
 def delete_images(images):
     """Delete images from the given list if they exist."""
@@ -47,25 +78,27 @@ def delete_images(images):
         else:
             log_warning(f"File not found: {image}")
 
-def process_images(images):
-    """Ensure all images are downloaded if they are URLs."""
-    processed_images = []
-    for img in images:
-        if img.startswith('http'):
-            filename = os.path.basename(img.split('?')[0])  # Handle URL parameters
-            save_path = os.path.join("downloaded_images", filename)
-            os.makedirs("downloaded_images", exist_ok=True)
-            processed_image = download_image(img, save_path)
-            if os.path.exists(processed_image):
-                processed_images.append(processed_image)
-            else:
-                log_warning(f"Skipping missing image: {img}")
-        else:
-            processed_images.append(img)
-    return processed_images
+async def process_images(images):
+    """Ensure all images are downloaded if they are URLs, fetching them concurrently."""
+    async def process(img):
+        if not img.startswith('http'):
+            return img
+        processed_image = await download_image(img)
+        if processed_image:
+            return processed_image
+        log_warning(f"Skipping missing image: {img}")
+        return None
+
+    # Download each distinct URL once, then map results back in order
+    unique = list(dict.fromkeys(images))
+    results = dict(zip(unique, await asyncio.gather(*(process(img) for img in unique))))
+    return [results[img] for img in images if results[img]]
 
 def resize_image_clip(clip, target_size):
     """Helper function to handle image resizing with proper aspect ratio preservation"""
+    from PIL import Image
+    import numpy as np
+
     def resize_frame(frame):
         pil_image = Image.fromarray(frame)
         # Use LANCZOS resampling (replacement for deprecated ANTIALIAS)
@@ -75,6 +108,10 @@ def resize_image_clip(clip, target_size):
 
 def resize_and_blur_background(clip, target_size):
     """Resize the image clip while maintaining aspect ratio and adding blurred background"""
+    import moviepy.editor as mp
+    from PIL import Image, ImageFilter
+    import numpy as np
+
     video_width, video_height = target_size
 
     # Load image
@@ -100,19 +137,146 @@ def resize_and_blur_background(clip, target_size):
 
     return mp.ImageClip(final_frame).set_duration(clip.duration)
 
-def create_video(images, audio_path, srt_path, ministry, output_path):
-    # Import numpy here to avoid any potential import issues
-    if os.path.exists(output_path):
-        log_warning(f"Video already exists skipping video generation: {output_path}")
-        return
+def render_key(images, audio_path, srt_path, ministry):
+    """Input key of a render: images, narration, subtitles, header and the shared assets."""
+    def digest(path):
+        return artifacts.file_digest(path) if os.path.exists(path) else path
+
+    return artifacts.input_key(
+        "render", RENDER_VERSION,
+        [img if img.startswith('http') else digest(img) for img in images],
+        digest(audio_path), digest(srt_path), ministry,
+        digest(f"{HEADER_PATH}/{ministry}.png"), digest(INTRO_PATH), digest(BGM_PATH),
+    )
+
+@traced("create_video")
+async def create_video(images, audio_path, srt_path, ministry, output_path):
+    """
+    Download the images and render the video in a worker thread.
 
-    processed_images = process_images(images)
+    Renders are kept in the artifact store under their input key, so a video
+    whose inputs did not change is linked instead of rendered again.
+
+    Args:
+        images (list): Image URLs or local paths.
+        audio_path (str): Narration audio file.
+        srt_path (str): Subtitle file.
+        ministry (str): Ministry name, selects the header image.
+        output_path (str): Path of the MP4, e.g. 'output/<title>/hindi.mp4'.
+
+    Returns:
+        str: Path of the video, `output_path` suffixed with its input key.
+    """
+    key = await asyncio.to_thread(render_key, images, audio_path, srt_path, ministry)
+    video_path = artifacts.keyed_path(output_path, key)
+    stored = await asyncio.to_thread(artifacts.lookup, f"{key}:video")
+    metrics.count_lookup("render", bool(stored))
+    if stored:
+        log_warning(f"Video already exists skipping video generation: {video_path}")
+    else:
+        with span("create_video.download_images", images=len(images)):
+            processed_images = await process_images(images)
+        partial_path = artifacts.temp_path(".mp4")
+
+        def render():
+            # Timed in the worker thread, so the wait for a render slot is not counted
+            with metrics.stage_seconds.time(stage="render"):
+                render_video(processed_images, audio_path, srt_path, ministry, partial_path)
+
+        try:
+            await run_in_thread("render", render)
+        except BaseException:
+            # Failed or cancelled: drop the render instead of leaving it in the store's temp directory
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        stored = await asyncio.to_thread(artifacts.store, partial_path, f"{key}:video")
+    await asyncio.to_thread(artifacts.link, stored, video_path)
+
+    if VIDEO_HLS and not os.path.exists(hls_playlist_path(video_path)):
+        with span("create_video.hls"):
+            await run_in_thread("render", package_hls, video_path)
+    return video_path
+
+
+def hls_playlist_path(video_path):
+    """HLS playlist of a rendered video: 'output/<title>/hindi.mp4' -> 'output/<title>/hindi/index.m3u8'."""
+    return os.path.join(os.path.splitext(video_path)[0], "index.m3u8")
+
+
+def package_hls(video_path):
+    """
+    Split a rendered MP4 into a VOD HLS playlist without re-encoding.
+
+    Args:
+        video_path (str): Rendered MP4.
+
+    Returns:
+        str: Path of the playlist.
+    """
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    playlist = hls_playlist_path(video_path)
+    hls_dir = os.path.dirname(playlist)
+    ensure_directory_exists(hls_dir)
+    command = [
+        get_ffmpeg_exe(), "-y", "-loglevel", "error", "-i", video_path,
+        "-c", "copy", "-f", "hls",
+        "-hls_time", str(HLS_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_filename", os.path.join(hls_dir, "segment_%03d.ts"),
+        f"{playlist}.part.m3u8",
+    ]
+    with subprocess.Popen(command) as process:
+        try:
+            while True:
+                try:
+                    process.wait(timeout=0.5)
+                    break
+                except subprocess.TimeoutExpired:
+                    check_cancelled()
+        except BaseException:
+            # Cancelled: stop ffmpeg and drop the partial segments
+            process.kill()
+            process.wait()
+            shutil.rmtree(hls_dir, ignore_errors=True)
+            raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    # The playlist appears only once every segment is written
+    os.replace(f"{playlist}.part.m3u8", playlist)
+    log_success(f"HLS playlist written: {playlist}")
+    return playlist
+
+
+def cancellable_logger():
+    """moviepy progress logger that stops writing at the next frame once the render is cancelled."""
+    from proglog import TqdmProgressBarLogger
+
+    class CancellableLogger(TqdmProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            check_cancelled()
+            super().bars_callback(bar, attr, value, old_value)
+
+    return CancellableLogger()
+
+@traced("render_video", profile=True)
+def render_video(processed_images, audio_path, srt_path, ministry, output_path):
+    """Render the final video from local images, narration and subtitles (CPU bound)."""
+    import moviepy.editor as mp
+    import pysrt
+    from PIL import Image
 
     # Check if all input files exist
     for file_path in [*processed_images, audio_path, srt_path, INTRO_PATH, f"{HEADER_PATH}/{ministry}.png", BGM_PATH]:
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Input file not found: {file_path}")
 
+    # Export the final video to a temporary file, so an interrupted render is never served
+    partial_path = f"{os.path.splitext(output_path)[0]}.part.mp4"
+    # Next to the video rather than in the working directory, so concurrent renders do not collide
+    partial_audio_path = f"{os.path.splitext(output_path)[0]}.part.mp3"
+
     try:
         # Load intro clip
         intro_clip = mp.VideoFileClip(INTRO_PATH)
@@ -130,31 +294,32 @@ def create_video(images, audio_path, srt_path, ministry, output_path):
         image_clips = []
         duration_per_image = (narration_audio.duration - intro_clip.duration) / len(processed_images)
         
-        for image in processed_images:
-            # Load the image and create clip
-            img_clip = mp.ImageClip(image).set_duration(duration_per_image)
+        with span("render.image_clips", images=len(processed_images)):
+            for image in processed_images:
+                # Load the image and create clip
+                img_clip = mp.ImageClip(image).set_duration(duration_per_image)
             
-            # Get original image dimensions
-            img_size = Image.open(image).size
+                # Get original image dimensions
+                img_size = Image.open(image).size
             
-            # Calculate scaling factors
-            scale_w = video_width / img_size[0]
-            scale_h = video_height / img_size[1]
-            scale = max(scale_w, scale_h)
+                # Calculate scaling factors
+                scale_w = video_width / img_size[0]
+                scale_h = video_height / img_size[1]
+                scale = max(scale_w, scale_h)
             
-            # Calculate new dimensions maintaining aspect ratio
-            new_size = (int(img_size[0] * scale), int(img_size[1] * scale))
+                # Calculate new dimensions maintaining aspect ratio
+                new_size = (int(img_size[0] * scale), int(img_size[1] * scale))
             
-            # Resize the clip
-            img_clip = resize_and_blur_background(img_clip, (video_width, video_height))
+                # Resize the clip
+                img_clip = resize_and_blur_background(img_clip, (video_width, video_height))
             
-            # Center the clip and add effects
-            img_clip = (img_clip
-                       .set_position(("center", "center"))
-                       .fx(mp.vfx.fadein, 0.5)
-                       .fx(mp.vfx.fadeout, 0.5))
+                # Center the clip and add effects
+                img_clip = (img_clip
+                           .set_position(("center", "center"))
+                           .fx(mp.vfx.fadein, 0.5)
+                           .fx(mp.vfx.fadeout, 0.5))
             
-            image_clips.append(img_clip)
+                image_clips.append(img_clip)
         
         # Concatenate intro and image sequence
         video = mp.concatenate_videoclips([intro_clip] + image_clips, method="compose")
@@ -175,24 +340,27 @@ def create_video(images, audio_path, srt_path, ministry, output_path):
         subtitles = pysrt.open(srt_path)
         subtitle_clips = []
         
-        for sub in subtitles:
-            start_seconds = time_to_seconds(sub.start.to_time())+ intro_clip.duration
-            end_seconds = time_to_seconds(sub.end.to_time())+ intro_clip.duration
-            duration = end_seconds - start_seconds
-            txt_clip = (mp.TextClip(
-                sub.text,
-                fontsize=85,
-                color='orange',
-                stroke_color='black',
-                stroke_width=3,
-                size=(int(video_width*0.8), None),
-                method='caption',
-                font='Hindi.ttf' if os.name == 'nt' else 'Arial'  # Handle different OS font names
-            ).set_position(("center", 0.8),relative=True)
-             .set_start(start_seconds)
-             .set_duration(duration))
+        with span("render.subtitle_clips", subtitles=len(subtitles)):
+            for sub in subtitles:
+                # Each caption runs ImageMagick
+                check_cancelled()
+                start_seconds = time_to_seconds(sub.start.to_time())+ intro_clip.duration
+                end_seconds = time_to_seconds(sub.end.to_time())+ intro_clip.duration
+                duration = end_seconds - start_seconds
+                txt_clip = (mp.TextClip(
+                    sub.text,
+                    fontsize=85,
+                    color='orange',
+                    stroke_color='black',
+                    stroke_width=3,
+                    size=(int(video_width*0.8), None),
+                    method='caption',
+                    font='Hindi.ttf' if os.name == 'nt' else 'Arial'  # Handle different OS font names
+                ).set_position(("center", 0.8),relative=True)
+                 .set_start(start_seconds)
+                 .set_duration(duration))
             
-            subtitle_clips.append(txt_clip)
+                subtitle_clips.append(txt_clip)
         
         # Merge subtitles with video
         video = mp.CompositeVideoClip([video] + subtitle_clips)
@@ -205,16 +373,32 @@ def create_video(images, audio_path, srt_path, ministry, output_path):
 
         ensure_directory_exists(os.path.dirname(output_path))
         
-        # Export the final video
-        video.write_videofile(
-            output_path,
-            codec="libx264",
-            fps=30,
-            audio_codec="mp3",
-            threads=4,
-            preset='medium'  # Balance between speed and quality
-        )
-        
+        fps = 30
+        with span("render.encode"):
+            encode_started = time.perf_counter()
+            video.write_videofile(
+                partial_path,
+                codec="libx264",
+                fps=fps,
+                audio_codec="mp3",
+                threads=4,
+                preset='medium',  # Balance between speed and quality
+                # Put the moov atom first so players can start before the download completes
+                ffmpeg_params=["-movflags", "+faststart"],
+                temp_audiofile=partial_audio_path,
+                # Raising from the logger closes ffmpeg's input, ending the encoder process
+                logger=cancellable_logger(),
+            )
+        metrics.render_fps.observe(video.duration * fps / (time.perf_counter() - encode_started))
+        os.replace(partial_path, output_path)
+
+    except BaseException:
+        # Failed or cancelled mid-encode
+        for path in (partial_path, partial_audio_path):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
     finally:
         # Clean up resources
         try:
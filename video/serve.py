@@ -0,0 +1,165 @@
+"""
+Serve rendered output files with byte ranges and cache validation.
+
+Starlette's StaticFiles (0.38) always answers with the whole file, which keeps
+mobile players from seeking or starting before the download finishes. Files
+here are answered with:
+
+- `Range` / `If-Range` support (single ranges, `206 Partial Content`)
+- a strong `ETag` derived from the file content, and `If-None-Match` → 304
+- `Cache-Control: immutable` for one year when the URL carries the matching
+  `?v=` version (see `versioned_url`), so a CDN can keep them; unversioned URLs
+  must be revalidated.
+"""
+import os
+import asyncio
+import hashlib
+import mimetypes
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+OUTPUT_DIR = os.path.join(os.getcwd(), "output")
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, no-cache"
+
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("video/mp2t", ".ts")
+
+# path -> (size, mtime, content hash), so files are hashed once per version
+_etags = {}
+
+
+def resolve_output_path(file_path: str) -> str:
+    """Map a URL path to a file inside OUTPUT_DIR, rejecting traversal and directories."""
+    root = os.path.realpath(OUTPUT_DIR)
+    path = os.path.realpath(os.path.join(root, file_path))
+    if os.path.commonpath([path, root]) != root or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return path
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()[:32]
+
+
+async def file_etag(path: str) -> str:
+    """Strong ETag of a file, hashed in a worker thread and memoized until the file changes."""
+    stat = os.stat(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+    cached = _etags.get(path)
+    if cached is None or cached[:2] != version:
+        cached = (*version, await asyncio.to_thread(_hash_file, path))
+        _etags[path] = cached
+    return f'"{cached[2]}"'
+
+
+async def versioned_url(path: str) -> str:
+    """
+    URL of an output file pinned to its current content, safe to cache forever.
+
+    Args:
+        path (str): Path relative to the working directory, e.g. 'output/<title>/hindi.mp4'.
+
+    Returns:
+        str: '/output/...?v=<etag>', or None if the file does not exist.
+    """
+    full_path = os.path.realpath(os.path.join(os.getcwd(), path))
+    if not os.path.isfile(full_path):
+        return None
+    etag = await file_etag(full_path)
+    relative = os.path.relpath(full_path, os.path.realpath(OUTPUT_DIR)).replace(os.sep, "/")
+    version = etag.strip('"')
+    return f"/output/{quote(relative)}?v={version}"
+
+
+def parse_range(header: str, size: int):
+    """
+    Parse a single `bytes=` range.
+
+    Returns:
+        tuple: (start, end) inclusive, None to send the whole file (absent,
+        malformed or multi-range header), or False if the range is unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: the last `end` bytes
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+async def _read_file(path: str, start: int, end: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def file_response(request: Request, file_path: str) -> Response:
+    """
+    Answer a GET or HEAD for an output file.
+
+    Args:
+        request (Request): Incoming request.
+        file_path (str): Path relative to OUTPUT_DIR.
+
+    Returns:
+        Response: 200, 206, 304 or 416 response.
+    """
+    path = resolve_output_path(file_path)
+    size = os.path.getsize(path)
+    etag = await file_etag(path)
+
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": IMMUTABLE_CACHE if f'"{request.query_params.get("v")}"' == etag else REVALIDATE_CACHE,
+    }
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = parse_range(request.headers.get("range"), size)
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:
+        # The client's partial copy is stale: send the whole new file
+        byte_range = None
+
+    if byte_range is False:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        (start, end), status = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD" or size == 0:
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(_read_file(path, start, end), status_code=status, headers=headers, media_type=media_type)
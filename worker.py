@@ -0,0 +1,233 @@
+"""
+Worker process of the queue mode (EXECUTION_MODE=queue, see jobs.py).
+
+Claims release and translation jobs from the shared MongoDB queue, renews
+their leases while they run and gives them back on shutdown. Run as many
+workers as the hosts can take, e.g. several on one machine against a local
+MongoDB:
+
+    python worker.py --concurrency 2 --metrics-port 9101
+    python worker.py --kinds translation --concurrency 3 --metrics-port 9102
+
+Every resource limit of scheduler.py still applies within a worker process.
+"""
+import argparse
+import asyncio
+import os
+import signal
+
+# User defined modules
+import metrics
+from database import job_queue
+from database.db import ensure_indexes, flush_writes, is_url_scraped
+from logger import log_info, log_warning, log_error, log_success, log_context
+from singleflight import PROCESS_ID
+from scheduler import new_priority, set_priority, slot
+from utils import tgt_langs
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+# Seconds between claims while the queue is empty
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+# Seconds between heartbeats, which also notice cancelled jobs
+WORKER_HEARTBEAT_INTERVAL = min(float(os.getenv("WORKER_HEARTBEAT_INTERVAL", "5")), job_queue.JOB_LEASE_TTL / 3)
+# Port serving the worker's Prometheus metrics on /metrics, 0 to disable; give each worker of a host its own
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+
+async def run_release_job(job):
+    """Run the English pipeline of a release, then queue a translation job per language."""
+    from scrap.refresh import refresh_press_release
+    from scrap.scrap import scrape_press_release
+
+    payload = job["payload"]
+    url = payload["url"]
+    async with slot("release"):
+        if payload.get("refresh"):
+            await refresh_press_release(url)
+        press_release = await scrape_press_release(url)
+
+    release_id = str(press_release["_id"])
+    for lang in payload.get("languages") or list(tgt_langs):
+        # Languages of an older release keep running before those of newer ones
+        await asyncio.to_thread(
+            job_queue.enqueue, "translation", f"translation:{release_id}:{lang}",
+            {"url": url, "release_id": release_id, "lang": lang},
+            priority=job["priority"], parent=job["_id"],
+        )
+    return {"release_id": release_id, "video": press_release["translations"]["english"]["video"]}
+
+
+async def run_translation_job(job):
+    """Translate, narrate and render one language of a scraped release."""
+    from translate.translate import translate
+
+    payload = job["payload"]
+    release = await asyncio.to_thread(is_url_scraped, payload["url"])
+    if release is None:
+        raise RuntimeError(f"Release not found: {payload['url']}")
+    english = release["translations"]["english"]
+    results = await translate(
+        _id=str(release["_id"]),
+        images=release["images"],
+        title=english["title"],
+        summary=english["summary"],
+        content=english["content"],
+        ministry=english["ministry"],
+        languages=[payload["lang"]],
+    )
+    result = results[0]
+    if not isinstance(result, dict) or result.get("status") != "completed":
+        raise RuntimeError(result.get("error") if isinstance(result, dict) else str(result))
+    return {"video": result.get("video")}
+
+
+JOB_HANDLERS = {
+    "release": run_release_job,
+    "translation": run_translation_job,
+}
+
+
+async def run_claimed(job):
+    """Run a claimed job, renewing its lease, and record the outcome."""
+    work = asyncio.create_task(JOB_HANDLERS[job["kind"]](job))
+    lease_lost = False
+
+    async def keep_lease():
+        nonlocal lease_lost
+        failures = 0
+        while True:
+            await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+            try:
+                renewed = await asyncio.to_thread(job_queue.heartbeat, job["_id"], PROCESS_ID)
+            except Exception as e:
+                failures += 1
+                if failures * WORKER_HEARTBEAT_INTERVAL < job_queue.JOB_LEASE_TTL:
+                    log_warning(f"Heartbeat of job {job['_id']} failed, retrying: {e}")
+                    continue
+                # The lease has expired by now, another worker may already run the job
+                log_error(f"Could not renew the lease of job {job['_id']} for {job_queue.JOB_LEASE_TTL}s, abandoning it: {e}")
+                lease_lost = True
+                work.cancel()
+                return
+            failures = 0
+            if not renewed:
+                # Cancelled, or another worker took over: stop instead of racing it
+                try:
+                    current = await asyncio.to_thread(job_queue.get_job, job["_id"])
+                except Exception:
+                    current = None
+                if current is not None and current["status"] == "cancelled":
+                    log_warning(f"Job {job['_id']} was cancelled, stopping it")
+                else:
+                    log_warning(f"Lost the lease of job {job['_id']}, abandoning it")
+                lease_lost = True
+                work.cancel()
+                return
+
+    keeper = asyncio.create_task(keep_lease())
+    try:
+        result = await work
+    except asyncio.CancelledError:
+        if lease_lost:
+            return
+        # Shutting down: another worker picks the job up right away
+        work.cancel()
+        await asyncio.to_thread(job_queue.release, job["_id"], PROCESS_ID)
+        log_info(f"Released job {job['_id']}")
+        raise
+    except Exception as e:
+        log_error(f"{job['kind'].capitalize()} job {job['_id']} failed: {e}")
+        await asyncio.to_thread(job_queue.fail, job["_id"], PROCESS_ID, str(e))
+    else:
+        if await asyncio.to_thread(job_queue.complete, job["_id"], PROCESS_ID, result):
+            log_success(f"{job['kind'].capitalize()} job {job['_id']} completed")
+            return
+        current = await asyncio.to_thread(job_queue.get_job, job["_id"])
+        if current is not None and current["status"] == "cancelled":
+            # Cancelled after its last heartbeat: also cancel the jobs it just queued
+            await asyncio.to_thread(job_queue.cancel, job["_id"])
+        else:
+            log_warning(f"{job['kind'].capitalize()} job {job['_id']} finished after losing its lease "
+                        f"(now {current['status'] if current else 'deleted'}), its result is dropped")
+    finally:
+        keeper.cancel()
+
+
+async def run_job(job):
+    # Each job gets its own task, so the priority and log context stay with it
+    set_priority(new_priority(job["priority"]))
+    with log_context(job_id=job.get("parent") or job["_id"], url=job["payload"]["url"],
+                     language=job["payload"].get("lang")):
+        await run_claimed(job)
+
+
+async def serve(kinds, concurrency: int, metrics_port: int = WORKER_METRICS_PORT):
+    """Claim and run jobs until SIGINT/SIGTERM, then give the running ones back."""
+    await asyncio.to_thread(ensure_indexes)
+    await asyncio.to_thread(job_queue.ensure_job_indexes)
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await metrics.start_server(metrics_port)
+        log_info(f"Serving metrics on port {metrics_port} at /metrics")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stopping.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C raises KeyboardInterrupt instead
+            pass
+
+    log_info(f"Worker {PROCESS_ID} running {', '.join(kinds)} jobs, {concurrency} at a time")
+    running = set()
+    while not stopping.is_set():
+        job = None
+        if len(running) < concurrency:
+            job = await asyncio.to_thread(job_queue.claim, PROCESS_ID, kinds)
+        if job is not None:
+            log_info(f"Claimed {job['kind']} job {job['_id']}")
+            task = asyncio.create_task(run_job(job))
+            running.add(task)
+            task.add_done_callback(running.discard)
+            continue
+
+        # Wake up on shutdown, when a job finishes or to poll the queue again
+        waiters = [asyncio.create_task(stopping.wait()), *running]
+        await asyncio.wait(waiters, timeout=WORKER_POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+        waiters[0].cancel()
+
+    log_info(f"Shutting down, releasing {len(running)} jobs")
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
+    if metrics_server is not None:
+        metrics_server.close()
+    await shutdown()
+
+
+async def shutdown():
+    from http_client import close_client
+    from image.capture_iframe import close_browser
+
+    await flush_writes()
+    await close_client()
+    await close_browser()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kinds", default=",".join(JOB_HANDLERS), help="Comma-separated job kinds to run")
+    parser.add_argument("--concurrency", type=int, default=WORKER_CONCURRENCY, help="Jobs run at a time")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT, help="Port serving /metrics, 0 to disable")
+    args = parser.parse_args()
+
+    kinds = [kind.strip() for kind in args.kinds.split(",") if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in JOB_HANDLERS]
+    if unknown:
+        parser.error(f"unknown job kinds: {unknown}")
+    asyncio.run(serve(kinds, args.concurrency, args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()